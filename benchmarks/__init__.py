@@ -0,0 +1,6 @@
+"""
+Benchmarks da geração de documentos CIUS-PT.
+
+Correm sem SQL Server nem Saphety, sobre faturas sintéticas geradas em memória.
+Ver `benchmarks.xml_generation` para a utilização.
+"""
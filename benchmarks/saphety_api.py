@@ -0,0 +1,260 @@
+"""
+Benchmark do envio e da verificação das faturas na API da Saphety, contra um servidor local.
+
+Arranca o servidor de teste (benchmarks.saphety_stub) e mede, para cada número de envios
+em simultâneo, o débito do envio (SaphetyApiService, incluindo o acompanhamento dos pedidos
+assíncronos) e da verificação (SaphetyApiIntegrationService), sem rede nem base de dados.
+Cada cenário corre num processo próprio, com a configuração (timeouts, repetições, limite
+de pedidos, consulta dos pedidos e circuit breaker) passada por variáveis de ambiente.
+
+Exemplo:
+    python -m benchmarks.saphety_api --invoices 200 --send-workers 1 4 8 --latency-ms 80 \
+        --latency-dist lognormal --queued-seconds 1 --running-seconds 2 --error-rate 0.02 --json resultados.json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any
+
+from benchmarks.saphety_stub import LATENCY_DISTRIBUTIONS, LatencyProfile, SaphetyStubServer
+
+if TYPE_CHECKING:
+    from core.api.transport import SaphetyTransport
+    from core.services.saphety_integration_service import SaphetyApiIntegrationService
+    from core.services.saphety_service import SaphetyApiService
+
+
+def _outcome(response: dict[str, Any] | None) -> str:
+    """Classifica a resposta final do envio de uma fatura."""
+    if response is None:
+        return 'not_sent'
+
+    data = response.get('Data')
+
+    if not response.get('IsValid'):
+        return 'send_error'
+    if not isinstance(data, dict):
+        return 'unfinished'
+
+    return {'Finished': 'finished', 'Error': 'document_error'}.get(data.get('AsyncStatus'), 'unfinished')
+
+
+def _synthetic_invoices(directory: Path, count: int, xml_kb: int) -> list[SimpleNamespace]:
+    """Cria as faturas a enviar, todas com o mesmo ficheiro XML de `xml_kb` KB."""
+    from core.utils.local_menus import InvoiceType  # noqa: PLC0415
+
+    xml_file = directory / 'invoice.xml'
+    xml_file.write_bytes(b'<Invoice>' + b'0' * xml_kb * 1024 + b'</Invoice>')
+
+    return [
+        SimpleNamespace(
+            invoiceNumber=f'FTBNC{index:08d}',
+            filename=str(xml_file),
+            category=InvoiceType.INVOICE,
+            sender='PT500000000',
+        )
+        for index in range(count)
+    ]
+
+
+def _services(
+    transport: 'SaphetyTransport', scenario: dict[str, Any]
+) -> tuple['SaphetyApiService', 'SaphetyApiIntegrationService']:
+    """Cria os serviços de envio e de verificação, com o mesmo transporte e a mesma sessão (token)."""
+    from core.auth.token_provider import TokenProvider  # noqa: PLC0415
+    from core.services.saphety_integration_service import SaphetyApiIntegrationService  # noqa: PLC0415
+    from core.services.saphety_service import SaphetyApiService  # noqa: PLC0415
+
+    tokens = TokenProvider(transport, username='benchmark', password='benchmark', cache_file=None)
+    sender = SaphetyApiService(transport=transport, workers=scenario['send_workers'], token_provider=tokens)
+    checker = SaphetyApiIntegrationService(
+        transport=transport, token_provider=tokens, workers=scenario['check_workers']
+    )
+
+    return sender, checker
+
+
+def _measure_send(
+    sender: 'SaphetyApiService', invoices: list[SimpleNamespace]
+) -> tuple[dict[str, Any], list[SimpleNamespace]]:
+    """
+    Envia as faturas (incluindo o acompanhamento dos pedidos assíncronos) e mede o débito.
+
+    Returns:
+        As métricas do envio e as faturas enviadas com sucesso, prontas para a verificação.
+    """
+    started = time.perf_counter()
+    send_results = sender._process_invoices(pending_invoices=invoices)
+    send_seconds = time.perf_counter() - started
+
+    responses = {result['invoice_number']: result['response'] for result in send_results}
+    outcomes = dict.fromkeys(('finished', 'document_error', 'unfinished', 'send_error', 'not_sent'), 0)
+
+    for invoice in invoices:
+        outcomes[_outcome(responses.get(invoice.invoiceNumber))] += 1
+
+    sent_invoices = [
+        SimpleNamespace(invoiceNumber=invoice_number, financialId=response['Data']['OutboundFinancialDocumentId'])
+        for invoice_number, response in responses.items()
+        if _outcome(response) == 'finished'
+    ]
+
+    metrics = {
+        'send_seconds': round(send_seconds, 3),
+        'sent_per_second': round(len(invoices) / send_seconds, 2) if send_seconds else None,
+        'outcomes': outcomes,
+    }
+    return metrics, sent_invoices
+
+
+def _measure_check(checker: 'SaphetyApiIntegrationService', sent_invoices: list[SimpleNamespace]) -> dict[str, Any]:
+    """Verifica o estado das faturas enviadas e mede o débito."""
+    started = time.perf_counter()
+    check_results = list(checker._process_invoices(sent_invoices=sent_invoices))
+    check_seconds = time.perf_counter() - started
+
+    return {
+        'check_seconds': round(check_seconds, 3),
+        'checked_per_second': round(len(sent_invoices) / check_seconds, 2) if check_seconds else None,
+        'checked': sum(1 for result in check_results if result['response'].get('IsValid')),
+    }
+
+
+def run_scenario(scenario: dict[str, Any]) -> dict[str, Any]:
+    """Corre um cenário (envio e verificação) e retorna as métricas. Executado num processo próprio."""
+    logging.basicConfig(level=scenario['log_level'])
+
+    # A configuração é lida das variáveis de ambiente quando os módulos são importados
+    os.environ.update({name: str(value) for name, value in scenario['env'].items()})
+
+    # Importado aqui (tal como os serviços) para que a configuração do cenário seja aplicada
+    from core.api.transport import SaphetyTransport  # noqa: PLC0415
+
+    stub = SaphetyStubServer(
+        latency=LatencyProfile(scenario['latency_dist'], scenario['latency_ms']),
+        submit_latency=LatencyProfile(scenario['latency_dist'], scenario['submit_latency_ms']),
+        queued_seconds=scenario['queued_seconds'],
+        running_seconds=scenario['running_seconds'],
+        document_error_rate=scenario['document_error_rate'],
+        error_rate=scenario['error_rate'],
+        throttle_rps=scenario['throttle_rps'],
+    )
+
+    with stub, tempfile.TemporaryDirectory(prefix='saphety_bench_') as tmp:
+        invoices = _synthetic_invoices(Path(tmp), scenario['invoices'], scenario['xml_kb'])
+
+        transport = SaphetyTransport(stub.url)
+        sender, checker = _services(transport, scenario)
+
+        send_metrics, sent_invoices = _measure_send(sender, invoices)
+        check_metrics = _measure_check(checker, sent_invoices)
+
+        breaker = transport.circuit_breaker.metrics()
+        transport.close()
+
+    return {
+        'send_workers': scenario['send_workers'],
+        'check_workers': scenario['check_workers'],
+        'invoices': scenario['invoices'],
+        **send_metrics,
+        **check_metrics,
+        'circuit_breaker': breaker,
+        'server': dict(sorted(stub.stats.items())),
+    }
+
+
+def _print_results(results: list[dict[str, Any]]) -> None:
+    """Mostra os resultados em forma de tabela."""
+    print(f'{"envios":>6} {"envio s":>9} {"env/s":>8} {"verif. s":>9} {"verif/s":>8}  resultados / servidor')
+
+    for result in results:
+        outcomes = ', '.join(f'{name}={count}' for name, count in result['outcomes'].items() if count)
+        server = ', '.join(f'{name}={count}' for name, count in result['server'].items())
+        print(
+            f'{result["send_workers"]:>6} {result["send_seconds"]:>9} {result["sent_per_second"]:>8} '
+            f'{result["check_seconds"]:>9} {result["checked_per_second"]!s:>8}  {outcomes}'
+        )
+        print(f'{"":>44}  {server}; circuito {result["circuit_breaker"]["state"]}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark do envio e verificação na API da Saphety (servidor local).')
+    parser.add_argument('--invoices', type=int, default=100, help='Faturas enviadas por cenário.')
+    parser.add_argument('--send-workers', type=int, nargs='+', default=[1, 4], help='Envios em simultâneo a medir.')
+    parser.add_argument('--check-workers', type=int, default=4, help='Verificações em simultâneo.')
+    parser.add_argument('--xml-kb', type=int, default=20, help='Tamanho do XML enviado.')
+    parser.add_argument('--latency-dist', choices=LATENCY_DISTRIBUTIONS, default='lognormal')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Latência média das consultas.')
+    parser.add_argument('--submit-latency-ms', type=float, help='Latência média do envio (por omissão, a anterior).')
+    parser.add_argument('--queued-seconds', type=float, default=0.5, help='Tempo de um pedido em fila.')
+    parser.add_argument('--running-seconds', type=float, default=1.0, help='Tempo de um pedido em execução.')
+    parser.add_argument('--document-error-rate', type=float, default=0.0, help='Proporção de documentos com erro.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Proporção de respostas 500.')
+    parser.add_argument('--throttle-rps', type=float, default=0.0, help='Pedidos/s aceites pelo servidor (429).')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='HTTP_RATE_LIMIT_PER_SECOND do cliente.')
+    parser.add_argument('--get-retries', type=int, default=3, help='HTTP_GET_RETRIES do cliente.')
+    parser.add_argument('--retry-backoff', type=float, default=0.5, help='HTTP_RETRY_BACKOFF do cliente.')
+    parser.add_argument('--timeout', type=float, default=15.0, help='HTTP_TIMEOUT_SECONDS do cliente.')
+    parser.add_argument('--poll-initial-delay', type=float, default=0.5, help='SAPHETY_POLL_INITIAL_DELAY.')
+    parser.add_argument('--poll-max-delay', type=float, default=5.0, help='SAPHETY_POLL_MAX_DELAY.')
+    parser.add_argument('--poll-deadline', type=float, default=60.0, help='SAPHETY_POLL_DEADLINE_SECONDS.')
+    parser.add_argument('--no-circuit-breaker', action='store_true', help='Desativa o circuit breaker do cliente.')
+    parser.add_argument('--log-level', default='WARNING', help='Nível de log durante a medição.')
+    parser.add_argument('--json', type=Path, help='Grava os resultados neste ficheiro JSON.')
+    args = parser.parse_args()
+
+    env = {
+        'HTTP_TIMEOUT_SECONDS': args.timeout,
+        'HTTP_GET_RETRIES': args.get_retries,
+        'HTTP_RETRY_BACKOFF': args.retry_backoff,
+        'HTTP_RATE_LIMIT_PER_SECOND': args.rate_limit,
+        'HTTP_CIRCUIT_BREAKER_ENABLED': not args.no_circuit_breaker,
+        'SAPHETY_POLL_INITIAL_DELAY': args.poll_initial_delay,
+        'SAPHETY_POLL_MAX_DELAY': args.poll_max_delay,
+        'SAPHETY_POLL_DEADLINE_SECONDS': args.poll_deadline,
+        'TOKEN_CACHE_FILE': '',
+    }
+
+    scenarios = [
+        {
+            'send_workers': max(workers, 1),
+            'check_workers': max(args.check_workers, 1),
+            'invoices': max(args.invoices, 1),
+            'xml_kb': max(args.xml_kb, 0),
+            'latency_dist': args.latency_dist,
+            'latency_ms': args.latency_ms,
+            'submit_latency_ms': args.submit_latency_ms if args.submit_latency_ms is not None else args.latency_ms,
+            'queued_seconds': args.queued_seconds,
+            'running_seconds': args.running_seconds,
+            'document_error_rate': args.document_error_rate,
+            'error_rate': args.error_rate,
+            'throttle_rps': args.throttle_rps,
+            'env': env,
+            'log_level': args.log_level.upper(),
+        }
+        for workers in args.send_workers
+    ]
+
+    results = []
+
+    for scenario in scenarios:
+        # Um processo novo por cenário ('spawn'), para que a configuração seja lida do zero
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results.append(executor.submit(run_scenario, scenario).result())
+
+    _print_results(results)
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
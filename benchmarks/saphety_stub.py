@@ -0,0 +1,334 @@
+"""
+Servidor local que simula os endpoints da API da Saphety usados pelo projeto.
+
+Responde em processo (numa thread) a:
+    - POST /api/Account/getToken
+    - POST /api/CountryFormatAsyncRequest/processDocument/{emissor}/{tipo}/PT
+    - GET  /api/CountryFormatAsyncRequest/{id}
+    - GET  /api/OutboundFinancialDocument/{id}
+
+Os pedidos assíncronos passam de Queued a Running e a Finished (ou Error) com o tempo,
+e cada resposta tem uma latência tirada da distribuição configurada. É possível injetar
+erros 500 e limitar o número de pedidos por segundo (respostas 429 com Retry-After).
+"""
+
+import base64
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+_SUBMIT_PATH = re.compile(r'^/api/CountryFormatAsyncRequest/processDocument/[^/]+/(Invoice|Credit_Note)/PT$')
+_REQUEST_PATH = re.compile(r'^/api/CountryFormatAsyncRequest/(?P<id>[^/]+)$')
+_DOCUMENT_PATH = re.compile(r'^/api/OutboundFinancialDocument/(?P<id>[^/]+)$')
+
+
+class LatencyProfile:
+    """
+    Distribuição da latência das respostas.
+
+    Args:
+        distribution: 'fixed', 'uniform' (0 a 2x a média), 'exponential' ou 'lognormal'.
+        mean_ms: A latência média, em milissegundos.
+        sigma: O desvio padrão do logaritmo da latência (só para 'lognormal').
+        seed: Semente do gerador de números aleatórios.
+    """
+
+    def __init__(self, distribution: str = 'fixed', mean_ms: float = 0.0, sigma: float = 0.5, seed: int = 42):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Distribuição de latência '{distribution}' desconhecida. Use: {LATENCY_DISTRIBUTIONS}.")
+
+        self.distribution = distribution
+        self.mean = max(mean_ms, 0.0) / 1000
+        self.sigma = sigma
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """Retorna uma latência, em segundos."""
+        if self.mean <= 0:
+            return 0.0
+
+        with self._lock:
+            if self.distribution == 'uniform':
+                return self.random.uniform(0, 2 * self.mean)
+            if self.distribution == 'exponential':
+                return self.random.expovariate(1 / self.mean)
+            if self.distribution == 'lognormal':
+                # Parâmetros escolhidos para que a média da distribuição seja `mean`
+                return self.random.lognormvariate(math.log(self.mean) - self.sigma**2 / 2, self.sigma)
+
+        return self.mean
+
+
+class _AsyncRequest:
+    __slots__ = ('created_at', 'document_id', 'failed', 'request_id')
+
+    def __init__(self, request_id: str, document_id: str, created_at: float, failed: bool):
+        self.request_id = request_id
+        self.document_id = document_id
+        self.created_at = created_at
+        self.failed = failed
+
+
+class SaphetyStubServer:
+    """
+    Servidor HTTP local que simula a API da Saphety, para medir o envio e a verificação sem rede.
+
+    Args:
+        latency: A latência das consultas (token e estados).
+        submit_latency: A latência do envio dos documentos. Se None, usa `latency`.
+        queued_seconds: O tempo durante o qual um pedido assíncrono fica em fila (Queued).
+        running_seconds: O tempo durante o qual um pedido fica em execução (Running), depois da fila.
+        document_error_rate: A proporção de pedidos que terminam com erro (AsyncStatus 'Error').
+        error_rate: A proporção de pedidos (exceto o login) a que o servidor responde 500.
+        throttle_rps: O número máximo de pedidos por segundo; acima dele responde 429. 0 desativa o limite.
+        integration_seconds: O tempo, depois de terminado o pedido, até o documento passar a recebido.
+        token_ttl: A validade dos tokens emitidos, em segundos.
+        seed: Semente do gerador de números aleatórios.
+    """
+
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        latency: LatencyProfile | None = None,
+        submit_latency: LatencyProfile | None = None,
+        queued_seconds: float = 0.5,
+        running_seconds: float = 1.0,
+        document_error_rate: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rps: float = 0.0,
+        integration_seconds: float = 0.0,
+        token_ttl: float = 3600.0,
+        seed: int = 42,
+    ):
+        self.latency = latency or LatencyProfile()
+        self.submit_latency = submit_latency or self.latency
+        self.queued_seconds = queued_seconds
+        self.running_seconds = running_seconds
+        self.document_error_rate = document_error_rate
+        self.error_rate = error_rate
+        self.throttle_rps = throttle_rps
+        self.integration_seconds = integration_seconds
+        self.token_ttl = token_ttl
+
+        self.random = random.Random(seed)
+        self.stats: Counter[str] = Counter()
+
+        self._requests: dict[str, _AsyncRequest] = {}
+        self._documents: dict[str, _AsyncRequest] = {}
+        self._tokens: set[str] = set()
+        self._recent: deque[float] = deque()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """O endereço base do servidor (a usar como SERVER_BASE_ADDRESS)."""
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def start(self) -> 'SaphetyStubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='saphety-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'SaphetyStubServer':
+        return self.start()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub._dispatch(self, 'POST')
+
+            def do_GET(self) -> None:
+                stub._dispatch(self, 'GET')
+
+        return Handler
+
+    def _dispatch(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        """Encaminha o pedido para o endpoint, aplicando a latência, o limite de pedidos e os erros injetados."""
+        path = handler.path.split('?', 1)[0]
+
+        if method == 'POST' and path == '/api/Account/getToken':
+            endpoint = 'getToken'
+        elif method == 'POST' and _SUBMIT_PATH.match(path):
+            endpoint = 'processDocument'
+        elif method == 'GET' and _REQUEST_PATH.match(path):
+            endpoint = 'asyncRequest'
+        elif method == 'GET' and _DOCUMENT_PATH.match(path):
+            endpoint = 'financialDocument'
+        else:
+            self._reply(handler, 'unknown', HTTPStatus.NOT_FOUND, {})
+            return
+
+        time.sleep((self.submit_latency if endpoint == 'processDocument' else self.latency).sample())
+
+        if self._throttled():
+            self._reply(handler, endpoint, HTTPStatus.TOO_MANY_REQUESTS, {}, headers={'Retry-After': '1'})
+            return
+
+        if endpoint == 'getToken':
+            self._reply(handler, endpoint, HTTPStatus.OK, self._issue_token())
+            return
+
+        if not self._authorized(handler):
+            self._reply(handler, endpoint, HTTPStatus.UNAUTHORIZED, {})
+            return
+
+        if self.error_rate and self._chance(self.error_rate):
+            self._reply(handler, endpoint, HTTPStatus.INTERNAL_SERVER_ERROR, {})
+            return
+
+        if endpoint == 'processDocument':
+            status, body = HTTPStatus.OK, self._submit()
+        elif endpoint == 'asyncRequest':
+            status, body = self._request_status(_REQUEST_PATH.match(path)['id'])
+        else:
+            status, body = self._document_status(_DOCUMENT_PATH.match(path)['id'])
+
+        self._reply(handler, endpoint, status, body)
+
+    def _reply(
+        self,
+        handler: BaseHTTPRequestHandler,
+        endpoint: str,
+        status: HTTPStatus,
+        body: dict[str, Any],
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        with self._lock:
+            self.stats[f'{endpoint} {status.value}'] += 1
+
+        content = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(content)))
+
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+
+        handler.end_headers()
+        handler.wfile.write(content)
+
+    def _throttled(self) -> bool:
+        """Indica se o pedido excede o limite de pedidos por segundo (janela deslizante de 1 segundo)."""
+        if self.throttle_rps <= 0:
+            return False
+
+        now = time.monotonic()
+
+        with self._lock:
+            while self._recent and now - self._recent[0] >= 1.0:
+                self._recent.popleft()
+
+            if len(self._recent) >= self.throttle_rps:
+                return True
+
+            self._recent.append(now)
+            return False
+
+    def _chance(self, rate: float) -> bool:
+        with self._lock:
+            return self.random.random() < rate
+
+    def _issue_token(self) -> dict[str, Any]:
+        """Emite um token com o formato de um JWT (com `exp`), como o da API."""
+        payload = {'sub': 'benchmark', 'exp': int(time.time() + self.token_ttl), 'n': next(self._ids)}
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+        token = f'stub.{encoded}.sig'
+
+        with self._lock:
+            self._tokens.add(token)
+
+        return {'CorrelationId': '', 'IsValid': True, 'Errors': [], 'Data': token}
+
+    def _authorized(self, handler: BaseHTTPRequestHandler) -> bool:
+        scheme, _, token = handler.headers.get('Authorization', '').partition(' ')
+
+        with self._lock:
+            return scheme.lower() == 'bearer' and token in self._tokens
+
+    def _submit(self) -> dict[str, Any]:
+        """Regista um novo pedido assíncrono e retorna o seu ID."""
+        number = next(self._ids)
+        request = _AsyncRequest(
+            request_id=f'REQ-{number:08d}',
+            document_id=f'DOC-{number:08d}',
+            created_at=time.monotonic(),
+            failed=bool(self.document_error_rate) and self._chance(self.document_error_rate),
+        )
+
+        with self._lock:
+            self._requests[request.request_id] = request
+            self._documents[request.document_id] = request
+
+        return {'CorrelationId': request.request_id, 'IsValid': True, 'Errors': [], 'Data': request.request_id}
+
+    def _request_status(self, request_id: str) -> tuple[HTTPStatus, dict[str, Any]]:
+        with self._lock:
+            request = self._requests.get(request_id)
+
+        if request is None:
+            return HTTPStatus.NOT_FOUND, {}
+
+        elapsed = time.monotonic() - request.created_at
+        data: dict[str, Any] = {'Id': request.request_id}
+
+        if elapsed < self.queued_seconds:
+            data['AsyncStatus'] = 'Queued'
+        elif elapsed < self.queued_seconds + self.running_seconds:
+            data['AsyncStatus'] = 'Running'
+        elif request.failed:
+            data['AsyncStatus'] = 'Error'
+            data['Errors'] = ['Documento rejeitado pelo servidor de teste.']
+        else:
+            data['AsyncStatus'] = 'Finished'
+            data['OutboundFinancialDocumentId'] = request.document_id
+
+        return HTTPStatus.OK, {'CorrelationId': request_id, 'IsValid': True, 'Errors': [], 'Data': data}
+
+    def _document_status(self, document_id: str) -> tuple[HTTPStatus, dict[str, Any]]:
+        with self._lock:
+            request = self._documents.get(document_id)
+
+        finished_at = None if request is None else request.created_at + self.queued_seconds + self.running_seconds
+
+        if request is None or request.failed or time.monotonic() < finished_at:
+            return HTTPStatus.NOT_FOUND, {}
+
+        received = time.monotonic() >= finished_at + self.integration_seconds
+        data = {
+            'Id': document_id,
+            'IntegrationStatus': 'Received' if received else 'Sent',
+            'NotificationStatus': 'Delivered' if received else 'Sent',
+            'Errors': [],
+        }
+
+        return HTTPStatus.OK, {'CorrelationId': document_id, 'IsValid': True, 'Errors': [], 'Data': data}
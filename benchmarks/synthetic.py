@@ -0,0 +1,168 @@
+"""
+Gerador de faturas X3 sintéticas para os benchmarks.
+
+Cria objetos ORM transitórios (não associados a nenhuma sessão) com os atributos
+lidos pela construção do XML CIUS-PT e pelos mappers dos clientes.
+"""
+
+import datetime
+import os
+import random
+from decimal import Decimal
+from pathlib import Path
+
+from core.models.business_partner import BusinessPartner
+from core.models.customer import Customer
+from core.models.sales_invoice import CustomerInvoiceHeader, SalesInvoice, SalesInvoiceDetail
+from core.types.types import SupplierParty, TaxSubtotal
+from core.utils.generics import Generics
+from core.utils.local_menus import InvoiceOrigin, InvoiceType, NoYes, TaxLevelCode
+
+SyntheticInvoice = tuple[SalesInvoice, list[SalesInvoiceDetail], list[TaxSubtotal]]
+
+
+class SyntheticInvoiceGenerator:
+    """
+    Gera faturas (SINVOICEV/SINVOICE), linhas (SINVOICED) e o resumo de impostos (SVCRVAT) sintéticos.
+
+    Os valores são determinísticos para uma mesma semente, para que as execuções
+    dos benchmarks sejam comparáveis.
+    """
+
+    COMPANY = 'BENCH'
+    SITE = 'BNC01'
+    CUSTOMER = 'C000001'
+
+    def __init__(self, lines: int, vat_rates: int, credit_note_ratio: float = 0.2, seed: int = 42):
+        """
+        Args:
+            lines: Número de linhas por fatura.
+            vat_rates: Número de taxas de IVA diferentes por fatura (1 a 4).
+            credit_note_ratio: Proporção de notas de crédito entre os documentos gerados.
+            seed: Semente do gerador de números aleatórios.
+        """
+        self.lines = max(lines, 1)
+        self.rates = [Decimal(member.value) for member in TaxLevelCode][: max(min(vat_rates, len(TaxLevelCode)), 1)]
+        self.credit_note_ratio = credit_note_ratio
+        self.random = random.Random(seed)
+
+    @staticmethod
+    def supplier() -> SupplierParty:
+        """Retorna os dados do fornecedor usados em todos os documentos (sem consultar a base de dados)."""
+        return {
+            'company': SyntheticInvoiceGenerator.COMPANY,
+            'name': 'Empresa de Benchmark, Lda.',
+            'street': 'Rua do Benchmark 1',
+            'city': 'Lisboa',
+            'postal_zone': '1000-001',
+            'country': 'PT',
+            'vat_number': 'PT500000000',
+        }
+
+    @staticmethod
+    def write_attachment(folder: Path, invoice: SalesInvoice, size_kb: int) -> Path:
+        """Cria o PDF (conteúdo aleatório) de uma fatura com o tamanho indicado."""
+        filename = ''.join(c for c in invoice.invoiceNumber if c.isalnum())
+        pdf_path = folder / f'{invoice.billToCustomer}_{filename}.pdf'
+
+        if not pdf_path.is_file() or pdf_path.stat().st_size != size_kb * 1024:
+            pdf_path.write_bytes(os.urandom(size_kb * 1024))
+
+        return pdf_path
+
+    def generate(self, index: int) -> SyntheticInvoice:
+        """Gera o documento número `index`, com as suas linhas e subtotais de impostos."""
+        is_credit_note = self.random.random() < self.credit_note_ratio
+        invoice_number = f'{"NC" if is_credit_note else "FT"}BNC{index:08d}'
+        invoice_date = datetime.datetime(2025, 1, 1) + datetime.timedelta(days=index % 365)
+
+        details = [self._detail(invoice_number, line) for line in range(1, self.lines + 1)]
+        taxes = self._taxes(invoice_date, details)
+
+        total_excluding_tax = sum((detail.lineAmountExcludingTax for detail in details), Decimal('0'))
+        total_tax = sum((tax['tax_amount'] for tax in taxes), Decimal('0'))
+
+        invoice = SalesInvoice(
+            invoiceNumber=invoice_number,
+            company=self.COMPANY,
+            salesSite=self.SITE,
+            category=InvoiceType.CREDIT_NOTE if is_credit_note else InvoiceType.INVOICE,
+            invoiceDate=invoice_date,
+            currency='EUR',
+            billToCustomer=self.CUSTOMER,
+            billToCustomerEuropeanUnionVatNumber='PT999999990',
+            sourceDocumentCategory=InvoiceOrigin.ORDER,
+            sourceDocumentNumber=f'FTBNC{max(index - 1, 0):08d}' if is_credit_note else f'ENC{index:08d}',
+            sourceDocumentDate=invoice_date,
+            shipToCustomerCity='Porto',
+            shipToCustomerPostalCode='4000-001',
+            shipToCustomerCountry='PT',
+            customerReference=f'REF-{index}',
+            updateChanges=1,
+            updateDatetime=invoice_date,
+        )
+        invoice.addressLine = ['Avenida dos Clientes 100', '2.º Esquerdo', '']
+
+        header = CustomerInvoiceHeader(
+            invoiceNumber=invoice_number,
+            businessPartner=self.CUSTOMER,
+            currency='EUR',
+            paymentTerm='30D',
+            dueDateCalculationStartDate=invoice_date + datetime.timedelta(days=30),
+            billToCustomerName1='Cliente de Benchmark',
+            billToCustomerName2='Sociedade Anónima',
+            billToCustomerCity='Porto',
+            billToCustomerPostalCode='4000-001',
+            billToCustomerCountry='PT',
+            totalAmountExcludingTax=total_excluding_tax,
+            totalAmountIncludingTax=total_excluding_tax + total_tax,
+            updateChanges=1,
+            updateDatetime=invoice_date,
+        )
+        header.billToCustomerAddresses = ['Avenida dos Clientes 100', '2.º Esquerdo', '']
+
+        customer = Customer(customerCode=self.CUSTOMER, generatePDF=NoYes.YES)
+        customer.business_partner = BusinessPartner(code=self.CUSTOMER, europeanUnionVatNumber='PT999999990')
+
+        invoice.invoice_header = header
+        invoice.customer = customer
+
+        return invoice, details, taxes
+
+    def _detail(self, invoice_number: str, line: int) -> SalesInvoiceDetail:
+        """Gera uma linha da fatura."""
+        quantity = Decimal(self.random.randint(1, 50))
+        price = Decimal(self.random.randint(100, 100_000)) / Decimal(100)
+
+        return SalesInvoiceDetail(
+            invoiceNumber=invoice_number,
+            lineNumber=line * 1000,
+            quantityInSalesUnit=quantity,
+            netPrice=price,
+            lineAmountExcludingTax=quantity * price,
+            taxRates=self.rates[line % len(self.rates)],
+            itemDescription=f'Artigo de benchmark {line}',
+            productDescriptionUserLanguage=f'Artigo de benchmark {line}',
+            updateChanges=1,
+        )
+
+    @staticmethod
+    def _taxes(invoice_date: datetime.datetime, details: list[SalesInvoiceDetail]) -> list[TaxSubtotal]:
+        """Gera os subtotais de impostos (um por taxa), como lidos já agregados da base de dados."""
+        bases: dict[Decimal, Decimal] = {}
+
+        for detail in details:
+            bases[detail.taxRates] = bases.get(detail.taxRates, Decimal('0')) + detail.lineAmountExcludingTax
+
+        return [
+            {
+                'category': Generics.get_enum_name(TaxLevelCode, int(rate)),
+                'rate': rate,
+                'taxable_amount': basis,
+                'tax_amount': (basis * rate / Decimal(100)).quantize(Decimal('0.01')),
+                'rows': 1,
+                'update_changes': 1,
+                'update_datetime': invoice_date,
+            }
+            for rate, basis in bases.items()
+        ]
@@ -0,0 +1,268 @@
+"""
+Benchmark da geração dos documentos CIUS-PT, sem SQL Server nem Saphety.
+
+Gera faturas sintéticas e mede, para cada mapper e modo de escrita, o número de
+documentos por segundo, o tempo de cada etapa e o pico de memória (RSS) do processo.
+Cada cenário corre num processo próprio, para que o pico de memória seja o do cenário.
+
+Etapas medidas:
+    - tree:   `build` (_build_cius_pt_xml) e `save` (serialização e gravação pelo mapper).
+    - stream: `write` (escrita incremental, _write_cius_pt_xml).
+
+Exemplo:
+    python -m benchmarks.xml_generation --invoices 200 --lines 50 --vat-rates 3 --attachment-kb 512 \
+        --mappers default mop --modes tree stream --json resultados.json
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from benchmarks.synthetic import SyntheticInvoiceGenerator
+from core.mappers.base_mapper import BaseMapper
+from core.models.sales_invoice import SalesInvoice
+from core.types.types import InvoiceXmlData, SupplierParty
+from core.utils.xml_handler import XMLHandler
+
+if TYPE_CHECKING:
+    from core.services.invoice_processor import InvoiceProcessorService
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _load_mapper_class(profile: str) -> type[BaseMapper]:
+    """Carrega a classe do mapper de um perfil de cliente (ex: 'default' -> customer_mappers.default.mapper)."""
+    module = importlib.import_module(f'customer_mappers.{profile}.mapper')
+    mapper_class = getattr(module, f'{profile.capitalize()}Mapper')
+
+    if not issubclass(mapper_class, BaseMapper):
+        raise TypeError(f"A classe '{mapper_class.__name__}' não herda de BaseMapper.")
+
+    return mapper_class
+
+
+def _benchmark_mapper(mapper_class: type[BaseMapper], output_dir: Path, attachment_kb: int) -> BaseMapper:
+    """
+    Cria o mapper do cliente com as pastas de saída e dos PDF apontadas para pastas temporárias.
+
+    Só são substituídos os métodos que dependem da configuração da instalação (pastas e
+    parâmetros lidos da base de dados); a construção do XML é a do mapper original.
+    """
+
+    class BenchmarkMapper(mapper_class):
+        def get_invoice_xml_path(self, context: InvoiceXmlData) -> Path | None:  # noqa: PLR6301
+            return output_dir / (''.join(c for c in context['invoice_number'] if c.isalnum()) + '.xml')
+
+        def save_invoice_xml(self, xml_tree, context: InvoiceXmlData) -> Path | None:
+            xml_file = self.get_invoice_xml_path(context)
+            return XMLHandler.save_xml_to_file(xml_tree, file_path=xml_file.parent, filename=xml_file.name)
+
+        def get_invoice_pdf_path(self, invoice: SalesInvoice) -> Path | None:  # noqa: PLR6301
+            if attachment_kb <= 0:
+                return None
+
+            return SyntheticInvoiceGenerator.write_attachment(output_dir, invoice, attachment_kb)
+
+    BenchmarkMapper.__name__ = mapper_class.__name__
+    return BenchmarkMapper()
+
+
+def _peak_memory_mb() -> tuple[str, float]:
+    """Retorna o pico de memória do processo (RSS), ou o pico do tracemalloc onde não existe `resource`."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss vem em KB no Linux e em bytes no macOS
+        return 'peak_rss_mb', peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+    return 'peak_traced_mb', tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+
+
+def _generate_document(
+    service: 'InvoiceProcessorService',
+    generator: SyntheticInvoiceGenerator,
+    supplier: SupplierParty,
+    mode: str,
+    index: int,
+) -> tuple[dict[str, float], int]:
+    """
+    Gera (e apaga) um documento sintético no modo indicado.
+
+    Returns:
+        O tempo de cada etapa, em segundos, e o tamanho do XML gerado, em bytes.
+    """
+    mapper = service.mapper
+
+    t0 = time.perf_counter()
+    invoice, details, taxes = generator.generate(index)
+    filename = ''.join(c for c in invoice.invoiceNumber if c.isalnum())
+    t1 = time.perf_counter()
+    timings = {'synthetic': t1 - t0}
+
+    if mode == 'stream':
+        xml_file = service._write_cius_pt_xml(
+            session=None,
+            invoice=invoice,
+            filename=filename,
+            file_path=mapper.get_invoice_xml_path({'invoice_number': invoice.invoiceNumber}),
+            invoice_details=details,
+            tax_subtotals=taxes,
+            supplier=supplier,
+        )
+        timings['write'] = time.perf_counter() - t1
+    else:
+        root = service._build_cius_pt_xml(
+            session=None,
+            invoice=invoice,
+            mapper=mapper,
+            filename=filename,
+            invoice_details=details,
+            tax_subtotals=taxes,
+            supplier=supplier,
+        )
+        t2 = time.perf_counter()
+        xml_file = mapper.save_invoice_xml(
+            xml_tree=root,
+            context={
+                'invoice_number': invoice.invoiceNumber,
+                'company': invoice.company,
+                'site': invoice.salesSite,
+                'invoice_date': invoice.invoiceDate,
+            },
+        )
+        timings['build'] = t2 - t1
+        timings['save'] = time.perf_counter() - t2
+
+    size = xml_file.stat().st_size
+    xml_file.unlink()
+
+    return timings, size
+
+
+def run_scenario(scenario: dict[str, Any]) -> dict[str, Any]:
+    """Corre um cenário (mapper + modo) e retorna as métricas. Executado num processo próprio."""
+    logging.basicConfig(level=scenario['log_level'])
+
+    if resource is None:
+        tracemalloc.start()
+
+    # Importado aqui para que o processo do cenário carregue o serviço (e o mapper) do zero
+    from core.services import invoice_processor  # noqa: PLC0415
+
+    generator = SyntheticInvoiceGenerator(
+        lines=scenario['lines'], vat_rates=scenario['vat_rates'], credit_note_ratio=scenario['credit_note_ratio']
+    )
+    supplier = SyntheticInvoiceGenerator.supplier()
+    stages = {'synthetic': 0.0, 'build': 0.0, 'save': 0.0, 'write': 0.0}
+    xml_bytes = 0
+
+    with tempfile.TemporaryDirectory(prefix='cius_pt_bench_') as tmp:
+        output_dir = Path(tmp)
+        mapper = _benchmark_mapper(_load_mapper_class(scenario['mapper']), output_dir, scenario['attachment_kb'])
+        service = invoice_processor.InvoiceProcessorService(customer_mapper=mapper, workers=1)
+
+        total = scenario['warmup'] + scenario['invoices']
+        started = 0.0
+
+        for index in range(total):
+            if index == scenario['warmup']:
+                stages = dict.fromkeys(stages, 0.0)
+                xml_bytes = 0
+                started = time.perf_counter()
+
+            timings, size = _generate_document(service, generator, supplier, scenario['mode'], index)
+            xml_bytes += size
+
+            for stage, seconds in timings.items():
+                stages[stage] += seconds
+
+        elapsed = time.perf_counter() - started - stages['synthetic']
+
+    memory_key, memory_mb = _peak_memory_mb()
+    invoices = scenario['invoices']
+
+    return {
+        'mapper': scenario['mapper'],
+        'mode': scenario['mode'],
+        'invoices': invoices,
+        'lines': scenario['lines'],
+        'vat_rates': scenario['vat_rates'],
+        'attachment_kb': scenario['attachment_kb'],
+        'seconds': round(elapsed, 4),
+        'docs_per_second': round(invoices / elapsed, 2) if elapsed else None,
+        'stage_ms_per_doc': {
+            stage: round(seconds * 1000 / invoices, 3) for stage, seconds in stages.items() if seconds
+        },
+        'avg_xml_kb': round(xml_bytes / invoices / 1024, 1),
+        memory_key: round(memory_mb, 1),
+    }
+
+
+def _print_results(results: list[dict[str, Any]]) -> None:
+    """Mostra os resultados em forma de tabela."""
+    print(f'{"mapper":<10} {"modo":<7} {"docs/s":>9} {"pico MB":>9} {"XML KB":>9}  etapas (ms/doc)')
+
+    for result in results:
+        peak = result.get('peak_rss_mb', result.get('peak_traced_mb'))
+        stages = ', '.join(f'{stage}={ms}' for stage, ms in result['stage_ms_per_doc'].items())
+        print(
+            f'{result["mapper"]:<10} {result["mode"]:<7} {result["docs_per_second"]:>9} '
+            f'{peak:>9} {result["avg_xml_kb"]:>9}  {stages}'
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark da geração dos documentos CIUS-PT (sem base de dados).')
+    parser.add_argument('--invoices', type=int, default=100, help='Documentos medidos por cenário.')
+    parser.add_argument('--lines', type=int, default=20, help='Linhas por documento.')
+    parser.add_argument('--vat-rates', type=int, default=2, help='Taxas de IVA diferentes por documento (1 a 4).')
+    parser.add_argument('--attachment-kb', type=int, default=0, help='Tamanho do PDF anexo (mappers que o usam).')
+    parser.add_argument('--credit-note-ratio', type=float, default=0.2, help='Proporção de notas de crédito.')
+    parser.add_argument('--mappers', nargs='+', default=['default', 'mop'], help='Perfis de cliente a medir.')
+    parser.add_argument('--modes', nargs='+', choices=['tree', 'stream'], default=['tree', 'stream'])
+    parser.add_argument('--warmup', type=int, default=3, help='Documentos gerados antes de começar a medir.')
+    parser.add_argument('--log-level', default='WARNING', help='Nível de log durante a medição.')
+    parser.add_argument('--json', type=Path, help='Grava os resultados neste ficheiro JSON.')
+    args = parser.parse_args()
+
+    scenarios = [
+        {
+            'mapper': mapper,
+            'mode': mode,
+            'invoices': max(args.invoices, 1),
+            'lines': args.lines,
+            'vat_rates': args.vat_rates,
+            'attachment_kb': args.attachment_kb,
+            'credit_note_ratio': args.credit_note_ratio,
+            'warmup': max(args.warmup, 0),
+            'log_level': args.log_level.upper(),
+        }
+        for mapper in args.mappers
+        for mode in args.modes
+    ]
+
+    results = []
+
+    for scenario in scenarios:
+        # Um processo por cenário, para isolar o pico de memória
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(run_scenario, scenario).result())
+
+    _print_results(results)
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+import logging
+import threading
+import time
+from collections import deque
+from enum import StrEnum
+
+from requests.exceptions import RequestException
+
+from core.config.settings import (
+    HTTP_CIRCUIT_BREAKER_ENABLED,
+    HTTP_CIRCUIT_FAILURE_RATE,
+    HTTP_CIRCUIT_HALF_OPEN_CALLS,
+    HTTP_CIRCUIT_MIN_CALLS,
+    HTTP_CIRCUIT_OPEN_SECONDS,
+    HTTP_CIRCUIT_SLOW_CALL_RATE,
+    HTTP_CIRCUIT_SLOW_CALL_SECONDS,
+    HTTP_CIRCUIT_WINDOW,
+)
+from core.types.types import CircuitBreakerMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(StrEnum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(RequestException):
+    """O pedido não foi feito porque a API está indisponível (circuito aberto)."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker dos pedidos à API da Saphety, partilhável entre threads.
+
+    Com o circuito fechado, o resultado dos últimos `window` pedidos é guardado; quando há pelo
+    menos `min_calls` pedidos e a proporção de falhas (erros de ligação, timeouts, 429 e 5xx)
+    ou de pedidos lentos (mais de `slow_call_seconds`) atinge o limite, o circuito abre. Com o
+    circuito aberto, os pedidos falham de imediato com `CircuitOpenError` durante `open_seconds`,
+    em vez de esperarem cada um pelo timeout. Depois disso o circuito fica meio-aberto: só
+    `half_open_calls` pedidos de teste são feitos; se todos correrem bem o circuito fecha, senão
+    volta a abrir.
+
+    Args:
+        failure_rate: A proporção de falhas (0 a 1) que abre o circuito.
+        slow_call_rate: A proporção de pedidos lentos (0 a 1) que abre o circuito.
+        slow_call_seconds: A duração a partir da qual um pedido é considerado lento, em segundos.
+        window: O número de pedidos recentes considerados.
+        min_calls: O número mínimo de pedidos na janela antes de o circuito poder abrir.
+        open_seconds: O tempo durante o qual o circuito fica aberto, em segundos.
+        half_open_calls: O número de pedidos de teste com o circuito meio-aberto.
+        enabled: Se False, os pedidos nunca são bloqueados (só são contados).
+    """
+
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        failure_rate: float = HTTP_CIRCUIT_FAILURE_RATE,
+        slow_call_rate: float = HTTP_CIRCUIT_SLOW_CALL_RATE,
+        slow_call_seconds: float = HTTP_CIRCUIT_SLOW_CALL_SECONDS,
+        window: int = HTTP_CIRCUIT_WINDOW,
+        min_calls: int = HTTP_CIRCUIT_MIN_CALLS,
+        open_seconds: float = HTTP_CIRCUIT_OPEN_SECONDS,
+        half_open_calls: int = HTTP_CIRCUIT_HALF_OPEN_CALLS,
+        enabled: bool = HTTP_CIRCUIT_BREAKER_ENABLED,
+    ):
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.window = max(window, 1)
+        self.min_calls = min(max(min_calls, 1), self.window)
+        self.open_seconds = max(open_seconds, 0.0)
+        self.half_open_calls = max(half_open_calls, 1)
+        self.enabled = enabled
+
+        self.state = CircuitState.CLOSED
+        # Resultados dos últimos pedidos: (falhou, lento)
+        self._outcomes: deque[tuple[bool, bool]] = deque(maxlen=self.window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        self._reset_counters()
+
+    def before_call(self) -> None:
+        """
+        Verifica se o pedido pode ser feito.
+
+        Raises:
+            CircuitOpenError: Se o circuito está aberto (ou meio-aberto, com os pedidos de teste já em curso).
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if self.state == CircuitState.OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(f'API indisponível (circuito aberto). Nova tentativa em {remaining:.0f}s.')
+
+                self._transition(CircuitState.HALF_OPEN)
+
+            if self.state == CircuitState.HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self._rejected += 1
+                    raise CircuitOpenError('API indisponível (circuito meio-aberto, a aguardar os pedidos de teste).')
+
+                self._probes += 1
+
+    def record(self, failed: bool, elapsed: float) -> None:
+        """
+        Regista o resultado de um pedido feito.
+
+        Args:
+            failed: Se o pedido falhou (erro de ligação, timeout, 429 ou 5xx).
+            elapsed: A duração do pedido, em segundos.
+        """
+        slow = elapsed >= self.slow_call_seconds
+
+        with self._lock:
+            self._calls += 1
+            self._failures += failed
+            self._slow_calls += slow
+
+            if not self.enabled:
+                return
+
+            if self.state == CircuitState.HALF_OPEN:
+                if failed or slow:
+                    self._transition(CircuitState.OPEN)
+                    return
+
+                self._probe_successes += 1
+
+                if self._probe_successes >= self.half_open_calls:
+                    self._transition(CircuitState.CLOSED)
+
+                return
+
+            if self.state == CircuitState.OPEN:
+                # Pedido iniciado antes de o circuito abrir
+                return
+
+            self._outcomes.append((failed, slow))
+
+            if len(self._outcomes) < self.min_calls:
+                return
+
+            failure_rate, slow_call_rate = self._rates()
+
+            if failure_rate >= self.failure_rate or slow_call_rate >= self.slow_call_rate:
+                self._transition(CircuitState.OPEN)
+
+    def metrics(self, reset: bool = False) -> CircuitBreakerMetrics:
+        """
+        Retorna o estado do circuito e os contadores de pedidos.
+
+        Args:
+            reset: Se True, os contadores voltam a zero (ex: no fim de cada ciclo).
+        """
+        with self._lock:
+            failure_rate, slow_call_rate = self._rates()
+            metrics: CircuitBreakerMetrics = {
+                'state': self.state.value,
+                'calls': self._calls,
+                'failures': self._failures,
+                'slow_calls': self._slow_calls,
+                'rejected': self._rejected,
+                'opened': self._opened,
+                'failure_rate': round(failure_rate, 3),
+                'slow_call_rate': round(slow_call_rate, 3),
+            }
+
+            if reset:
+                self._reset_counters()
+
+            return metrics
+
+    def log_metrics(self, reset: bool = True) -> None:
+        """Regista no log o estado do circuito e os contadores de pedidos (por omissão, do ciclo)."""
+        metrics = self.metrics(reset=reset)
+        level = logging.INFO if metrics['state'] == CircuitState.CLOSED and not metrics['opened'] else logging.WARNING
+
+        logger.log(
+            level,
+            f'Circuit breaker da API: estado {metrics["state"]}, {metrics["calls"]} pedidos, '
+            f'{metrics["failures"]} falhas, {metrics["slow_calls"]} lentos, {metrics["rejected"]} rejeitados, '
+            f'{metrics["opened"]} aberturas.',
+        )
+
+    def _rates(self) -> tuple[float, float]:
+        if not self._outcomes:
+            return 0.0, 0.0
+
+        failures = sum(failed for failed, _ in self._outcomes)
+        slow_calls = sum(slow for _, slow in self._outcomes)
+        return failures / len(self._outcomes), slow_calls / len(self._outcomes)
+
+    def _transition(self, state: CircuitState) -> None:
+        """Muda o estado do circuito (chamado com o lock)."""
+        previous = self.state
+        self.state = state
+        self._probes = 0
+        self._probe_successes = 0
+
+        if state == CircuitState.OPEN:
+            failure_rate, slow_call_rate = self._rates()
+            self._opened_at = time.monotonic()
+            self._opened += 1
+            logger.warning(
+                f'Circuit breaker da API aberto (estado anterior: {previous.value}, falhas {failure_rate:.0%}, '
+                f'lentos {slow_call_rate:.0%}). Pedidos bloqueados durante {self.open_seconds:.0f}s.'
+            )
+        elif state == CircuitState.HALF_OPEN:
+            logger.info('Circuit breaker da API meio-aberto. A testar a API.')
+        else:
+            self._outcomes.clear()
+            logger.info('Circuit breaker da API fechado. A API voltou a responder.')
+
+    def _reset_counters(self) -> None:
+        self._calls = 0
+        self._failures = 0
+        self._slow_calls = 0
+        self._rejected = 0
+        self._opened = 0
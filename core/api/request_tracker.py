@@ -0,0 +1,249 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from requests.exceptions import RequestException
+
+from core.api.circuit_breaker import CircuitOpenError
+from core.config.settings import (
+    SAPHETY_POLL_BATCH_SIZE,
+    SAPHETY_POLL_DEADLINE_SECONDS,
+    SAPHETY_POLL_INITIAL_DELAY,
+    SAPHETY_POLL_MAX_DELAY,
+)
+from core.types.types import SaphetyResponse
+
+logger = logging.getLogger(__name__)
+
+# Estados de um pedido assíncrono que ainda não terminou
+ASYNC_PENDING_STATUSES = frozenset({'Queued', 'Running'})
+
+
+class _TrackedRequest:
+    __slots__ = ('attempt', 'deadline', 'last_response', 'next_poll_at', 'request_id')
+
+    def __init__(self, request_id: str, next_poll_at: float):
+        self.request_id = request_id
+        self.next_poll_at = next_poll_at
+        # Definido na primeira consulta (o limite de tempo conta a partir daí)
+        self.deadline: Optional[float] = None
+        self.attempt = 0
+        self.last_response: Optional[SaphetyResponse] = None
+
+
+class AsyncRequestTracker:
+    """
+    Acompanha os pedidos assíncronos da Saphety (CountryFormatAsyncRequest) até terminarem.
+
+    Os pedidos são registados com `add` à medida que os documentos são submetidos e consultados
+    depois por `run`, em rondas: em cada ronda são consultados (no máximo `batch_size`) os
+    pedidos cuja próxima consulta já chegou. Um pedido ainda em fila ou em execução volta a ser
+    consultado com uma espera exponencial (com jitter), até ao limite de `deadline` segundos
+    desde a sua primeira consulta; os que não terminarem até lá ficam por concluir, para o próximo ciclo.
+    Se a API ficar indisponível (circuito aberto), o acompanhamento termina logo e todos os
+    pedidos por terminar ficam para o próximo ciclo.
+
+    Args:
+        poll: Função que consulta o estado de um pedido a partir do seu ID.
+        workers: Número de consultas feitas em simultâneo em cada ronda.
+        initial_delay: A espera antes da primeira consulta e base da espera exponencial, em segundos.
+        max_delay: A espera máxima entre consultas do mesmo pedido, em segundos.
+        deadline: O tempo máximo de acompanhamento de cada pedido desde a primeira consulta, em segundos.
+        batch_size: O número máximo de pedidos consultados por ronda.
+    """
+
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        poll: Callable[[str], SaphetyResponse],
+        workers: int = 1,
+        initial_delay: float = SAPHETY_POLL_INITIAL_DELAY,
+        max_delay: float = SAPHETY_POLL_MAX_DELAY,
+        deadline: float = SAPHETY_POLL_DEADLINE_SECONDS,
+        batch_size: int = SAPHETY_POLL_BATCH_SIZE,
+    ):
+        self.poll = poll
+        self.workers = max(workers, 1)
+        self.initial_delay = max(initial_delay, 0.0)
+        self.max_delay = max(max_delay, self.initial_delay)
+        self.deadline = deadline
+        self.batch_size = max(batch_size, 1)
+
+        self._outstanding: dict[str, _TrackedRequest] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_pending(response: SaphetyResponse) -> bool:
+        """Indica se a resposta é de um pedido que ainda está em fila ou em execução."""
+        data = response.get('Data')
+
+        if not response.get('IsValid') or not isinstance(data, dict):
+            return False
+
+        return data.get('AsyncStatus') in ASYNC_PENDING_STATUSES
+
+    def add(self, invoice_number: str, request_id: str, wait: bool = True) -> None:
+        """
+        Regista um pedido a acompanhar.
+
+        Args:
+            invoice_number: O número da fatura do pedido.
+            request_id: O ID do pedido assíncrono retornado no envio.
+            wait: Se True, a primeira consulta só é feita depois de `initial_delay` (pedido
+                  acabado de submeter); se False, é feita logo na primeira ronda.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            self._outstanding[invoice_number] = _TrackedRequest(
+                request_id=request_id,
+                next_poll_at=now + (self._jitter(self.initial_delay) if wait else 0.0),
+            )
+
+    def run(
+        self, on_result: Callable[[str, Optional[SaphetyResponse]], None] | None = None
+    ) -> dict[str, Optional[SaphetyResponse]]:
+        """
+        Consulta os pedidos registados até todos terminarem ou atingirem o limite de tempo.
+
+        Args:
+            on_result: Função chamada com o número da fatura e a resposta assim que cada pedido
+                       termina ou deixa de ser acompanhado (a mesma resposta do dicionário retornado).
+
+        Returns:
+            Um dicionário indexado pelo número da fatura com a última resposta obtida: a resposta
+            final, ou a última resposta em fila/em execução (ou None, se nenhuma consulta teve
+            resposta) para os pedidos que não terminaram a tempo.
+        """
+        results: dict[str, Optional[SaphetyResponse]] = {}
+        unfinished = 0
+
+        def finish(invoice_number: str, response: Optional[SaphetyResponse]) -> None:
+            results[invoice_number] = response
+            del self._outstanding[invoice_number]
+
+            if on_result is not None:
+                on_result(invoice_number, response)
+
+        if not self._outstanding:
+            return results
+
+        logger.info(f'Acompanhar {len(self._outstanding)} pedidos assíncronos.')
+
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix='saphety-poll') if self.workers > 1 else None
+
+        try:
+            while self._outstanding:
+                invoice_numbers = self._next_due()
+                request_ids = [self._outstanding[invoice_number].request_id for invoice_number in invoice_numbers]
+
+                try:
+                    if executor is not None:
+                        responses = list(executor.map(self._safe_poll, request_ids))
+                    else:
+                        responses = [self._safe_poll(request_id) for request_id in request_ids]
+                except CircuitOpenError as e:
+                    logger.warning(f'{e} Os {len(self._outstanding)} pedidos por terminar ficam para o próximo ciclo.')
+
+                    unfinished += len(self._outstanding)
+
+                    for invoice_number, tracked in list(self._outstanding.items()):
+                        finish(invoice_number, tracked.last_response)
+
+                    break
+
+                for invoice_number, response in zip(invoice_numbers, responses):
+                    if response is not None and not self.is_pending(response):
+                        # Terminou (concluído, com erro ou resposta inválida)
+                        finish(invoice_number, response)
+                    elif not self._reschedule(invoice_number, response):
+                        finish(invoice_number, self._outstanding[invoice_number].last_response)
+                        unfinished += 1
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        logger.info(f'Pedidos assíncronos: {len(results) - unfinished} terminados e {unfinished} por concluir.')
+        return results
+
+    def _next_due(self) -> list[str]:
+        """
+        Espera até haver pedidos com a consulta agendada e retorna (no máximo `batch_size`) os
+        seus números de fatura, pela ordem da consulta. O limite de tempo de cada pedido começa a
+        contar quando é consultado pela primeira vez.
+        """
+        while True:
+            now = time.monotonic()
+
+            due = sorted(
+                (tracked.next_poll_at, invoice_number)
+                for invoice_number, tracked in self._outstanding.items()
+                if tracked.next_poll_at <= now
+            )[: self.batch_size]
+
+            if due:
+                break
+
+            # Espera até à próxima consulta agendada
+            wake_at = min(tracked.next_poll_at for tracked in self._outstanding.values())
+            time.sleep(max(wake_at - now, 0.0))
+
+        for _, invoice_number in due:
+            tracked = self._outstanding[invoice_number]
+
+            if tracked.deadline is None:
+                tracked.deadline = now + self.deadline
+
+        return [invoice_number for _, invoice_number in due]
+
+    def _reschedule(self, invoice_number: str, response: Optional[SaphetyResponse]) -> bool:
+        """
+        Agenda a próxima consulta de um pedido que ainda não terminou.
+
+        Returns:
+            False se a próxima consulta já seria depois do limite de tempo (o pedido deixa de ser
+            acompanhado e fica para o próximo ciclo), True caso contrário.
+        """
+        tracked = self._outstanding[invoice_number]
+
+        if response is not None:
+            tracked.last_response = response
+
+        tracked.attempt += 1
+        tracked.next_poll_at = time.monotonic() + self._backoff(tracked.attempt)
+
+        # Não volta a consultar depois do limite: fica para o próximo ciclo
+        if tracked.deadline is not None and tracked.next_poll_at >= tracked.deadline:
+            logger.warning(
+                f'O pedido {tracked.request_id} da fatura {invoice_number} não terminou no tempo limite '
+                f'({self.deadline:.0f}s, {tracked.attempt} consultas). Fica para o próximo ciclo.'
+            )
+            return False
+
+        return True
+
+    def _safe_poll(self, request_id: str) -> Optional[SaphetyResponse]:
+        """
+        Consulta um pedido, retornando None em erros de ligação (a consulta é repetida mais tarde).
+
+        Raises:
+            CircuitOpenError: Se a API está indisponível, para que o acompanhamento termine.
+        """
+        try:
+            return self.poll(request_id)
+        except CircuitOpenError:
+            raise
+        except RequestException as e:
+            logger.warning(f'Erro de ligação ao consultar o pedido {request_id}: {e}')
+            return None
+
+    def _backoff(self, attempt: int) -> float:
+        """Espera antes da consulta seguinte: exponencial no número de consultas, limitada e com jitter."""
+        return self._jitter(min(self.initial_delay * 2**attempt, self.max_delay))
+
+    @staticmethod
+    def _jitter(delay: float) -> float:
+        """Aplica um jitter de até 50% à espera, para que os pedidos não sejam consultados todos ao mesmo tempo."""
+        return random.uniform(delay / 2, delay)
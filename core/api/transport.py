@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from core.api.circuit_breaker import CircuitBreaker
+from core.config.settings import (
+    HTTP_GET_RETRIES,
+    HTTP_POOL_SIZE,
+    HTTP_RATE_LIMIT_BURST,
+    HTTP_RATE_LIMIT_PER_SECOND,
+    HTTP_RETRY_BACKOFF,
+    HTTP_TIMEOUT_SECONDS,
+    SERVER_BASE_ADDRESS,
+)
+from core.utils.rate_limiter import TokenBucket
+
+if TYPE_CHECKING:
+    from core.auth.token_provider import TokenProvider
+
+logger = logging.getLogger(__name__)
+
+# Respostas a que os pedidos GET são repetidos (limite de pedidos e erros temporários do servidor)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class AuthenticationError(requests.exceptions.RequestException):
+    """Não foi possível obter um token de acesso à API (o pedido não chegou a ser feito)."""
+
+
+class SaphetyTransport:
+    """
+    Ligação HTTP à API da Saphety, partilhada pela autenticação e pelos serviços de envio e de estado.
+
+    Usa uma `requests.Session`, pelo que as ligações (TCP e TLS) são reutilizadas entre pedidos
+    (keep-alive) em vez de ser feito um novo handshake por pedido. Os pedidos GET são repetidos
+    em falhas de ligação e nas respostas 429/5xx, com espera exponencial; os POST só são repetidos
+    quando a ligação não chegou a ser estabelecida, para não submeter um documento duas vezes.
+    Todos os pedidos passam pelo mesmo limitador de ritmo e pelo mesmo circuit breaker,
+    partilhados pelas threads que usam a ligação: com a API indisponível, os pedidos falham de
+    imediato com `CircuitOpenError` em vez de esperarem cada um pelo timeout.
+
+    Args:
+        base_address: O endereço do servidor, com ou sem esquema (por omissão usa https://).
+        pool_size: O número máximo de ligações mantidas abertas para o servidor.
+        retries: O número de repetições dos pedidos GET.
+        backoff: O fator da espera exponencial entre repetições, em segundos.
+        timeout: O timeout por omissão de cada pedido, em segundos.
+        rate_limit: O número máximo de pedidos por segundo. 0 desativa o limite.
+        burst: O número máximo de pedidos seguidos acima do ritmo. 0 usa o próprio `rate_limit`.
+        circuit_breaker: O circuit breaker dos pedidos. Se None, cria um com a configuração por omissão.
+    """
+
+    _default: Optional['SaphetyTransport'] = None
+    _default_lock = threading.Lock()
+
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        base_address: str = SERVER_BASE_ADDRESS,
+        pool_size: int = HTTP_POOL_SIZE,
+        retries: int = HTTP_GET_RETRIES,
+        backoff: float = HTTP_RETRY_BACKOFF,
+        timeout: float = HTTP_TIMEOUT_SECONDS,
+        rate_limit: float = HTTP_RATE_LIMIT_PER_SECOND,
+        burst: int = HTTP_RATE_LIMIT_BURST,
+        circuit_breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.base_url = self.normalize_base_url(base_address)
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(rate=rate_limit, capacity=burst or None)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset({'GET'}),
+            respect_retry_after_header=True,
+            # Depois da última repetição devolve a resposta, para ser tratada por `raise_for_status`
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1), max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def default(cls) -> 'SaphetyTransport':
+        """Retorna a ligação partilhada pelo processo, criando-a no primeiro uso."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+                logger.debug(f'Ligação HTTP partilhada criada para {cls._default.base_url}.')
+
+            return cls._default
+
+    @staticmethod
+    def normalize_base_url(base_address: str) -> str:
+        """Garante que o endereço começa por http:// ou https:// (https:// por omissão) e não termina em '/'."""
+        base_address = base_address.strip().rstrip('/')
+
+        if not base_address.startswith(('https://', 'http://')):
+            base_address = f'https://{base_address}'
+
+        return base_address
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """
+        Faz um pedido pela sessão partilhada, com o timeout por omissão se nenhum for indicado.
+
+        Raises:
+            CircuitOpenError: Se o circuit breaker está aberto (o pedido não é feito).
+        """
+        self.circuit_breaker.before_call()
+
+        waited = self.rate_limiter.acquire()
+
+        if waited:
+            logger.debug(f'Limite de pedidos à API atingido. Aguardou {waited:.2f}s.')
+
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.monotonic()
+
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            self.circuit_breaker.record(failed=True, elapsed=time.monotonic() - started)
+            raise
+
+        self.circuit_breaker.record(
+            failed=response.status_code in RETRY_STATUS_CODES, elapsed=time.monotonic() - started
+        )
+        return response
+
+    def authorized_request(self, method: str, url: str, tokens: 'TokenProvider', **kwargs: Any) -> requests.Response:
+        """
+        Faz um pedido autenticado com o token do `tokens`.
+
+        Se a API responder 401 (token expirado ou revogado), o token é descartado e o pedido é
+        repetido uma vez com um token novo.
+
+        Raises:
+            AuthenticationError: Se não foi possível obter um token.
+        """
+        headers = dict(kwargs.pop('headers', None) or {})
+
+        for attempt in range(2):
+            token = tokens.get_token()
+
+            if not token:
+                raise AuthenticationError('Falha na autenticação. Não foi possível obter o token.')
+
+            headers['Authorization'] = f'bearer {token}'
+            response = self.request(method, url, headers=headers, **kwargs)
+
+            if response.status_code != HTTPStatus.UNAUTHORIZED or attempt:
+                return response
+
+            logger.info('Token de acesso rejeitado pela API (401). Renovar o token e repetir o pedido.')
+            tokens.invalidate(token)
+
+        return response
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def close(self) -> None:
+        """Fecha as ligações abertas."""
+        self.session.close()
+
+    def __enter__(self) -> 'SaphetyTransport':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
@@ -5,18 +5,20 @@ from typing import Any
 
 import requests
 
+from core.api.transport import SaphetyTransport
+
 SERVER_ERROR_CODE = 500
 
 logger = logging.getLogger(__name__)
 
 
 class Auth:
-    def __init__(self, base_url: str) -> None:
-        # Garante que o URL base começa com https://
-        if not base_url.startswith('https://'):
-            self.base_url = f'https://{base_url}'
-        else:
-            self.base_url = base_url
+    def __init__(self, base_url: str, transport: SaphetyTransport | None = None) -> None:
+        # Garante que o URL base começa com https:// (ou http://, se indicado)
+        self.base_url = SaphetyTransport.normalize_base_url(base_url)
+
+        # Ligação HTTP partilhada (keep-alive) com os restantes clientes da API
+        self.transport = transport or SaphetyTransport.default()
 
         self.headers = {'content-type': 'application/json'}
 
@@ -35,7 +37,7 @@ class Auth:
             request_data = json.dumps(payload)
 
             # Requisição POST para obter um token
-            response = requests.post(service_url, data=request_data, headers=self.headers, timeout=15)
+            response = self.transport.post(service_url, data=request_data, headers=self.headers)
 
             # Levanta uma exceção HTTPError se a resposta for um erro.
             response.raise_for_status()
@@ -85,7 +87,7 @@ class Auth:
 
         headers = {'Authorization': 'Bearer ' + token}
 
-        response = requests.get(service_url, headers=headers)
+        response = self.transport.get(service_url, headers=headers)
 
         if response.status_code < SERVER_ERROR_CODE:
             json_response = json.loads(response.text)
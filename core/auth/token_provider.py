@@ -0,0 +1,256 @@
+import base64
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from http import HTTPStatus
+from pathlib import Path
+from typing import Optional
+
+from core.api.transport import SaphetyTransport
+from core.auth.auth import Auth
+from core.config.settings import (
+    API_PASSWORD,
+    API_USER,
+    TOKEN_CACHE_FILE,
+    TOKEN_REFRESH_MARGIN_SECONDS,
+    TOKEN_TTL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _FileLock:
+    """
+    Lock entre processos baseado na criação exclusiva de um ficheiro (funciona em Linux e Windows).
+
+    Um lock com mais de `stale_after` segundos é considerado abandonado (processo terminado) e removido.
+    O ficheiro guarda um identificador único de quem o criou, e só esse o remove no fim: se o lock
+    foi considerado abandonado e obtido por outro processo entretanto, o lock deste não é apagado.
+    """
+
+    def __init__(self, path: Path, timeout: float = 30.0, stale_after: float = 60.0):
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.owner = f'{os.getpid()}:{uuid.uuid4().hex}'
+
+    def __enter__(self) -> '_FileLock':
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - self.path.stat().st_mtime > self.stale_after:
+                        self.path.unlink(missing_ok=True)
+                        continue
+                except FileNotFoundError:
+                    continue
+
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f'Não foi possível obter o lock {self.path}.') from None
+
+                time.sleep(0.05)
+            else:
+                os.write(fd, self.owner.encode())
+                os.close(fd)
+                return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        try:
+            owner = self.path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return
+
+        if owner != self.owner:
+            logger.warning(f'O lock {self.path} foi considerado abandonado e obtido por outro processo.')
+            return
+
+        self.path.unlink(missing_ok=True)
+
+
+class TokenProvider:
+    """
+    Fornece o token de acesso à API da Saphety, reutilizando-o enquanto for válido.
+
+    O token é guardado em memória com a sua validade (o `exp` do token, se for um JWT, ou
+    `ttl` segundos após o login) e renovado `refresh_margin` segundos antes de expirar. Com
+    `cache_file`, o token é também partilhado entre processos (serviço, CLI, processos
+    auxiliares) através de um ficheiro protegido por lock: só um processo faz login de cada
+    vez e os restantes reutilizam o token que este guardou.
+
+    Args:
+        transport: A ligação HTTP à API.
+        username: O utilizador da API.
+        password: A palavra-passe da API.
+        ttl: A validade do token, em segundos, quando não é possível lê-la do próprio token.
+        refresh_margin: A antecedência, em segundos, com que o token é renovado antes de expirar.
+        cache_file: O ficheiro onde o token é partilhado entre processos. Se None, só em memória.
+    """
+
+    _default: Optional['TokenProvider'] = None
+    _default_lock = threading.Lock()
+
+    def __init__(  # noqa: PLR0913, PLR0917
+        self,
+        transport: SaphetyTransport,
+        username: str = API_USER,
+        password: str = API_PASSWORD,
+        ttl: float = TOKEN_TTL_SECONDS,
+        refresh_margin: float = TOKEN_REFRESH_MARGIN_SECONDS,
+        cache_file: Path | None = TOKEN_CACHE_FILE,
+    ):
+        self.auth = Auth(transport.base_url, transport=transport)
+        self.username = username
+        self.password = password
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.cache_file = cache_file
+
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def default(cls) -> 'TokenProvider':
+        """Retorna o fornecedor de tokens partilhado pelo processo (sobre a ligação partilhada)."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls(SaphetyTransport.default())
+
+            return cls._default
+
+    def get_token(self) -> Optional[str]:
+        """
+        Retorna um token válido, fazendo login apenas quando não há nenhum em cache ou está a expirar.
+
+        Returns:
+            O token, ou None se o login falhou.
+        """
+        with self._lock:
+            if self._is_fresh(self._expires_at):
+                return self._token
+
+            if self.cache_file is None:
+                return self._login()
+
+            try:
+                with _FileLock(self.cache_file.with_name(self.cache_file.name + '.lock')):
+                    cached = self._read_cache_file()
+
+                    if cached is not None:
+                        self._token, self._expires_at = cached
+                        logger.debug('Token de acesso reutilizado da cache partilhada.')
+                        return self._token
+
+                    token = self._login()
+
+                    if token is not None:
+                        self._write_cache_file()
+
+                    return token
+            except TimeoutError:
+                logger.warning('Não foi possível obter o lock da cache de tokens. Fazer login sem a cache partilhada.')
+                return self._login()
+
+    def invalidate(self, token: str) -> None:
+        """Descarta o token (ex: rejeitado pela API com 401), se ainda for o token em cache."""
+        with self._lock:
+            if self._token == token:
+                self._token = None
+                self._expires_at = 0.0
+
+            if self.cache_file is None:
+                return
+
+            try:
+                with _FileLock(self.cache_file.with_name(self.cache_file.name + '.lock')):
+                    cached = self._read_cache_file(fresh_only=False)
+
+                    if cached is not None and cached[0] == token:
+                        self.cache_file.unlink(missing_ok=True)
+            except TimeoutError:
+                logger.warning('Não foi possível obter o lock da cache de tokens para descartar o token.')
+
+    def _is_fresh(self, expires_at: float) -> bool:
+        return time.time() < expires_at - self.refresh_margin
+
+    def _login(self) -> Optional[str]:
+        """Faz login na API e guarda o token em memória."""
+        login_data = self.auth.login(self.username, self.password)
+        token = login_data.get('Token') if login_data.get('HttpStatus') == HTTPStatus.OK else None
+
+        if not token:
+            self._token = None
+            self._expires_at = 0.0
+            return None
+
+        issued_at = time.time()
+        expires_at = issued_at + self.ttl
+        token_expiry = self._jwt_expiry(token)
+
+        if token_expiry is not None:
+            expires_at = min(expires_at, token_expiry)
+
+        self._token = token
+        self._expires_at = expires_at
+
+        logger.info(f'Novo token de acesso obtido, válido durante {max(expires_at - issued_at, 0):.0f}s.')
+        return token
+
+    @staticmethod
+    def _jwt_expiry(token: str) -> Optional[float]:
+        """Lê a validade (`exp`) de um token JWT, ou None se o token não for um JWT."""
+        parts = token.split('.')
+
+        if len(parts) != 3:  # noqa: PLR2004
+            return None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(parts[1] + '=' * (-len(parts[1]) % 4)))
+            return float(payload['exp'])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _cache_key(self) -> str:
+        return f'{self.auth.base_url}|{self.username}'
+
+    def _read_cache_file(self, fresh_only: bool = True) -> Optional[tuple[str, float]]:
+        """Lê o token guardado no ficheiro partilhado, se for desta API e utilizador (e ainda válido)."""
+        try:
+            content = json.loads(self.cache_file.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning(f'Cache de tokens {self.cache_file} inválida. Será substituída.')
+            return None
+
+        if content.get('key') != self._cache_key() or not content.get('token'):
+            return None
+
+        expires_at = float(content.get('expires_at', 0))
+
+        if fresh_only and not self._is_fresh(expires_at):
+            return None
+
+        return content['token'], expires_at
+
+    def _write_cache_file(self) -> None:
+        """Guarda o token em memória no ficheiro partilhado (escrita atómica, legível só pelo utilizador)."""
+        tmp_file = self.cache_file.with_name(f'{self.cache_file.name}.{os.getpid()}.tmp')
+        content = json.dumps({'key': self._cache_key(), 'token': self._token, 'expires_at': self._expires_at})
+
+        try:
+            fd = os.open(tmp_file, os.O_CREAT | os.O_TRUNC | os.O_WRONLY, 0o600)
+
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            logger.warning(f'Não foi possível guardar o token em {self.cache_file}.', exc_info=True)
+            tmp_file.unlink(missing_ok=True)
@@ -14,6 +14,8 @@ from .settings import (
     LOG_INFO_FILENAME,
     LOG_MAX_BYTES,
     LOG_ROOT_LEVEL,
+    LOG_SLOW_SQL_FILE_ENABLED,
+    LOG_SLOW_SQL_FILENAME,
 )
 
 
@@ -68,6 +70,22 @@ def setup_logging():
         }
         root_handlers_list.append('error_file')
 
+    # Slow SQL File Handler (condicional): só as queries lentas, além dos restantes logs
+    loggers_config = {}
+
+    if LOG_SLOW_SQL_FILE_ENABLED and logging_dir and LOG_SLOW_SQL_FILENAME:
+        handlers_config['slow_sql_file'] = {
+            'level': 'WARNING',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(logging_dir, str(LOG_SLOW_SQL_FILENAME)),
+            'maxBytes': LOG_MAX_BYTES,
+            'backupCount': LOG_BACKUP_COUNT,
+            'mode': 'a',
+            'encoding': 'utf-8',
+            'formatter': 'standard',
+        }
+        loggers_config['core.database.instrumentation.slow'] = {'handlers': ['slow_sql_file']}
+
     logging_config = {
         'version': 1,
         'disable_existing_loggers': False,
@@ -80,6 +98,7 @@ def setup_logging():
             },
         },
         'handlers': handlers_config,
+        'loggers': loggers_config,
         'root': {'level': logging_root_level, 'handlers': root_handlers_list},
     }
 
@@ -1,7 +1,7 @@
 from datetime import date, datetime
 from pathlib import Path
 
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -36,7 +36,41 @@ else:
 
 # Debug mode
 DEBUG = config('DEBUG', default=True, cast=bool)
-SQL_DEBUG = config('SQL_DEBUG', default=True, cast=bool)
+
+# Regista as queries SQL no log. Em produção deve ficar desligado.
+SQL_DEBUG = config('SQL_DEBUG', default=False, cast=bool)
+# Com SQL_DEBUG, proporção (0 a 1) das queries registadas, para reduzir o volume do log
+SQL_LOG_SAMPLE_RATE = config('SQL_LOG_SAMPLE_RATE', default=1.0, cast=float)
+
+# Contagem das queries por ciclo (número, tempo na base de dados e queries mais repetidas)
+SQL_INSTRUMENTATION = config('SQL_INSTRUMENTATION', default=True, cast=bool)
+# Queries mais lentas do que este tempo, em milissegundos, são registadas no log das queries lentas
+SQL_SLOW_QUERY_MS = config('SQL_SLOW_QUERY_MS', default=500, cast=float)
+# Aviso quando a mesma query (com outros parâmetros) se repete mais do que este número de vezes num ciclo (N+1)
+SQL_REPEAT_WARNING = config('SQL_REPEAT_WARNING', default=50, cast=int)
+# Número de queries mais frequentes mostradas no resumo de cada ciclo
+SQL_SUMMARY_TOP = config('SQL_SUMMARY_TOP', default=5, cast=int)
+
+# Pool de ligações à base de dados
+DB_POOL_SIZE = config('DB_POOL_SIZE', default=5, cast=int)
+DB_MAX_OVERFLOW = config('DB_MAX_OVERFLOW', default=10, cast=int)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=30, cast=float)
+# Tempo máximo de vida de uma ligação, em segundos (-1 sem limite)
+DB_POOL_RECYCLE = config('DB_POOL_RECYCLE', default=1800, cast=int)
+# Testa cada ligação antes de a usar, descartando as que o servidor fechou (ex: depois de uma noite parada)
+DB_POOL_PRE_PING = config('DB_POOL_PRE_PING', default=True, cast=bool)
+
+# Envia os `executemany` do pyodbc num único lote de parâmetros
+DB_FAST_EXECUTEMANY = config('DB_FAST_EXECUTEMANY', default=True, cast=bool)
+
+# Opções da sessão SQL Server aplicadas a cada nova ligação.
+# SET NOCOUNT ON pode fazer o pyodbc devolver -1 no número de linhas afetadas, que o SQLAlchemy
+# usa para validar as atualizações do ORM: ativar só depois de testar na instalação.
+DB_SET_NOCOUNT = config('DB_SET_NOCOUNT', default=False, cast=bool)
+# Tempo máximo de espera por um lock, em milissegundos (-1 espera sem limite, o valor do SQL Server)
+DB_LOCK_TIMEOUT_MS = config('DB_LOCK_TIMEOUT_MS', default=-1, cast=int)
+# Número de registos lidos por página nas leituras paginadas (`iter_batches`), cada uma numa sessão própria
+DB_PAGE_SIZE = config('DB_PAGE_SIZE', default=1000, cast=int)
 
 # API connection parameters
 SERVER_BASE_ADDRESS = str(config('SERVER_BASE_ADDRESS', default=' ', cast=str))
@@ -44,6 +78,64 @@ SERVER_BASE_ADDRESS = str(config('SERVER_BASE_ADDRESS', default=' ', cast=str))
 API_USER = str(config('API_USER', default=' ', cast=str))
 API_PASSWORD = str(config('API_PASSWORD', default=' ', cast=str))
 
+# Token de acesso: validade (quando não indicada no próprio token) e antecedência da renovação, em segundos
+TOKEN_TTL_SECONDS = config('TOKEN_TTL_SECONDS', default=3600, cast=int)
+TOKEN_REFRESH_MARGIN_SECONDS = config('TOKEN_REFRESH_MARGIN_SECONDS', default=300, cast=int)
+# Ficheiro onde o token é partilhado entre processos (relativo à pasta da aplicação). Vazio: só em memória.
+_TOKEN_CACHE_FILE = str(config('TOKEN_CACHE_FILE', default='', cast=str)).strip()
+TOKEN_CACHE_FILE = BASE_DIR / _TOKEN_CACHE_FILE if _TOKEN_CACHE_FILE else None
+
+# Ligação HTTP à API da Saphety (sessão partilhada com keep-alive por todos os clientes)
+HTTP_TIMEOUT_SECONDS = config('HTTP_TIMEOUT_SECONDS', default=15, cast=float)
+# Número máximo de ligações mantidas abertas para o servidor da API
+HTTP_POOL_SIZE = config('HTTP_POOL_SIZE', default=10, cast=int)
+# Repetições dos pedidos GET (idempotentes) em falhas de ligação ou respostas 429/5xx
+HTTP_GET_RETRIES = config('HTTP_GET_RETRIES', default=3, cast=int)
+HTTP_RETRY_BACKOFF = config('HTTP_RETRY_BACKOFF', default=0.5, cast=float)
+# Limite de pedidos por segundo à API (partilhado por todos os clientes do processo). 0 desativa o limite.
+HTTP_RATE_LIMIT_PER_SECOND = config('HTTP_RATE_LIMIT_PER_SECOND', default=0, cast=float)
+# Número máximo de pedidos seguidos acima do ritmo (rajada). 0 usa o próprio limite por segundo.
+HTTP_RATE_LIMIT_BURST = config('HTTP_RATE_LIMIT_BURST', default=0, cast=int)
+
+# Circuit breaker da API: abre quando, nos últimos HTTP_CIRCUIT_WINDOW pedidos (com pelo menos HTTP_CIRCUIT_MIN_CALLS),
+# a proporção de falhas ou de pedidos lentos atinge o limite. Aberto, os pedidos falham de imediato durante
+# HTTP_CIRCUIT_OPEN_SECONDS; depois são feitos HTTP_CIRCUIT_HALF_OPEN_CALLS pedidos de teste antes de voltar a fechar.
+HTTP_CIRCUIT_BREAKER_ENABLED = config('HTTP_CIRCUIT_BREAKER_ENABLED', default=True, cast=bool)
+HTTP_CIRCUIT_WINDOW = config('HTTP_CIRCUIT_WINDOW', default=20, cast=int)
+HTTP_CIRCUIT_MIN_CALLS = config('HTTP_CIRCUIT_MIN_CALLS', default=5, cast=int)
+HTTP_CIRCUIT_FAILURE_RATE = config('HTTP_CIRCUIT_FAILURE_RATE', default=0.5, cast=float)
+HTTP_CIRCUIT_SLOW_CALL_SECONDS = config('HTTP_CIRCUIT_SLOW_CALL_SECONDS', default=10.0, cast=float)
+HTTP_CIRCUIT_SLOW_CALL_RATE = config('HTTP_CIRCUIT_SLOW_CALL_RATE', default=0.8, cast=float)
+HTTP_CIRCUIT_OPEN_SECONDS = config('HTTP_CIRCUIT_OPEN_SECONDS', default=60.0, cast=float)
+HTTP_CIRCUIT_HALF_OPEN_CALLS = config('HTTP_CIRCUIT_HALF_OPEN_CALLS', default=1, cast=int)
+
+# Número de faturas enviadas em simultâneo para a API. 1 envia uma de cada vez.
+SAPHETY_SEND_WORKERS = config('SAPHETY_SEND_WORKERS', default=1, cast=int)
+
+# Envio imediato: cada XML gerado é entregue ao envio em memória, sem esperar pelo ciclo de envio
+SAPHETY_INLINE_SEND = config('SAPHETY_INLINE_SEND', default=False, cast=bool)
+
+# Número de faturas cujo estado de integração é verificado em simultâneo
+SAPHETY_CHECK_WORKERS = config('SAPHETY_CHECK_WORKERS', default=4, cast=int)
+# Calendário das verificações de cada documento: espera depois da 1.ª, 2.ª, ... verificação em que o documento
+# ainda não foi recebido (número seguido de s, m, h ou d; a última repete-se). Passados SAPHETY_CHECK_CUTOFF_DAYS
+# dias desde o envio, o documento deixa de ser verificado e passa a revisão manual. 0 desativa o limite.
+SAPHETY_CHECK_SCHEDULE = config('SAPHETY_CHECK_SCHEDULE', default='2m,10m,1h,6h,1d', cast=Csv())
+SAPHETY_CHECK_CUTOFF_DAYS = config('SAPHETY_CHECK_CUTOFF_DAYS', default=30, cast=int)
+
+# Gravação dos resultados da API na tabela de controlo durante o envio e a verificação: em segundo plano,
+# em lotes de até CONTROL_UPDATE_BATCH_SIZE resultados, gravados no máximo CONTROL_UPDATE_FLUSH_SECONDS depois
+CONTROL_UPDATE_BATCH_SIZE = config('CONTROL_UPDATE_BATCH_SIZE', default=100, cast=int)
+CONTROL_UPDATE_FLUSH_SECONDS = config('CONTROL_UPDATE_FLUSH_SECONDS', default=2.0, cast=float)
+
+# Consulta dos pedidos assíncronos depois do envio: espera inicial e máxima entre consultas (exponencial,
+# com jitter), tempo máximo de acompanhamento de cada pedido e número máximo de pedidos consultados por ronda.
+# Os pedidos que não terminarem no tempo limite ficam em fila/em execução e são retomados no próximo ciclo.
+SAPHETY_POLL_INITIAL_DELAY = config('SAPHETY_POLL_INITIAL_DELAY', default=1.0, cast=float)
+SAPHETY_POLL_MAX_DELAY = config('SAPHETY_POLL_MAX_DELAY', default=30.0, cast=float)
+SAPHETY_POLL_DEADLINE_SECONDS = config('SAPHETY_POLL_DEADLINE_SECONDS', default=120.0, cast=float)
+SAPHETY_POLL_BATCH_SIZE = config('SAPHETY_POLL_BATCH_SIZE', default=50, cast=int)
+
 # Logging configuration
 LOG_DIR = BASE_DIR / DATABASE['SCHEMA'] / LOGS_SUBFOLDER
 LOG_ROOT_LEVEL = 'DEBUG'
@@ -54,6 +146,8 @@ LOG_INFO_FILE_LEVEL = 'INFO'
 LOG_ERROR_FILE_ENABLED = True
 LOG_ERROR_FILENAME = 'app_error.log'
 LOG_ERROR_FILE_LEVEL = 'ERROR'
+LOG_SLOW_SQL_FILE_ENABLED = True
+LOG_SLOW_SQL_FILENAME = 'app_slow_sql.log'
 LOG_MAX_BYTES = 10 * 1024 * 1024  # 10 MB
 LOG_BACKUP_COUNT = 5
 
@@ -62,6 +156,26 @@ DEFAULT_LEGACY_DATE = date(1753, 1, 1)
 DEFAULT_LEGACY_DATETIME = datetime(1753, 1, 1)
 DAYS_TO_SEARCH = config('DAYS_TO_SEARCH', default=30, cast=int)
 
+# Número de faturas processadas por bloco (linhas e impostos são carregados de uma vez para cada bloco)
+INVOICE_BATCH_SIZE = config('INVOICE_BATCH_SIZE', default=500, cast=int)
+
+# Número de processos usados para gerar os XML. 1 gera os documentos no processo principal.
+XML_WORKERS = config('XML_WORKERS', default=1, cast=int)
+
+# Reutiliza o XML já gerado quando os dados de origem da fatura não mudaram desde a última geração
+SKIP_UNCHANGED_INVOICES = config('SKIP_UNCHANGED_INVOICES', default=True, cast=bool)
+
+# Escreve os XML de forma incremental (bloco a bloco) em vez de construir o documento inteiro em memória.
+# Só compensa com PDF anexos muito grandes: a geração fica 2 a 3 vezes mais lenta e as linhas e os impostos
+# de cada bloco de faturas (INVOICE_BATCH_SIZE) continuam a ser carregados em memória.
+XML_STREAMING_WRITER = config('XML_STREAMING_WRITER', default=False, cast=bool)
+
+# Carrega apenas as colunas usadas no XML CIUS-PT (e as declaradas pelo mapper do cliente)
+XML_COLUMN_PROJECTION = config('XML_COLUMN_PROJECTION', default=True, cast=bool)
+
+# Tempo (em segundos) durante o qual os dados do fornecedor (sociedade) ficam em cache. 0 desativa a cache.
+SUPPLIER_CACHE_TTL_SECONDS = config('SUPPLIER_CACHE_TTL_SECONDS', default=3600, cast=int)
+
 # Email configuration
 EMAIL_CONFIG = {
     'EMAIL_USER': str(config('EMAIL_USER', default=' ', cast=str)),
@@ -123,17 +237,18 @@ XML_FOLDER = str(config('OUTPUT_FOLDER', default='output', cast=str))
 if XML_FOLDER is not None:
     OUTPUT_FOLDER = BASE_DIR / XML_FOLDER
 
-if not Path(OUTPUT_FOLDER).exists():
-    Path(OUTPUT_FOLDER).mkdir(parents=True, exist_ok=True)
-
 # Folder to get pdf files
 PDF_FOLDER = str(config('PDF_FOLDER', default='output', cast=str))
 
 if PDF_FOLDER is not None:
     INPUT_PDF_FOLDER = BASE_DIR / PDF_FOLDER / 'TMOPX3' / 'PDF'
 
-if not Path(INPUT_PDF_FOLDER).exists():
-    Path(INPUT_PDF_FOLDER).mkdir(parents=True, exist_ok=True)
+
+def ensure_folders() -> None:
+    """Cria as pastas de saída dos XML e de entrada dos PDF, se não existirem (no primeiro uso)."""
+    for folder in (OUTPUT_FOLDER, INPUT_PDF_FOLDER):
+        Path(folder).mkdir(parents=True, exist_ok=True)
+
 
 # Other settings
 CLEANUP_FILENAMES = ('-', '_')  # Characters to clean from filenames
@@ -1,13 +1,16 @@
 import logging
+import threading
 from contextlib import contextmanager
-from typing import Generator, Optional
+from typing import Any, Generator, Optional
 
-from sqlalchemy import MetaData, create_engine
+from sqlalchemy import MetaData
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session, sessionmaker
 
-from core.config.settings import DATABASE, SQL_DEBUG
-from core.utils.generics import Generics
+from core.config.settings import DATABASE, SQL_DEBUG, SQL_INSTRUMENTATION
+
+from .engine import EngineFactory
+from .instrumentation import sql_monitor
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -17,8 +20,13 @@ class DatabaseManager:
     """Database session manager."""
 
     def __init__(self, url: str, echo: bool = False):
-        """Initialize the database session manager."""
-        self.engine = create_engine(url, echo=echo)
+        """Initialize the database session manager (pool and session options from settings)."""
+        self.engine = EngineFactory.create(url, echo=echo)
+
+        # Contagem das queries por ciclo, queries lentas e aviso de N+1
+        if SQL_INSTRUMENTATION:
+            sql_monitor.install(self.engine)
+
         self.SessionLocal = sessionmaker(
             bind=self.engine,
             autoflush=False,
@@ -64,19 +72,67 @@ class DatabaseManager:
             raise
 
 
-# Initialize the database session manager
-db = None
+class LazyDatabaseManager:
+    """
+    O DatabaseManager da aplicação, criado no primeiro uso.
+
+    A connection string e o engine só são construídos quando a base de dados é usada pela
+    primeira vez (ex: `db.get_db()`), e não ao importar o módulo, para que os comandos que não
+    precisam da base de dados (ex: `run_cli --help`) arranquem sem esse custo.
+    """
+
+    def __init__(self):
+        self._manager: Optional[DatabaseManager] = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        """Indica se o engine já foi criado."""
+        return self._manager is not None
+
+    def get(self) -> DatabaseManager:
+        """
+        Retorna o DatabaseManager, criando-o se necessário.
+
+        Raises:
+            RuntimeError: Se a base de dados não está configurada ou o engine não pôde ser criado.
+        """
+        if self._manager is not None:
+            return self._manager
+
+        with self._lock:
+            if self._manager is None:
+                self._manager = self._create()
 
-DB_CONNECTION_STRING = Generics().build_connection_string(config=DATABASE)
+        return self._manager
+
+    @staticmethod
+    def _create() -> DatabaseManager:
+        # Importação local: o módulo generics carrega os mappers (e os modelos)
+        from core.utils.generics import Generics  # noqa: PLC0415
+
+        connection_string = Generics().build_connection_string(config=DATABASE)
+
+        if not connection_string:
+            raise RuntimeError('Ligação à base de dados não configurada. Verifique as variáveis DB_*.')
+
+        try:
+            # Com SQL_DEBUG as queries SQL geradas são registadas no log (desligado em produção)
+            manager = DatabaseManager(url=connection_string, echo=SQL_DEBUG)  # type: ignore
+        except ValueError as ve:  # Erro específico da nossa validação de URL
+            logger.error(f'Configuration Error: {ve}')
+            raise RuntimeError('Erro ao conectar ao banco de dados. Verifique os logs.') from ve
+        except SQLAlchemyError as sa_err:  # Erros da criação do engine
+            logger.error(f'SQLAlchemy Engine Creation Error: {sa_err}', exc_info=True)
+            raise RuntimeError('Erro ao conectar ao banco de dados. Verifique os logs.') from sa_err
 
-if DB_CONNECTION_STRING:
-    try:
-        # Passe echo=True para ver as queries SQL geradas, False para produção
-        db = DatabaseManager(url=DB_CONNECTION_STRING, echo=SQL_DEBUG)  # type: ignore
         logger.info('DatabaseSessionManager initialized successfully.')
-    except ValueError as ve:  # Erro específico da nossa validação de URL
-        logger.error(f'Configuration Error: {ve}')
-    except SQLAlchemyError as sa_err:  # Erros da criação do engine
-        logger.error(f'SQLAlchemy Engine Creation Error: {sa_err}', exc_info=True)
-    except Exception as e:  # Outros erros inesperados
-        logger.error(f'Unexpected error initializing DatabaseSessionManager: {e}', exc_info=True)
+        return manager
+
+    def __getattr__(self, name: str) -> Any:
+        # Só é chamado para os atributos do DatabaseManager (get_db, engine, close, ...)
+        return getattr(self.get(), name)
+
+
+# The database session manager (the engine is created on first use)
+db = LazyDatabaseManager()
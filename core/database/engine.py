@@ -0,0 +1,100 @@
+import logging
+import random
+from typing import Any
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+from core.config.settings import (
+    DB_FAST_EXECUTEMANY,
+    DB_LOCK_TIMEOUT_MS,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_SET_NOCOUNT,
+    SQL_DEBUG,
+    SQL_LOG_SAMPLE_RATE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EngineFactory:
+    """
+    Cria os engines SQLAlchemy da aplicação com as opções configuradas.
+
+    Aplica o pool de ligações (`DB_POOL_*`), o `fast_executemany` do pyodbc, as opções da
+    sessão SQL Server executadas em cada nova ligação (`DB_SET_NOCOUNT`, `DB_LOCK_TIMEOUT_MS`)
+    e, com `SQL_DEBUG`, o registo de uma amostra das queries (`SQL_LOG_SAMPLE_RATE`) em vez
+    do `echo` de todas.
+    """
+
+    @staticmethod
+    def create(url: str | URL, echo: bool = SQL_DEBUG, sample_rate: float = SQL_LOG_SAMPLE_RATE) -> Engine:
+        """
+        Cria um engine para o URL indicado.
+
+        Args:
+            url: O URL de ligação (ex: 'mssql+pyodbc:///?odbc_connect=...').
+            echo: Se True, regista as queries no log.
+            sample_rate: A proporção (0 a 1) das queries registadas quando `echo` está ativo.
+        """
+        url = make_url(url)
+        options: dict[str, Any] = {'pool_pre_ping': DB_POOL_PRE_PING, 'pool_recycle': DB_POOL_RECYCLE}
+
+        # As opções de dimensão só se aplicam ao pool por omissão (ex: o SQLite em memória usa outro)
+        if url.get_dialect().get_pool_class(url) is QueuePool:
+            options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+
+        if url.get_backend_name() == 'mssql' and url.get_driver_name() == 'pyodbc':
+            options['fast_executemany'] = DB_FAST_EXECUTEMANY
+
+        engine = create_engine(url, **options)
+
+        if url.get_backend_name() == 'mssql':
+            event.listen(engine, 'connect', EngineFactory._set_session_options)
+
+        if echo and sample_rate > 0:
+            EngineFactory._log_statements(engine, min(sample_rate, 1.0))
+
+        return engine
+
+    @staticmethod
+    def _set_session_options(dbapi_connection: Any, connection_record: Any) -> None:
+        """Aplica as opções da sessão SQL Server a uma nova ligação."""
+        statements = []
+
+        if DB_SET_NOCOUNT:
+            statements.append('SET NOCOUNT ON')
+
+        if DB_LOCK_TIMEOUT_MS >= 0:
+            statements.append(f'SET LOCK_TIMEOUT {DB_LOCK_TIMEOUT_MS:d}')
+
+        if not statements:
+            return
+
+        cursor = dbapi_connection.cursor()
+
+        try:
+            cursor.execute('; '.join(statements))
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _log_statements(engine: Engine, sample_rate: float) -> None:
+        """Regista no log as queries executadas (todas ou uma amostra)."""
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def log_statement(  # noqa: PLR0913, PLR0917
+            conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+        ) -> None:
+            if sample_rate < 1.0 and random.random() >= sample_rate:
+                return
+
+            batch = ' (executemany)' if executemany else ''
+            logger.info(f'SQL{batch}: {statement} | parâmetros: {str(parameters)[:500]}')
+
+        logger.info(f'Registo das queries SQL ativo ({sample_rate:.0%} das queries).')
@@ -2,12 +2,13 @@ import logging
 import urllib.parse
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
 
 from core.config.settings import DATABASE
 
 from .base import Base
+from .engine import EngineFactory
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +37,8 @@ class DatabaseHandler:
                         f'DRIVER={{{self.driver}}};SERVER={self.server};DATABASE={self.database};UID={self.username};PWD={self.password};'
                     )
                 engine_url = f'mssql+pyodbc:///?odbc_connect={params}'
-                DatabaseHandler._engine = create_engine(engine_url, echo=False)  # echo=True para debug SQL
+                # Pool, opções da sessão e registo das queries (SQL_DEBUG) conforme a configuração
+                DatabaseHandler._engine = EngineFactory.create(engine_url)
 
                 Base.metadata.reflect(bind=DatabaseHandler._engine)
 
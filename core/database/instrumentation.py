@@ -0,0 +1,197 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from core.config.settings import SQL_REPEAT_WARNING, SQL_SLOW_QUERY_MS, SQL_SUMMARY_TOP
+from core.types.types import SqlRunSummary
+
+logger = logging.getLogger(__name__)
+
+# Log próprio das queries lentas (com um ficheiro próprio, ver core.config.logging)
+slow_logger = logging.getLogger(f'{__name__}.slow')
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"N?'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAMETER_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+
+# Tamanho máximo das queries e parâmetros mostrados no log
+_LOG_STATEMENT_CHARS = 300
+
+
+@lru_cache(maxsize=2048)
+def normalize_statement(statement: str) -> str:
+    """
+    Reduz uma query à sua forma, sem valores: os literais passam a '?' e as listas de parâmetros
+    (ex: `IN (?, ?, ?)`) a '?, ...', para que a mesma query com outros valores seja contada junta.
+    """
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _LITERALS.sub('?', shape)
+    return _PARAMETER_LISTS.sub('?, ...', shape)
+
+
+class SqlRunStats:
+    """
+    Contadores das queries de um ciclo (ex: um job do scheduler).
+
+    Args:
+        name: O nome do ciclo, para os logs.
+        repeat_threshold: O número de repetições da mesma query a partir do qual é emitido o aviso N+1.
+    """
+
+    def __init__(self, name: str, repeat_threshold: int):
+        self.name = name
+        self.repeat_threshold = repeat_threshold
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+        self.counts: Counter[str] = Counter()
+        self.seconds: defaultdict[str, float] = defaultdict(float)
+
+    def record(self, shape: str, elapsed: float, slow: bool) -> None:
+        """Regista uma query executada (chamado com o lock do monitor)."""
+        self.queries += 1
+        self.db_seconds += elapsed
+        self.slow_queries += slow
+        self.counts[shape] += 1
+        self.seconds[shape] += elapsed
+
+        # Avisa uma única vez por query, quando ultrapassa o limite
+        if self.repeat_threshold > 0 and self.counts[shape] == self.repeat_threshold + 1:
+            logger.warning(
+                f'[SQL] {self.name}: a mesma query já foi executada mais de {self.repeat_threshold} vezes neste '
+                f'ciclo (possível N+1). Agrupe as leituras numa só query: {shape[:_LOG_STATEMENT_CHARS]}'
+            )
+
+    def summary(self, top: int) -> SqlRunSummary:
+        """Retorna o resumo do ciclo, com as `top` queries mais frequentes."""
+        return {
+            'name': self.name,
+            'elapsed_seconds': round(time.perf_counter() - self.started, 3),
+            'queries': self.queries,
+            'db_seconds': round(self.db_seconds, 3),
+            'slow_queries': self.slow_queries,
+            'distinct_statements': len(self.counts),
+            'top_statements': [
+                (shape, count, round(self.seconds[shape], 3)) for shape, count in self.counts.most_common(top)
+            ],
+        }
+
+
+class SqlMonitor:
+    """
+    Instrumentação das queries SQL de um engine, por ciclo.
+
+    Os eventos `before_cursor_execute`/`after_cursor_execute` medem cada query; durante um ciclo
+    (`run`), o número de queries, o tempo na base de dados e as queries mais repetidas (pela sua
+    forma, sem os valores) são acumulados e registados no fim. As queries mais lentas do que
+    `slow_ms` vão para o log das queries lentas e é emitido um aviso quando a mesma query se
+    repete mais de `repeat_threshold` vezes no ciclo (o padrão N+1). As queries feitas por
+    outras threads durante o ciclo (ex: envios em simultâneo) também são contadas.
+
+    Args:
+        slow_ms: O tempo, em milissegundos, a partir do qual uma query é lenta.
+        repeat_threshold: O número de repetições da mesma query que gera o aviso N+1 (0 desativa).
+        top: O número de queries mais frequentes mostradas no resumo.
+    """
+
+    def __init__(
+        self,
+        slow_ms: float = SQL_SLOW_QUERY_MS,
+        repeat_threshold: int = SQL_REPEAT_WARNING,
+        top: int = SQL_SUMMARY_TOP,
+    ):
+        self.slow_seconds = max(slow_ms, 0.0) / 1000
+        self.repeat_threshold = repeat_threshold
+        self.top = max(top, 0)
+
+        self._runs: list[SqlRunStats] = []
+        self._lock = threading.Lock()
+
+    def install(self, engine: Engine) -> None:
+        """Liga a instrumentação aos eventos do engine."""
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    @contextmanager
+    def run(self, name: str) -> Iterator[SqlRunStats]:
+        """Conta as queries executadas dentro do bloco e regista o resumo no fim."""
+        stats = SqlRunStats(name=name, repeat_threshold=self.repeat_threshold)
+
+        with self._lock:
+            self._runs.append(stats)
+
+        try:
+            yield stats
+        finally:
+            with self._lock:
+                self._runs.remove(stats)
+
+            self.log_summary(stats)
+
+    def log_summary(self, stats: SqlRunStats) -> None:
+        """Regista no log o resumo das queries de um ciclo."""
+        summary = stats.summary(self.top)
+
+        logger.info(
+            f'[SQL] {summary["name"]}: {summary["queries"]} queries ({summary["distinct_statements"]} distintas) '
+            f'em {summary["db_seconds"]:.3f}s na base de dados, num ciclo de {summary["elapsed_seconds"]:.3f}s; '
+            f'{summary["slow_queries"]} lentas.'
+        )
+
+        for shape, count, seconds in summary['top_statements']:
+            logger.info(f'[SQL] {summary["name"]}: {count}x, {seconds:.3f}s - {shape[:_LOG_STATEMENT_CHARS]}')
+
+    @staticmethod
+    def _before_cursor_execute(  # noqa: PLR0913, PLR0917
+        conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+    ) -> None:
+        conn.info.setdefault('sql_monitor_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(  # noqa: PLR0913, PLR0917
+        self, conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+    ) -> None:
+        started = conn.info.get('sql_monitor_started')
+
+        if not started:
+            return
+
+        elapsed = time.perf_counter() - started.pop()
+        slow = elapsed >= self.slow_seconds
+
+        if slow:
+            batch = ' (executemany)' if executemany else ''
+            slow_logger.warning(
+                f'Query lenta{batch} ({elapsed * 1000:.0f} ms): {statement[:_LOG_STATEMENT_CHARS]} '
+                f'| parâmetros: {str(parameters)[:_LOG_STATEMENT_CHARS]}'
+            )
+
+        if not self._runs:
+            return
+
+        shape = normalize_statement(statement)
+
+        with self._lock:
+            for stats in self._runs:
+                stats.record(shape, elapsed, slow)
+
+    @staticmethod
+    def _handle_error(exception_context: Any) -> None:
+        # A query falhou: descarta o início registado, que não terá `after_cursor_execute`
+        connection = exception_context.connection
+
+        if connection is not None and connection.info.get('sql_monitor_started'):
+            connection.info['sql_monitor_started'].pop()
+
+
+# Monitor SQL partilhado pela aplicação (instalado no engine do DatabaseManager)
+sql_monitor = SqlMonitor()
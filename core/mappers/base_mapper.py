@@ -1,17 +1,14 @@
 from pathlib import Path
-from typing import TYPE_CHECKING, Any
+from typing import Any
 
 import lxml.etree as etree  # noqa: PLR0402
 
 from core.config.settings import NS_CAC, NS_CBC
 from core.models.sales_invoice import SalesInvoice
-from core.types.types import InvoiceXmlData, OrderReference
+from core.types.types import InvoiceXmlData, OrderReference, ProjectionProfile
 from core.utils.conversions import Conversions
 from core.utils.local_menus import InvoiceOrigin, InvoiceType, TaxLevelCode
 
-if TYPE_CHECKING:
-    from core.utils.generics import Generics
-
 
 class BaseMapper:
     """
@@ -21,6 +18,13 @@ class BaseMapper:
     Cada cliente terá a sua própria implementação desta classe.
     """
 
+    # Colunas lidas pelos métodos deste mapper, que se juntam às colunas do perfil CIUS-PT
+    # base quando as faturas são carregadas (ver `XML_COLUMN_PROJECTION`).
+    # Um atributo não declarado aqui não é carregado e dá erro ao ser lido.
+    projection_columns: ProjectionProfile = {
+        'invoice_detail': ['productDescriptionUserLanguage'],
+    }
+
     def get_buyer_reference(self, invoice: SalesInvoice) -> str | None:  # noqa: PLR6301
         """
         Retorna a Referência do Cliente (BT-10) a ser usada no XML.
@@ -65,11 +69,27 @@ class BaseMapper:
         Args:
             invoice: O objeto SalesInvoice principal.
         Returns:
-            Um dicionário com 'schemeID' e 'value', ou None se não aplicável.
+            Um dicionário com 'schemeID', 'type_code', 'description', 'file_name' e o PDF
+            ('pdf_path' com o caminho do ficheiro, ou 'pdf_base64' com o conteúdo já codificado),
+            ou None se não aplicável.
         """
 
         return None
 
+    def get_fingerprint_parts(self, invoice: SalesInvoice) -> list[str]:  # noqa: PLR6301
+        """
+        Retorna valores adicionais a incluir na impressão digital dos dados de origem da fatura.
+
+        A impressão digital decide se o XML já gerado pode ser reutilizado. Classes filhas
+        que usem dados fora das tabelas da fatura (ex: um PDF anexo) devem incluí-los aqui,
+        para que uma alteração nesses dados obrigue a gerar o XML de novo.
+
+        Args:
+            invoice: O objeto SalesInvoice principal.
+        """
+
+        return []
+
     def save_invoice_xml(self, xml_tree: etree._Element, context: InvoiceXmlData) -> Path | None:  # noqa: PLR6301
         """
         Salva o conteúdo XML gerado em um ficheiro.
@@ -83,6 +103,20 @@ class BaseMapper:
 
         return None
 
+    def get_invoice_xml_path(self, context: InvoiceXmlData) -> Path | None:  # noqa: PLR6301
+        """
+        Retorna o caminho do ficheiro XML da fatura, criando a pasta se necessário.
+
+        Usado pela escrita incremental do XML (`XML_STREAMING_WRITER`), que escreve o
+        documento diretamente no ficheiro. O comportamento padrão é não indicar nenhum
+        caminho, caso em que o XML é construído em memória e guardado por `save_invoice_xml`.
+
+        Args:
+            context: Informações adicionais sobre a fatura para nomeação do ficheiro.
+        """
+
+        return None
+
     def build_invoice_line(self, parent: etree._Element, currency: str, category: int, detail: Any) -> None:  # noqa: PLR6301
         """
         Constrói a linha da fatura no XML.
@@ -96,6 +130,10 @@ class BaseMapper:
             detail: O detalhe específico da linha da fatura.
         """
 
+        # Importação local: o módulo generics importa este módulo (carregamento dos mappers), pelo que
+        # não pode ser importado no topo; importado só em TYPE_CHECKING, dava NameError ao gerar as linhas
+        from core.utils.generics import Generics  # noqa: PLC0415
+
         # Bloco Principal <cac:InvoiceLine>
         if category == InvoiceType.INVOICE:
             label = ('Invoice', 'InvoicedQuantity')
@@ -1,10 +1,10 @@
 import datetime
 
-from sqlalchemy import Date, DateTime, Index, PrimaryKeyConstraint, Unicode, text
+from sqlalchemy import Date, DateTime, Index, Integer, PrimaryKeyConstraint, Unicode, text
 from sqlalchemy.dialects.mssql import TINYINT
 from sqlalchemy.orm import Mapped, mapped_column
 
-from core.config.settings import DATABASE, DB_COLLATION, DEFAULT_LEGACY_DATE
+from core.config.settings import DATABASE, DB_COLLATION, DEFAULT_LEGACY_DATE, DEFAULT_LEGACY_DATETIME
 from core.database.base import Base
 
 from .mixins import AuditMixin, PrimaryKeyMixin
@@ -28,6 +28,11 @@ class SaphetyApiControl(Base, AuditMixin, PrimaryKeyMixin):
     notificationStatus: Mapped[int] = mapped_column('STANOT_0', TINYINT, default=text('((1))'))
     requestId: Mapped[str] = mapped_column('REQUESTID_0', Unicode(50, collation=DB_COLLATION), default=text("''"))
     financialId: Mapped[str] = mapped_column('OUTFINID_0', Unicode(50, collation=DB_COLLATION), default=text("''"))
+    # Coluna criada por sql/001_ysaphctl_source_fingerprint.sql
+    sourceFingerprint: Mapped[str] = mapped_column('SRCHASH_0', Unicode(64, collation=DB_COLLATION), default=text("''"))
+    # Colunas criadas por sql/002_ysaphctl_check_schedule.sql (também na vista YVWSAPHCTL)
+    nextCheckAt: Mapped[datetime.datetime] = mapped_column('NXTCHKDAT_0', DateTime, default=DEFAULT_LEGACY_DATETIME)
+    checkAttempts: Mapped[int] = mapped_column('CHKATT_0', Integer, default=text('((0))'))
 
 
 class APIControlView(Base):
@@ -49,6 +54,9 @@ class APIControlView(Base):
     notificationStatus: Mapped[int] = mapped_column('STANOT_0', TINYINT)
     requestId: Mapped[str] = mapped_column('REQUESTID_0', Unicode(50, collation=DB_COLLATION))
     financialId: Mapped[str] = mapped_column('OUTFINID_0', Unicode(50, collation=DB_COLLATION))
+    # Colunas acrescentadas à vista por sql/002_ysaphctl_check_schedule.sql
+    nextCheckAt: Mapped[datetime.datetime] = mapped_column('NXTCHKDAT_0', DateTime)
+    checkAttempts: Mapped[int] = mapped_column('CHKATT_0', Integer)
     createDatetime: Mapped[datetime.datetime] = mapped_column('CREDATTIM_0', DateTime, nullable=False)
     updateDatetime: Mapped[datetime.datetime] = mapped_column('UPDDATTIM_0', DateTime, nullable=False)
     company: Mapped[str] = mapped_column('CPY_0', Unicode(5, collation=DB_COLLATION))
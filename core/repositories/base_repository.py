@@ -1,13 +1,18 @@
-from typing import Any, Generic, Optional, Type, TypeVar
+from contextlib import AbstractContextManager
+from typing import Any, Callable, Generic, Iterator, Optional, Type, TypeVar
 
 from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session, load_only
 
+from core.config.settings import DB_PAGE_SIZE
 from core.database.base import Base
 
 ModelType = TypeVar('ModelType', bound=Base)
 
+# Linhas de leitura (NamedTuple) cujos campos são atributos do modelo
+RowType = TypeVar('RowType', bound=tuple)
+
 
 class GenericRepository(Generic[ModelType]):
     """Fornece uma implementação base para operações de acesso a dados (CRUD).
@@ -26,6 +31,10 @@ class GenericRepository(Generic[ModelType]):
                o repositório irá trabalhar.
     """
 
+    # O SQL Server aceita no máximo 2100 parâmetros por instrução, por isso as
+    # listas usadas em cláusulas IN são divididas em blocos deste tamanho.
+    MAX_IN_PARAMETERS = 2000
+
     def __init__(self, model: Type[ModelType]):
         """
         Inicializa o repositório genérico.
@@ -146,13 +155,7 @@ class GenericRepository(Generic[ModelType]):
 
         # Adiciona ordenação (ORDER BY)
         if order_by:
-            order_clauses = []
-            for field in order_by:
-                if field.startswith('-'):
-                    order_clauses.append(getattr(self.model, field[1:]).desc())
-                else:
-                    order_clauses.append(getattr(self.model, field).asc())
-            stmt = stmt.order_by(*order_clauses)
+            stmt = stmt.order_by(*self._build_order_by(order_by))
 
         # Adiciona limite (LIMIT / TOP)
         if limit:
@@ -161,6 +164,149 @@ class GenericRepository(Generic[ModelType]):
         result = session.execute(stmt)
         return list(result.scalars().all())
 
+    def find_rows(  # noqa: PLR0913, PLR0917
+        self,
+        session: Session,
+        row_type: Type[RowType],
+        where_clauses: Optional[dict[str, tuple[str, Any]]] = None,
+        order_by: Optional[list[str]] = None,
+        limit: Optional[int] = None,
+    ) -> list[RowType]:
+        """
+        Busca só as colunas indicadas, para leitura, sem criar objetos do modelo.
+
+        As colunas selecionadas são os campos de `row_type` (um NamedTuple com os nomes dos
+        atributos do modelo) e cada linha é retornada como um `row_type`: imutável, sem
+        `__dict__` e fora do identity map da sessão, pelo que não é seguida nem atualizada.
+        Os filtros e a ordenação são os de `find`.
+
+        Args:
+            session: A sessão SQLAlchemy ativa.
+            row_type: O NamedTuple das linhas. Ex: `class PendingRow(NamedTuple): invoiceNumber: str`
+            where_clauses (Dict[str, Tuple[str, Any]], optional): Condições para o WHERE.
+            order_by (List[str], optional): Colunas para ordenação. Use '-' para DESC (ex: ['-data', 'nome']).
+            limit (int, optional): Número máximo de registros a retornar.
+
+        Returns:
+            Uma lista de linhas `row_type` correspondentes aos critérios.
+        """
+        stmt = select(*self._get_columns(row_type._fields))  # type: ignore[attr-defined]
+
+        # Adiciona filtros (WHERE)
+        if where_clauses:
+            filters = self._build_filters(self.model, where_clauses)
+            if filters:
+                stmt = stmt.where(*filters)
+
+        # Adiciona ordenação (ORDER BY)
+        if order_by:
+            stmt = stmt.order_by(*self._build_order_by(order_by))
+
+        # Adiciona limite (LIMIT / TOP)
+        if limit:
+            stmt = stmt.limit(limit)
+
+        make_row = row_type._make  # type: ignore[attr-defined]
+        return [make_row(row) for row in session.execute(stmt)]
+
+    def iter_batches(  # noqa: PLR0913, PLR0917
+        self,
+        session_factory: Callable[[], AbstractContextManager[Session]],
+        key: str,
+        where_clauses: Optional[dict[str, tuple[str, Any]]] = None,
+        page_size: int = DB_PAGE_SIZE,
+        row_type: Optional[Type[RowType]] = None,
+    ) -> Iterator[list[Any]]:
+        """
+        Percorre os registos por páginas, pela ordem de uma chave única e crescente (paginação por chave).
+
+        Cada página é lida numa sessão própria, aberta por `session_factory` e fechada antes de a
+        página ser entregue, pelo que nenhuma sessão (nem lock) fica aberta enquanto quem chama
+        processa os registos. A página seguinte continua a partir do último valor da chave
+        (`key > último`) em vez de um OFFSET: todas as leituras usam o índice da chave e os registos
+        alterados entretanto (ex: que deixam de cumprir os filtros) não fazem saltar os restantes.
+
+        Args:
+            session_factory: Função que abre uma sessão num context manager. Ex: `db.get_db`
+            key: O atributo do modelo usado para paginar, único e crescente. Ex: 'id' (ROWID), 'invoiceNumber'
+            where_clauses (Dict[str, Tuple[str, Any]], optional): Condições para o WHERE, como em `find`.
+            page_size (int, optional): Número máximo de registos por página.
+            row_type (optional): Se indicado, as páginas são linhas `row_type` (como em `find_rows`),
+                que têm de incluir a chave; senão, são objetos do modelo, já fora da sessão.
+
+        Yields:
+            As páginas de registos, pela ordem da chave, até não haver mais.
+        """
+        if page_size < 1:
+            raise ValueError(f'O tamanho da página tem de ser positivo (recebido: {page_size}).')
+
+        key_column = self._get_columns((key,))[0]
+
+        if row_type is None:
+            stmt = select(self.model)
+        else:
+            fields = row_type._fields  # type: ignore[attr-defined]
+
+            if key not in fields:
+                raise ValueError(f"A chave '{key}' tem de ser um dos campos de '{row_type.__name__}'.")
+
+            stmt = select(*self._get_columns(fields))
+
+        # Adiciona filtros (WHERE)
+        if where_clauses:
+            filters = self._build_filters(self.model, where_clauses)
+            if filters:
+                stmt = stmt.where(*filters)
+
+        stmt = stmt.order_by(key_column.asc()).limit(page_size)
+        last_key = None
+
+        while True:
+            page_stmt = stmt if last_key is None else stmt.where(key_column > last_key)
+
+            with session_factory() as session:
+                if row_type is None:
+                    page = list(session.execute(page_stmt).scalars().all())
+                    # Os objetos continuam utilizáveis (só com os atributos já carregados) depois de a sessão fechar
+                    session.expunge_all()
+                else:
+                    make_row = row_type._make  # type: ignore[attr-defined]
+                    page = [make_row(row) for row in session.execute(page_stmt)]
+
+            if not page:
+                return
+
+            last_key = getattr(page[-1], key)
+            yield page
+
+            # Uma página incompleta é a última: poupa a leitura de uma página vazia
+            if len(page) < page_size:
+                return
+
+    def _get_columns(self, names: tuple[str, ...]) -> list[Any]:
+        """Retorna os atributos do modelo com os nomes indicados."""
+        columns = []
+
+        for name in names:
+            column_attr = getattr(self.model, name, None)
+
+            if column_attr is None:
+                raise AttributeError(f"O modelo '{self.model.__name__}' não possui o atributo '{name}'.")
+
+            columns.append(column_attr)
+
+        return columns
+
+    def _build_order_by(self, order_by: list[str]) -> list[Any]:
+        """Traduz a lista de ordenação (ex: ['-data', 'nome']) nas cláusulas ORDER BY do modelo."""
+        order_clauses = []
+        for field in order_by:
+            if field.startswith('-'):
+                order_clauses.append(getattr(self.model, field[1:]).desc())
+            else:
+                order_clauses.append(getattr(self.model, field).asc())
+        return order_clauses
+
     def find_with_joins(  # noqa: PLR0913, PLR0917
         self,
         session: Session,
@@ -1,7 +1,8 @@
 import logging
+from itertools import batched
 from typing import Optional
 
-from sqlalchemy import select
+from sqlalchemy import insert, select, update
 from sqlalchemy.orm import Session
 
 from core.models.saphety_control import SaphetyApiControl
@@ -25,7 +26,11 @@ class ControlRepository(GenericRepository[SaphetyApiControl]):
         'requestStatus': 'requestStatus',
         'integrationStatus': 'integrationStatus',
         'notificationStatus': 'notificationStatus',
+        'requestId': 'requestId',
         'financialId': 'financialId',
+        'sourceFingerprint': 'sourceFingerprint',
+        'nextCheckAt': 'nextCheckAt',
+        'checkAttempts': 'checkAttempts',
     }
 
     def get_by_invoice_number(self, session: Session, invoice_number: str) -> Optional[SaphetyApiControl]:  # noqa: PLR6301
@@ -33,6 +38,32 @@ class ControlRepository(GenericRepository[SaphetyApiControl]):
         stmt = select(SaphetyApiControl).where(SaphetyApiControl.invoiceNumber == invoice_number)
         return session.execute(stmt).scalar_one_or_none()
 
+    def get_fingerprints(self, session: Session, invoice_numbers: list[str]) -> dict[str, tuple[str, str]]:
+        """
+        Busca a impressão digital dos dados de origem e o ficheiro XML guardados para um conjunto de faturas.
+
+        Args:
+            session: A sessão SQLAlchemy ativa.
+            invoice_numbers: Os números das faturas a consultar.
+
+        Returns:
+            Um dicionário indexado pelo número da fatura com o par (impressão digital, ficheiro).
+            Faturas sem impressão digital registada não aparecem no dicionário.
+        """
+        fingerprints: dict[str, tuple[str, str]] = {}
+
+        for chunk in batched(invoice_numbers, self.MAX_IN_PARAMETERS):
+            stmt = select(
+                SaphetyApiControl.invoiceNumber, SaphetyApiControl.sourceFingerprint, SaphetyApiControl.filename
+            ).where(SaphetyApiControl.invoiceNumber.in_(chunk))
+
+            # As faturas sem impressão digital (vazia) ficam de fora
+            for invoice_number, fingerprint, filename in session.execute(stmt):
+                if fingerprint:
+                    fingerprints[invoice_number] = (fingerprint, filename)
+
+        return fingerprints
+
     def create_or_update_record(self, session: Session, data: ControlArgs) -> SaphetyApiControl:  # noqa: PLR0912
         """
         Cria um novo registo de controlo ou atualiza um existente.
@@ -80,3 +111,63 @@ class ControlRepository(GenericRepository[SaphetyApiControl]):
             session.add(control_record)
 
         return control_record
+
+    def bulk_upsert(self, session: Session, records: list[ControlArgs]) -> int:
+        """
+        Cria ou atualiza vários registos de controlo com poucas instruções.
+
+        Os registos existentes são identificados com uma única query limitada por `IN` (por bloco)
+        e depois atualizados pela chave primária, e os novos inseridos, ambos com `executemany`.
+        Vários registos para a mesma fatura são fundidos pela ordem recebida (o último valor prevalece).
+
+        Args:
+            session: A sessão SQLAlchemy ativa.
+            records: Os argumentos de controlo a registar.
+
+        Returns:
+            O número de faturas afetadas.
+        """
+        merged: dict[str, dict] = {}
+
+        for data in records:
+            invoice_number = data.get('invoice_number')
+            if not invoice_number:
+                raise ValueError("Parâmetro 'invoice_number' é obrigatório.")
+
+            fields = merged.setdefault(invoice_number, {})
+            fields.update({self._FIELD_MAP[key]: value for key, value in data.items() if key in self._FIELD_MAP})
+
+        if not merged:
+            return 0
+
+        # Identifica os registos que já existem
+        existing: dict[str, int] = {}
+
+        for chunk in batched(merged, self.MAX_IN_PARAMETERS):
+            stmt = select(SaphetyApiControl.invoiceNumber, SaphetyApiControl.id).where(
+                SaphetyApiControl.invoiceNumber.in_(chunk)
+            )
+            existing.update({invoice_number: row_id for invoice_number, row_id in session.execute(stmt)})
+
+        updates = [
+            {'id': existing[invoice_number], **fields}
+            for invoice_number, fields in merged.items()
+            if invoice_number in existing and fields
+        ]
+
+        # Remove chaves com valor None para não sobrepor defaults do modelo
+        inserts = [
+            {'invoiceNumber': invoice_number, **{k: v for k, v in fields.items() if v is not None}}
+            for invoice_number, fields in merged.items()
+            if invoice_number not in existing
+        ]
+
+        logger.debug(f'Registos de controlo: {len(updates)} a atualizar e {len(inserts)} a criar.')
+
+        if updates:
+            session.execute(update(SaphetyApiControl), updates)
+
+        if inserts:
+            session.execute(insert(SaphetyApiControl), inserts)
+
+        return len(merged)
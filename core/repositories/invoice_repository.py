@@ -6,15 +6,21 @@ cabeçalhos (SINVOICE) e entidades relacionadas.
 """
 
 import logging
-from typing import Optional
+from collections import defaultdict
+from itertools import batched
+from typing import Iterator, Optional
 
 from sqlalchemy.orm import Session, joinedload, load_only
-from sqlalchemy.sql import and_, or_, select
+from sqlalchemy.sql import Select, and_, func, or_, select
 
+from core.models.business_partner import BusinessPartner
 from core.models.customer import Customer
 from core.models.sales_invoice import CustomerInvoiceHeader, SalesInvoice, SalesInvoiceDetail, SalesInvoiceTax
 from core.models.saphety_control import SaphetyApiControl
-from core.utils.local_menus import NoYes
+from core.repositories.base_repository import GenericRepository
+from core.types.types import TaxSubtotal
+from core.utils.generics import Generics
+from core.utils.local_menus import NoYes, TaxLevelCode
 
 logger = logging.getLogger(__name__)
 
@@ -25,13 +31,17 @@ class SalesInvoiceRepository:
     This class provides methods to interact with the sales invoice data.
     """
 
-    def fetch_pending_invoices(  # noqa: PLR6301
+    MAX_IN_PARAMETERS = GenericRepository.MAX_IN_PARAMETERS
+
+    def fetch_pending_invoices(  # noqa: PLR0913, PLR6301
         self,
         session: Session,
         invoice_number: Optional[str] = None,
         invoice_cols: Optional[list[str]] = None,
         invoice_header_cols: Optional[list[str]] = None,
         customer_cols: Optional[list[str]] = None,
+        *,
+        business_partner_cols: Optional[list[str]] = None,
     ) -> list[SalesInvoice]:  # noqa: PLR6301
         """
         Search invoices marked as CIUS-PT invoice and not yet processed.
@@ -42,61 +52,168 @@ class SalesInvoiceRepository:
             invoice_header_cols (Optional[list[str]]): List of invoice header column names to load. If None,
             load default columns.
             customer_cols (Optional[list[str]]): List of customer column names to load. If None, load default columns.
+            business_partner_cols (Optional[list[str]]): List of business partner column names to load (through
+            the customer). If None, load default columns.
+            Columns not listed are not loaded and raise an error if accessed, instead of issuing a query per row.
         Returns:
             list[SalesInvoice]: A list of SalesInvoice instances with customers data.
         """
         logger.info('Fetching pending invoices from SalesInvoice table.')
 
         try:
-            stmt = select(SalesInvoice)
+            stmt = self._pending_invoices_stmt(
+                invoice_number=invoice_number,
+                invoice_cols=invoice_cols,
+                invoice_header_cols=invoice_header_cols,
+                customer_cols=customer_cols,
+                business_partner_cols=business_partner_cols,
+            )
 
-            query = []
+            records = session.execute(stmt).scalars().all()
 
-            if invoice_cols:
-                query.append(load_only(*[getattr(SalesInvoice, col) for col in invoice_cols]))
+            logger.info(f'Fetched {len(records)} pending invoices from SalesInvoice table.')
+            return list(records)
 
-            header_loader = joinedload(SalesInvoice.invoice_header)
+        except Exception:
+            # Loga a exceção completa (incluindo o traceback)
+            logger.exception('Ocorreu um erro inesperado ao buscar faturas pendentes na base de dados.')
+            # Relança a exceção para que a camada de serviço que chamou este método
+            # possa lidar com ela (ex: fazendo um rollback da transação).
+            raise
 
-            if invoice_header_cols:
-                header_loader = header_loader.load_only(*[
-                    getattr(CustomerInvoiceHeader, col) for col in invoice_header_cols
-                ])
+    def stream_pending_invoices(  # noqa: PLR0913, PLR0917
+        self,
+        session: Session,
+        chunk_size: int,
+        invoice_number: Optional[str] = None,
+        invoice_cols: Optional[list[str]] = None,
+        invoice_header_cols: Optional[list[str]] = None,
+        customer_cols: Optional[list[str]] = None,
+        business_partner_cols: Optional[list[str]] = None,
+    ) -> Iterator[list[SalesInvoice]]:
+        """
+        Percorre as faturas pendentes em blocos de `chunk_size`, sem carregar o resultado completo.
 
-            customer_loader = joinedload(SalesInvoice.customer)
+        Cada bloco é lido por inteiro com uma query própria, pela ordem do número da fatura, e o
+        seguinte continua a partir do último número lido (paginação por chave, como em
+        `GenericRepository.iter_batches`). Nenhum cursor fica aberto enquanto o bloco é tratado:
+        com o READ COMMITTED do SQL Server (com locks), um cursor a meio da leitura pode manter
+        locks em YSAPHCTL e bloquear as gravações da tabela de controlo feitas pela mesma thread
+        noutra sessão, sem que o servidor o detete como deadlock. As faturas registadas entretanto
+        (que deixam de estar pendentes) não fazem saltar as restantes.
 
-            if customer_cols:
-                customer_loader = customer_loader.load_only(*[getattr(Customer, col) for col in customer_cols])
+        Args:
+            session (Session): A sessão dedicada à leitura das faturas.
+            chunk_size (int): O número de faturas por bloco.
+            invoice_number (Optional[str]): O número da fatura a filtrar. Se None, percorre todas as pendentes.
+            invoice_cols, invoice_header_cols, customer_cols, business_partner_cols: Ver `fetch_pending_invoices`.
 
-            query.append(customer_loader)
-            query.append(header_loader)
+        Yields:
+            list[SalesInvoice]: Os blocos de faturas, com os dados do cabeçalho e do cliente.
+        """
+        logger.info(f'Streaming pending invoices from SalesInvoice table in chunks of {chunk_size}.')
 
-            stmt = stmt.outerjoin(SalesInvoice.control)
+        try:
+            stmt = (
+                self
+                ._pending_invoices_stmt(
+                    invoice_number=invoice_number,
+                    invoice_cols=invoice_cols,
+                    invoice_header_cols=invoice_header_cols,
+                    customer_cols=customer_cols,
+                    business_partner_cols=business_partner_cols,
+                )
+                .order_by(SalesInvoice.invoiceNumber)
+                .limit(chunk_size)
+            )
 
-            conditions = [
-                SalesInvoice.isSaphety == NoYes.YES.value,
-                or_(SalesInvoice.control == None, SalesInvoice.control.has(SaphetyApiControl.status.in_([3, 4]))),  # noqa: E711
-            ]
+            total = 0
+            last_invoice_number = None
 
-            if invoice_number:
-                # Filter by invoice number if provided (by CLI argument)
-                logger.info(f'Filtering by invoice number: {invoice_number}')
-                conditions.append(SalesInvoice.invoiceNumber == invoice_number)
+            while True:
+                page_stmt = (
+                    stmt
+                    if last_invoice_number is None
+                    else stmt.where(SalesInvoice.invoiceNumber > last_invoice_number)
+                )
 
-            stmt = stmt.where(and_(*conditions))
-            stmt = stmt.options(*query)
+                # Lê o bloco inteiro, para o cursor fechar antes de o bloco ser tratado
+                chunk = list(session.execute(page_stmt).scalars().all())
 
-            records = session.execute(stmt).scalars().all()
+                if not chunk:
+                    break
 
-            logger.info(f'Fetched {len(records)} pending invoices from SalesInvoice table.')
-            return list(records)
+                total += len(chunk)
+                last_invoice_number = chunk[-1].invoiceNumber
+                yield chunk
+
+                if len(chunk) < chunk_size:
+                    break
+
+            logger.info(f'Streamed {total} pending invoices from SalesInvoice table.')
 
         except Exception:
-            # Loga a exceção completa (incluindo o traceback)
-            logger.exception('Ocorreu um erro inesperado ao buscar faturas pendentes na base de dados.')
-            # Relança a exceção para que a camada de serviço que chamou este método
-            # possa lidar com ela (ex: fazendo um rollback da transação).
+            logger.exception('Ocorreu um erro inesperado ao percorrer as faturas pendentes na base de dados.')
             raise
 
+    @staticmethod
+    def _pending_invoices_stmt(
+        invoice_number: Optional[str] = None,
+        invoice_cols: Optional[list[str]] = None,
+        invoice_header_cols: Optional[list[str]] = None,
+        customer_cols: Optional[list[str]] = None,
+        business_partner_cols: Optional[list[str]] = None,
+    ) -> Select:
+        """Constrói a query das faturas CIUS-PT ainda não processadas (ou com erro)."""
+        stmt = select(SalesInvoice)
+
+        query = []
+
+        if invoice_cols:
+            query.append(load_only(*[getattr(SalesInvoice, col) for col in invoice_cols], raiseload=True))
+
+        header_loader = joinedload(SalesInvoice.invoice_header)
+
+        if invoice_header_cols:
+            header_loader = header_loader.load_only(
+                *[getattr(CustomerInvoiceHeader, col) for col in invoice_header_cols], raiseload=True
+            )
+
+        customer_loader = joinedload(SalesInvoice.customer)
+
+        customer_options = []
+
+        if customer_cols:
+            customer_options.append(load_only(*[getattr(Customer, col) for col in customer_cols], raiseload=True))
+
+        if business_partner_cols:
+            customer_options.append(
+                joinedload(Customer.business_partner).load_only(
+                    *[getattr(BusinessPartner, col) for col in business_partner_cols], raiseload=True
+                )
+            )
+
+        if customer_options:
+            customer_loader = customer_loader.options(*customer_options)
+
+        query.append(customer_loader)
+        query.append(header_loader)
+
+        stmt = stmt.outerjoin(SalesInvoice.control)
+
+        conditions = [
+            SalesInvoice.isSaphety == NoYes.YES.value,
+            or_(SalesInvoice.control == None, SalesInvoice.control.has(SaphetyApiControl.status.in_([3, 4]))),  # noqa: E711
+        ]
+
+        if invoice_number:
+            # Filter by invoice number if provided (by CLI argument)
+            logger.info(f'Filtering by invoice number: {invoice_number}')
+            conditions.append(SalesInvoice.invoiceNumber == invoice_number)
+
+        stmt = stmt.where(and_(*conditions))
+        return stmt.options(*query)
+
     def fetch_details_for_invoice(self, session: Session, invoice_number: str) -> list[SalesInvoiceDetail]:  # noqa: PLR6301
         """Busca todas as linhas de detalhe para um número de fatura específico."""
         logger.info(f'Buscar linhas de detalhe para a fatura {invoice_number}...')
@@ -118,3 +235,89 @@ class SalesInvoiceRepository:
 
         logger.info(f'Encontradas {len(records)} linhas de impostos para a fatura {invoice_number}.')
         return list(records)
+
+    def fetch_details_for_invoices(
+        self, session: Session, invoice_numbers: list[str], detail_cols: Optional[list[str]] = None
+    ) -> dict[str, list[SalesInvoiceDetail]]:
+        """
+        Busca as linhas de detalhe de um conjunto de faturas com queries limitadas por `IN`.
+
+        Args:
+            session: A sessão SQLAlchemy ativa.
+            invoice_numbers: Os números das faturas a carregar.
+            detail_cols: As colunas das linhas a carregar. Se None, carrega todas.
+
+        Returns:
+            Um dicionário indexado pelo número da fatura com as respetivas linhas,
+            ordenadas pelo número de linha. Faturas sem linhas não aparecem no dicionário.
+        """
+        details: dict[str, list[SalesInvoiceDetail]] = defaultdict(list)
+
+        for chunk in batched(invoice_numbers, self.MAX_IN_PARAMETERS):
+            stmt = (
+                select(SalesInvoiceDetail)
+                .where(SalesInvoiceDetail.invoiceNumber.in_(chunk))
+                .order_by(SalesInvoiceDetail.invoiceNumber, SalesInvoiceDetail.lineNumber)
+            )
+
+            if detail_cols:
+                stmt = stmt.options(
+                    load_only(*[getattr(SalesInvoiceDetail, col) for col in detail_cols], raiseload=True)
+                )
+
+            for record in session.execute(stmt).scalars():
+                details[record.invoiceNumber].append(record)
+
+        logger.info(f'Encontradas linhas de detalhe para {len(details)} de {len(invoice_numbers)} faturas.')
+        return dict(details)
+
+    def fetch_tax_subtotals_for_invoices(  # noqa: PLR6301
+        self, session: Session, invoice_numbers: list[str]
+    ) -> dict[str, list[TaxSubtotal]]:
+        """
+        Busca o resumo de impostos CIUS-PT de um conjunto de faturas, já agregado na base de dados.
+
+        As linhas de SVCRVAT são somadas com `GROUP BY` por fatura e taxa, pelo que só é
+        transferida uma linha por taxa de IVA (a categoria CIUS-PT é determinada pela taxa).
+        Os subtotais de cada fatura seguem a ordem da primeira linha de cada taxa (ROWID),
+        a mesma da agregação feita a partir das linhas.
+
+        Args:
+            session: A sessão SQLAlchemy ativa.
+            invoice_numbers: Os números das faturas a carregar.
+
+        Returns:
+            Um dicionário indexado pelo número da fatura com os respetivos subtotais.
+            Faturas sem impostos não aparecem no dicionário.
+        """
+        subtotals: dict[str, list[TaxSubtotal]] = defaultdict(list)
+
+        for chunk in batched(invoice_numbers, self.MAX_IN_PARAMETERS):
+            stmt = (
+                select(
+                    SalesInvoiceTax.invoiceNumber,
+                    SalesInvoiceTax.rate,
+                    func.sum(SalesInvoiceTax.taxBasis),
+                    func.sum(SalesInvoiceTax.taxAmount),
+                    func.count(),
+                    func.sum(SalesInvoiceTax.updateChanges),
+                    func.max(SalesInvoiceTax.updateDatetime),
+                )
+                .where(SalesInvoiceTax.invoiceNumber.in_(chunk))
+                .group_by(SalesInvoiceTax.invoiceNumber, SalesInvoiceTax.rate)
+                .order_by(SalesInvoiceTax.invoiceNumber, func.min(SalesInvoiceTax.id))
+            )
+
+            for invoice_number, rate, taxable, tax, rows, changes, changed_at in session.execute(stmt):
+                subtotals[invoice_number].append({
+                    'category': Generics.get_enum_name(TaxLevelCode, int(rate)),
+                    'rate': rate,
+                    'taxable_amount': taxable,
+                    'tax_amount': tax,
+                    'rows': rows,
+                    'update_changes': changes,
+                    'update_datetime': changed_at,
+                })
+
+        logger.info(f'Encontrados subtotais de impostos para {len(subtotals)} de {len(invoice_numbers)} faturas.')
+        return dict(subtotals)
@@ -1,15 +1,16 @@
 import logging
 from http import HTTPStatus
 
+from core.api.transport import SaphetyTransport
 from core.auth.auth import Auth
-from core.config import settings
 
 logger = logging.getLogger(__name__)
 
 
 class AuthenticationService:
-    def __init__(self):
-        self.auth = Auth(settings.SERVER_BASE_ADDRESS)
+    def __init__(self, transport: SaphetyTransport | None = None):
+        self.transport = transport or SaphetyTransport.default()
+        self.auth = Auth(self.transport.base_url, transport=self.transport)
 
     def login(self, username: str, password: str) -> str | None:
         """Este endpoint é usado para obter um token de autenticação necessário para acessar a
@@ -1,13 +1,22 @@
 import logging
+from contextlib import AbstractContextManager, contextmanager
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Callable, Iterator
 
 from sqlalchemy.orm import Session
 
+from core.config.settings import DEFAULT_LEGACY_DATETIME
 from core.models.saphety_control import APIControlView, SaphetyApiControl
 from core.repositories.control_api_repository import ControlApiRepository
 from core.repositories.control_repository import ControlRepository
-from core.types.types import ControlArgs
+from core.types.types import (
+    ControlArgs,
+    InFlightRequestRow,
+    InvoiceCheckRow,
+    InvoiceStatusRow,
+    PendingInvoiceRow,
+)
+from core.utils.check_schedule import CheckSchedule
 from core.utils.local_menus import SaphetyIntegrationStatus, SaphetyRequestStatus, SaphetyStatus
 
 logger = logging.getLogger(__name__)
@@ -22,18 +31,53 @@ class ControlService:
         self.control_repo = ControlRepository(SaphetyApiControl)
         self.api_repo = ControlApiRepository(APIControlView)
 
+        # Alterações acumuladas enquanto um bloco `batch` está ativo
+        self._pending_records: list[ControlArgs] | None = None
+
     def _update_record(self, session: Session, data: ControlArgs):
         """
         Método auxiliar central que cria ou atualiza um registo de controlo.
 
+        Dentro de um bloco `batch`, a alteração é acumulada e gravada no fim do bloco.
+
         Args:
             session: A sessão SQLAlchemy ativa.
             data: Os dados a serem atualizados.
         """
+        if self._pending_records is not None:
+            self._pending_records.append(dict(data))
+            return
+
         self.control_repo.create_or_update_record(session=session, data=data)
 
-    def mark_as_generated(self, session: Session, invoice_number: str, file_path: str):
-        """Regista que o XML de uma fatura foi gerado com sucesso."""
+    def update_records(self, session: Session, records: list[ControlArgs]) -> None:
+        """Cria ou atualiza vários registos de controlo de uma só vez."""
+        if not records:
+            return
+
+        affected = self.control_repo.bulk_upsert(session=session, records=records)
+        logger.info(f'{affected} registos de controlo gravados.')
+
+    @contextmanager
+    def batch(self, session: Session) -> Iterator[None]:
+        """
+        Acumula as alterações feitas pelos métodos do serviço e grava-as de uma só vez no fim do bloco.
+
+        O commit continua a ser da responsabilidade de quem chama. Se o bloco terminar com
+        uma exceção, as alterações acumuladas são descartadas.
+        """
+        self._pending_records = []
+
+        try:
+            yield
+            records = self._pending_records
+            self._pending_records = None
+            self.update_records(session=session, records=records)
+        finally:
+            self._pending_records = None
+
+    def mark_as_generated(self, session: Session, invoice_number: str, file_path: str, fingerprint: str = ''):
+        """Regista que o XML de uma fatura foi gerado com sucesso, com a impressão digital dos dados de origem."""
         logger.info(f"Marcar a fatura {invoice_number} como 'XML Gerado'.")
 
         self._update_record(
@@ -43,6 +87,7 @@ class ControlService:
                 'status': SaphetyStatus.WAITING,
                 'filename': file_path,
                 'message': 'Ficheiro XML gerado',
+                'sourceFingerprint': fingerprint,
             },
         )
 
@@ -56,6 +101,7 @@ class ControlService:
                 'invoice_number': invoice_number,
                 'status': SaphetyStatus.GENERATION_ERROR,
                 'message': str(error)[:250],
+                'sourceFingerprint': '',
             },
         )
 
@@ -66,6 +112,10 @@ class ControlService:
         context['message'] = 'Enviado com sucesso'
         context['sendDate'] = datetime.now(timezone.utc).date()
 
+        # Um novo envio recomeça o calendário das verificações do estado de integração
+        context['nextCheckAt'] = DEFAULT_LEGACY_DATETIME
+        context['checkAttempts'] = 0
+
         self._update_record(session=session, data=context)
 
     def log_sending_error(self, session: Session, context: ControlArgs):
@@ -80,33 +130,90 @@ class ControlService:
         """Atualiza o estado de integração de uma fatura."""
         self._update_record(session=session, data=context)
 
-    def get_pending_invoices(self, session: Session, invoice_number: str | None = None) -> list[APIControlView]:
-        """Recupera a lista de faturas pendentes de envio."""
+    def mark_for_manual_review(self, session: Session, context: ControlArgs):
+        """Regista que uma fatura deixou de ser verificada automaticamente e precisa de revisão manual."""
+        logger.warning(f"Marcar a fatura {context['invoice_number']} para 'Revisão manual'.")
+
+        context['status'] = SaphetyStatus.MANUAL_REVIEW
+
+        self._update_record(session=session, data=context)
+
+    def get_fingerprints(self, session: Session, invoice_numbers: list[str]) -> dict[str, tuple[str, str]]:
+        """Recupera a impressão digital e o ficheiro XML guardados para um conjunto de faturas."""
+        return self.control_repo.get_fingerprints(session=session, invoice_numbers=invoice_numbers)
+
+    def get_pending_invoices(self, session: Session, invoice_number: str | None = None) -> list[PendingInvoiceRow]:
+        """Recupera a lista de faturas pendentes de envio (só as colunas usadas no envio, para leitura)."""
         filters: dict[str, tuple[str, Any]] = {'status': ('=', SaphetyStatus.WAITING)}
 
         if invoice_number:
             filters['invoiceNumber'] = ('=', invoice_number)
 
-        results = self.api_repo.find(session=session, where_clauses=filters)
+        results = self.api_repo.find_rows(session=session, row_type=PendingInvoiceRow, where_clauses=filters)
 
         return results
 
+    def iter_pending_invoices(
+        self, session_factory: Callable[[], AbstractContextManager[Session]], invoice_number: str | None = None
+    ) -> Iterator[list[PendingInvoiceRow]]:
+        """
+        Recupera as faturas pendentes de envio por páginas (pelo número da fatura), cada uma lida
+        numa sessão própria, para percorrer listas de qualquer tamanho sem as manter em memória.
+        """
+        filters: dict[str, tuple[str, Any]] = {'status': ('=', SaphetyStatus.WAITING)}
+
+        if invoice_number:
+            filters['invoiceNumber'] = ('=', invoice_number)
+
+        return self.api_repo.iter_batches(
+            session_factory=session_factory, key='invoiceNumber', where_clauses=filters, row_type=PendingInvoiceRow
+        )
+
+    def get_sender(self, session: Session, invoice_number: str) -> str | None:
+        """Recupera o emissor (SENDER_0) com que uma fatura é enviada para a API."""
+        results = self.api_repo.find(session=session, where_clauses={'invoiceNumber': ('=', invoice_number)})
+
+        return results[0].sender if results else None
+
     def fetch_invoices_by_status(
         self, session: Session, status: SaphetyRequestStatus, invoice_number: str | None = None
-    ) -> list[APIControlView]:
-        """Recupera a lista de faturas por status."""
+    ) -> list[InvoiceStatusRow]:
+        """Recupera a lista de faturas por status (só as colunas de estado, para leitura)."""
 
         filters: dict[str, tuple[str, Any]] = {'requestStatus': ('=', status)}
 
         if invoice_number is not None:
             filters['invoiceNumber'] = ('=', invoice_number)
 
-        results = self.api_repo.find(session=session, where_clauses=filters)
+        results = self.api_repo.find_rows(session=session, row_type=InvoiceStatusRow, where_clauses=filters)
 
         return results
 
-    def fetch_invoices_to_be_checked(self, session: Session, invoice_number: str | None = None) -> list[APIControlView]:
-        """Recupera a lista de faturas que precisam ter o status verificado."""
+    def fetch_in_flight_requests(self, session: Session, invoice_number: str | None = None) -> list[InFlightRequestRow]:
+        """Recupera as faturas enviadas cujo pedido assíncrono ainda está em fila ou em execução."""
+
+        filters: dict[str, tuple[str, Any]] = {
+            'status': ('=', SaphetyStatus.SENT_SUCCESSFULLY),
+            'requestStatus': ('IN', [SaphetyRequestStatus.QUEUED, SaphetyRequestStatus.RUNNING]),
+            'requestId': ('!=', ''),
+        }
+
+        if invoice_number is not None:
+            filters['invoiceNumber'] = ('=', invoice_number)
+
+        results = self.api_repo.find_rows(session=session, row_type=InFlightRequestRow, where_clauses=filters)
+
+        return results
+
+    def fetch_invoices_to_be_checked(
+        self, session: Session, invoice_number: str | None = None
+    ) -> list[InvoiceCheckRow]:
+        """
+        Recupera a lista de faturas que precisam ter o status verificado.
+
+        Só são retornadas as faturas cuja próxima verificação já chegou (as mais atrasadas primeiro)
+        e que não estão em revisão manual. Uma fatura indicada explicitamente é sempre verificada.
+        """
 
         filters: dict[str, tuple[str, Any]] = {
             'requestStatus': ('=', SaphetyRequestStatus.FINISHED),
@@ -115,7 +222,12 @@ class ControlService:
 
         if invoice_number is not None:
             filters['invoiceNumber'] = ('=', invoice_number)
+        else:
+            filters['status'] = ('!=', SaphetyStatus.MANUAL_REVIEW)
+            filters['nextCheckAt'] = ('<=', CheckSchedule.now())
 
-        results = self.api_repo.find(session=session, where_clauses=filters)
+        results = self.api_repo.find_rows(
+            session=session, row_type=InvoiceCheckRow, where_clauses=filters, order_by=['nextCheckAt']
+        )
 
         return results
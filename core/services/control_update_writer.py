@@ -0,0 +1,109 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Generic, TypeVar
+
+from core.config.settings import CONTROL_UPDATE_BATCH_SIZE, CONTROL_UPDATE_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Marca o fim dos resultados na fila
+_STOP = object()
+
+
+class ControlUpdateWriter(Generic[T]):
+    """
+    Grava os resultados da API na tabela de controlo em segundo plano (write-behind), em pequenos lotes.
+
+    Os resultados são acumulados com `add` à medida que chegam e gravados por uma thread própria
+    sempre que há `batch_size` resultados ou passaram `interval` segundos desde o primeiro resultado
+    por gravar. Cada lote é gravado pela função `flush` na sua própria transação, pelo que a gravação
+    decorre em simultâneo com os pedidos à API e uma falha perde no máximo um lote. No fim do bloco
+    `with` (ou em `close`) os resultados em falta são gravados e a thread termina.
+
+    Args:
+        flush: A função que grava um lote de resultados (numa sessão e transação próprias). Se a gravação
+            falhar, deve fazer rollback e lançar a exceção, para que o lote seja contado como não gravado.
+        batch_size: O número máximo de resultados por lote.
+        interval: O tempo máximo, em segundos, que um resultado espera para ser gravado.
+        name: O nome da thread (para os logs).
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[list[T]], None],
+        batch_size: int = CONTROL_UPDATE_BATCH_SIZE,
+        interval: float = CONTROL_UPDATE_FLUSH_SECONDS,
+        name: str = 'control-writer',
+    ):
+        self.flush = flush
+        self.batch_size = max(batch_size, 1)
+        self.interval = max(interval, 0.0)
+        self.written = 0
+        self.failed = 0
+
+        # Fila limitada: se a base de dados for mais lenta do que a API, quem adiciona espera
+        self._queue: queue.Queue = queue.Queue(maxsize=self.batch_size * 10)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self) -> 'ControlUpdateWriter[T]':
+        self._thread.start()
+        return self
+
+    def add(self, item: T) -> None:
+        """Acumula um resultado para ser gravado no próximo lote."""
+        self._queue.put(item)
+
+    def close(self) -> None:
+        """Grava os resultados em falta e espera que a thread termine."""
+        if not self._thread.is_alive():
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join()
+
+        logger.info(f'Tabela de controlo: {self.written} resultados gravados e {self.failed} com erro.')
+
+    def __enter__(self) -> 'ControlUpdateWriter[T]':
+        return self.start()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        batch: list[T] = []
+        flush_at = 0.0
+
+        while True:
+            timeout = max(flush_at - time.monotonic(), 0.0) if batch else None
+
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            else:
+                if item is _STOP:
+                    break
+
+                if not batch:
+                    flush_at = time.monotonic() + self.interval
+
+                batch.append(item)
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= flush_at):
+                self._flush(batch)
+                batch = []
+
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch: list[T]) -> None:
+        try:
+            self.flush(batch)
+            self.written += len(batch)
+        except Exception:
+            logger.exception(f'Erro ao gravar {len(batch)} resultados na tabela de controlo.')
+            self.failed += len(batch)
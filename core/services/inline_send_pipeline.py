@@ -0,0 +1,152 @@
+import logging
+import queue
+import threading
+from dataclasses import dataclass
+
+from sqlalchemy.orm import Session
+
+from core.services.control_update_writer import ControlUpdateWriter
+from core.services.saphety_service import SaphetyApiService
+
+logger = logging.getLogger(__name__)
+
+# Marca o fim das faturas na fila
+_STOP = object()
+
+
+@dataclass(slots=True)
+class InlineInvoice:
+    """Uma fatura acabada de gerar, com o XML em memória (os atributos usados no envio, como em PendingInvoiceRow)."""
+
+    invoiceNumber: str
+    category: int
+    sender: str
+    filename: str
+    content: bytes
+
+
+class InlineSendPipeline:
+    """
+    Envio imediato das faturas geradas (`SAPHETY_INLINE_SEND`).
+
+    O processamento entrega cada XML gerado com `put`, logo depois de registar a fatura como
+    gerada, e uma thread própria submete-o à API com o conteúdo em memória: o ficheiro continua
+    a ser gravado (auditoria), mas não é lido de novo nem a fatura é procurada outra vez na tabela
+    de controlo. Os resultados são gravados em segundo plano (`ControlUpdateWriter`) e os pedidos
+    assíncronos acompanhados no fim, como no envio normal (`SaphetyApiService`).
+
+    A fila é limitada a `max_pending` faturas (cada uma com o XML completo, incluindo o PDF):
+    quando a geração é mais rápida do que o envio e a fila está cheia, `put` não espera e a
+    fatura fica para o envio normal, pelo que a memória não cresce com o número de faturas.
+
+    As faturas que não forem entregues (ex: falha na autenticação, fila cheia ou circuito aberto)
+    ficam pendentes e são enviadas pelo envio normal, que deve correr depois de `close`.
+
+    Args:
+        service: O serviço de envio. Se None, é criado um com a configuração por omissão.
+        max_pending: O número máximo de faturas à espera de envio. Se None, 10 por envio simultâneo.
+    """
+
+    def __init__(self, service: SaphetyApiService | None = None, max_pending: int | None = None):
+        self.service = service or SaphetyApiService()
+        self.enabled = False
+        self.handed_off = 0
+        self.skipped = 0
+
+        # Emissor por sociedade, para não consultar a tabela de controlo por cada fatura
+        self._senders: dict[str, str] = {}
+        self._queue: queue.Queue = queue.Queue(maxsize=max(max_pending or self.service.workers * 10, 1))
+        self._thread = threading.Thread(target=self._run, name='saphety-inline-send', daemon=True)
+
+    def start(self) -> 'InlineSendPipeline':
+        # Obtém um token válido antes de aceitar faturas; sem ele, o envio fica para o ciclo normal
+        if not self.service.token_provider.get_token():
+            logger.error('Falha na autenticação. As faturas geradas ficam pendentes para o envio normal.')
+            return self
+
+        self.enabled = True
+        self._thread.start()
+        return self
+
+    def put(  # noqa: PLR0913, PLR0917
+        self,
+        session: Session,
+        invoice_number: str,
+        company: str,
+        category: int,
+        filename: str,
+        content: bytes,
+    ) -> bool:
+        """
+        Entrega o XML de uma fatura já registada como gerada (com commit) para ser enviado.
+
+        Returns:
+            True se a fatura foi entregue, False se fica pendente para o envio normal (ex: fila cheia).
+        """
+        if not self.enabled:
+            return False
+
+        sender = self._senders.get(company)
+
+        if sender is None:
+            sender = self.service.control_service.get_sender(session=session, invoice_number=invoice_number)
+
+            if not sender:
+                logger.warning(f'Emissor da fatura {invoice_number} desconhecido. Fica pendente para o envio normal.')
+                return False
+
+            self._senders[company] = sender
+
+        invoice = InlineInvoice(
+            invoiceNumber=invoice_number, category=category, sender=sender, filename=filename, content=content
+        )
+
+        # Não atrasa a geração: com a fila cheia, a fatura fica para o envio normal
+        try:
+            self._queue.put_nowait(invoice)
+        except queue.Full:
+            self.skipped += 1
+            return False
+
+        self.handed_off += 1
+        return True
+
+    def close(self) -> None:
+        """Envia as faturas em falta, acompanha os pedidos e espera que a gravação dos resultados termine."""
+        self.enabled = False
+
+        if not self._thread.is_alive():
+            return
+
+        # Com a fila cheia, espera que haja lugar para a marca de fim, enquanto a thread do envio estiver ativa
+        while True:
+            try:
+                self._queue.put(_STOP, timeout=1)
+                break
+            except queue.Full:
+                if not self._thread.is_alive():
+                    break
+
+        self._thread.join()
+
+        logger.info(
+            f'Envio imediato: {self.handed_off} faturas entregues ao envio e {self.skipped} deixadas para o '
+            f'envio normal (fila cheia).'
+        )
+
+    def __enter__(self) -> 'InlineSendPipeline':
+        return self.start()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        writer = ControlUpdateWriter(flush=self.service._update_invoices, name='saphety-inline-writer')
+
+        try:
+            with writer:
+                # As faturas são submetidas à medida que chegam à fila, até à marca de fim
+                self.service._process_invoices(pending_invoices=iter(self._queue.get, _STOP), on_result=writer.add)
+        except Exception:
+            self.enabled = False
+            logger.exception('Erro no envio imediato. As faturas por enviar ficam pendentes para o envio normal.')
@@ -1,12 +1,21 @@
+import copy
+import hashlib
+import io
 import logging
-from collections import defaultdict
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
 from decimal import Decimal
+from itertools import chain
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterator, Optional
 
 import lxml.etree as etree  # noqa: PLR0402
 from sqlalchemy.orm import Session
 
 from core.config.settings import (
     DEFAULT_LEGACY_DATE,
+    INVOICE_BATCH_SIZE,
     NS_CAC,
     NS_CBC,
     NS_ESPAP,
@@ -14,20 +23,102 @@ from core.config.settings import (
     NS_ROOT_NC,
     NSMAP_FT,
     NSMAP_NC,
+    SKIP_UNCHANGED_INVOICES,
+    SUPPLIER_CACHE_TTL_SECONDS,
+    XML_COLUMN_PROJECTION,
+    XML_STREAMING_WRITER,
+    XML_WORKERS,
+    ensure_folders,
 )
 from core.database.database import db
 from core.mappers.base_mapper import BaseMapper
-from core.models.sales_invoice import CustomerInvoiceHeader, SalesInvoice, SalesInvoiceTax
+from core.models.sales_invoice import CustomerInvoiceHeader, SalesInvoice, SalesInvoiceDetail, SalesInvoiceTax
 from core.repositories.company_repository import CompanyRepository
 from core.repositories.invoice_repository import SalesInvoiceRepository
 from core.services.control_service import ControlService
+from core.types.types import (
+    InvoiceXmlData,
+    InvoiceXmlJob,
+    InvoiceXmlResult,
+    ProjectionProfile,
+    SupplierParty,
+    TaxSubtotal,
+)
+from core.utils.cache import TTLCache
 from core.utils.conversions import Conversions
 from core.utils.generics import Generics
 from core.utils.local_menus import InvoiceType, NoYes, TaxLevelCode
 from core.utils.xml_handler import XMLHandler
 
+if TYPE_CHECKING:
+    from core.services.inline_send_pipeline import InlineSendPipeline
+
 logger = logging.getLogger(__name__)
 
+# Dados do fornecedor por sociedade, partilhados entre instâncias do serviço (e ciclos do scheduler)
+_supplier_cache: TTLCache[str, SupplierParty] = TTLCache(ttl_seconds=SUPPLIER_CACHE_TTL_SECONDS)
+
+# Colunas lidas pela construção do XML CIUS-PT (as listas das propriedades híbridas, como
+# `addressLine`, são carregadas pelos seus atributos internos `_<nome>_<índice>`)
+CIUS_PT_PROJECTION: ProjectionProfile = {
+    'invoice': [
+        'invoiceNumber',
+        'company',
+        'salesSite',
+        'category',
+        'invoiceDate',
+        'currency',
+        'billToCustomer',
+        'billToCustomerEuropeanUnionVatNumber',
+        'sourceDocumentCategory',
+        'sourceDocumentNumber',
+        'sourceDocumentDate',
+        'updateChanges',
+        'updateDatetime',
+        '_address_line_0',
+        '_address_line_1',
+        '_address_line_2',
+        'shipToCustomerCity',
+        'shipToCustomerPostalCode',
+        'shipToCustomerCountry',
+    ],
+    'invoice_header': [
+        'invoiceNumber',
+        'businessPartner',
+        'currency',
+        'paymentTerm',
+        'dueDateCalculationStartDate',
+        'billToCustomerName1',
+        'billToCustomerName2',
+        '_address_bpa_0',
+        '_address_bpa_1',
+        '_address_bpa_2',
+        'billToCustomerCity',
+        'billToCustomerPostalCode',
+        'billToCustomerCountry',
+        'totalAmountExcludingTax',
+        'totalAmountIncludingTax',
+        'updateChanges',
+        'updateDatetime',
+    ],
+    'customer': ['customerCode'],
+    'business_partner': ['code', 'europeanUnionVatNumber'],
+    'invoice_detail': [
+        'invoiceNumber',
+        'lineNumber',
+        'quantityInSalesUnit',
+        'lineAmountExcludingTax',
+        'taxRates',
+        'netPrice',
+        'updateChanges',
+        'updateDatetime',
+    ],
+}
+
+# Versão do formato do XML gerado, incluída na impressão digital das faturas.
+# Deve ser incrementada quando a construção do XML muda, para que os ficheiros já gerados não sejam reutilizados.
+XML_FINGERPRINT_VERSION = 1
+
 
 class InvoiceProcessorService:
     """
@@ -35,9 +126,20 @@ class InvoiceProcessorService:
     gerar o XML CIUS-PT e coordenar o envio.
     """
 
-    def __init__(self, customer_mapper: BaseMapper):
+    def __init__(
+        self,
+        customer_mapper: BaseMapper,
+        workers: int | None = None,
+        send_pipeline: Optional['InlineSendPipeline'] = None,
+    ):
         """
         Inicializa o serviço e as suas dependências (repositórios).
+
+        Args:
+            customer_mapper: O mapeador para customizações específicas do cliente.
+            workers: Número de processos para gerar os XML. Se None, usa `XML_WORKERS`.
+            send_pipeline: O envio imediato (`SAPHETY_INLINE_SEND`). Se indicado, o XML de cada fatura
+                           gerada é entregue em memória para ser enviado logo.
         """
         self.invoice_repo = SalesInvoiceRepository()
         self.company_repo = CompanyRepository()
@@ -47,8 +149,36 @@ class InvoiceProcessorService:
 
         self.control_service = ControlService()
 
-    def _build_cius_pt_xml(
-        self, session: Session, invoice: SalesInvoice, mapper: BaseMapper, filename: str
+        self.workers = workers if workers is not None else XML_WORKERS
+
+        self.send_pipeline = send_pipeline
+
+        # Colunas a carregar: o perfil CIUS-PT base mais as declaradas pelo mapper
+        self.projection = self._build_projection(customer_mapper) if XML_COLUMN_PROJECTION else {}
+
+        # Subárvores <cac:AccountingSupplierParty> já construídas nesta execução, por sociedade
+        self._supplier_elements: dict[str, tuple[SupplierParty, etree._Element]] = {}
+
+    @staticmethod
+    def _build_projection(mapper: BaseMapper) -> ProjectionProfile:
+        """Junta ao perfil CIUS-PT base as colunas declaradas pelo mapper, sem repetições."""
+        projection: ProjectionProfile = {}
+
+        for key, columns in CIUS_PT_PROJECTION.items():
+            extra = mapper.projection_columns.get(key, [])
+            projection[key] = list(dict.fromkeys([*columns, *extra]))
+
+        return projection
+
+    def _build_cius_pt_xml(  # noqa: PLR0913, PLR0917
+        self,
+        session: Session,
+        invoice: SalesInvoice,
+        mapper: BaseMapper,
+        filename: str,
+        invoice_details: list[SalesInvoiceDetail] | None = None,
+        tax_subtotals: list[TaxSubtotal] | None = None,
+        supplier: SupplierParty | None = None,
     ) -> etree._Element:
         """
         Constrói a árvore XML para uma única fatura.
@@ -58,6 +188,9 @@ class InvoiceProcessorService:
             invoice: O objeto SalesInvoice com os dados do cliente já carregados.
             mapper: O mapeador para customizações específicas do cliente.
             filename: O nome do ficheiro XML a ser gerado (sem extensão).
+            invoice_details: As linhas da fatura já carregadas. Se None, são lidas da base de dados.
+            tax_subtotals: O resumo de impostos já carregado. Se None, é calculado a partir das linhas de impostos.
+            supplier: Os dados do fornecedor já carregados. Se None, são lidos da cache ou da base de dados.
 
         Returns:
             Um objeto ElementTree representando o XML da fatura.
@@ -65,16 +198,17 @@ class InvoiceProcessorService:
         logger.info(f'Construir o XML para a fatura: {invoice.invoiceNumber}')
 
         # Criação do Elemento Raiz
-        if invoice.category == InvoiceType.INVOICE:
-            root = etree.Element(f'{{{NS_ROOT_FT}}}Invoice', nsmap=NSMAP_FT)
-        else:
-            root = etree.Element(f'{{{NS_ROOT_NC}}}CreditNote', nsmap=NSMAP_NC)
+        root_tag, nsmap = self._root_tag(invoice)
+        root = etree.Element(root_tag, nsmap=nsmap)
 
         # Cabeçalho da Fatura
         self._header_info(root, invoice, filename)
 
+        # Referência de Documento Adicional (opcional)
+        self._additional_document_reference(root, invoice)
+
         # Informação do Fornecedor
-        self._supplier_party(root, session, invoice)
+        self._supplier_party(root, session, invoice, supplier)
 
         # Informação do Cliente
         self._customer_party(root, invoice)
@@ -87,13 +221,13 @@ class InvoiceProcessorService:
             self._add_payment_terms(root, invoice)
 
         # Totais de Impostos
-        self._tax_total(root, session, invoice.invoice_header)
+        self._tax_total(root, session, invoice.invoice_header, tax_subtotals)
 
         # Totais Monetários
         self._legal_monetary_total(root, invoice.invoice_header)
 
         # Linhas da Fatura
-        self._invoice_lines(root, session, invoice)
+        self._invoice_lines(root, session, invoice, invoice_details)
 
         logger.debug(f'XML para {invoice.invoiceNumber} construído (em memória).')
         return root
@@ -161,75 +295,163 @@ class InvoiceProcessorService:
                 '%Y-%m-%d'
             )
 
-        # Referência de Documento Adicional (opcional)
+    @staticmethod
+    def _root_tag(invoice: SalesInvoice) -> tuple[str, dict[str, str]]:
+        """Retorna o nome qualificado e os namespaces do elemento raiz do documento."""
+        if invoice.category == InvoiceType.INVOICE:
+            return f'{{{NS_ROOT_FT}}}Invoice', NSMAP_FT
+
+        return f'{{{NS_ROOT_NC}}}CreditNote', NSMAP_NC
+
+    @staticmethod
+    def _additional_document_reference_block(
+        parent: etree._Element, invoice: SalesInvoice, additional_doc_ref: dict[str, Any]
+    ) -> etree._Element:
+        """
+        Adiciona o bloco <cac:AdditionalDocumentReference> sem o conteúdo do anexo.
+
+        Returns:
+            O elemento <cbc:EmbeddedDocumentBinaryObject>, a preencher com o PDF em base64.
+        """
+        additional_ref = etree.SubElement(parent, f'{{{NS_CAC}}}AdditionalDocumentReference')
+        etree.SubElement(
+            additional_ref, f'{{{NS_CBC}}}ID', {'schemeID': additional_doc_ref.get('schemeID')}
+        ).text = invoice.invoiceNumber
+        etree.SubElement(additional_ref, f'{{{NS_CBC}}}DocumentTypeCode').text = additional_doc_ref.get('type_code')
+        etree.SubElement(additional_ref, f'{{{NS_CBC}}}DocumentDescription').text = additional_doc_ref.get(
+            'description'
+        )
+        attachment = etree.SubElement(additional_ref, f'{{{NS_CAC}}}Attachment')
+
+        return etree.SubElement(
+            attachment,
+            f'{{{NS_CBC}}}EmbeddedDocumentBinaryObject',
+            {
+                'mimeCode': 'application/pdf',
+                'filename': additional_doc_ref.get('file_name'),
+            },
+        )
+
+    def _additional_document_reference(self, parent: etree._Element, invoice: SalesInvoice) -> None:
+        """Adiciona a Referência de Documento Adicional (BT-23), com o PDF da fatura em anexo."""
         additional_doc_ref = self.mapper.get_additional_document_reference(invoice)
 
-        if additional_doc_ref:
-            additional_ref = etree.SubElement(parent, f'{{{NS_CAC}}}AdditionalDocumentReference')
-            etree.SubElement(
-                additional_ref, f'{{{NS_CBC}}}ID', {'schemeID': additional_doc_ref.get('schemeID')}
-            ).text = invoice.invoiceNumber
-            etree.SubElement(additional_ref, f'{{{NS_CBC}}}DocumentTypeCode').text = additional_doc_ref.get('type_code')
-            etree.SubElement(additional_ref, f'{{{NS_CBC}}}DocumentDescription').text = additional_doc_ref.get(
-                'description'
-            )
-            attachment = etree.SubElement(additional_ref, f'{{{NS_CAC}}}Attachment')
-            etree.SubElement(
-                attachment,
-                f'{{{NS_CBC}}}EmbeddedDocumentBinaryObject',
-                {
-                    'mimeCode': 'application/pdf',
-                    'filename': additional_doc_ref.get('file_name'),
-                },
-            ).text = additional_doc_ref.get('pdf_base64')
+        if not additional_doc_ref:
+            return
 
-    def _supplier_party(self, parent: etree._Element, session: Session, invoice: SalesInvoice) -> None:
-        """Adiciona o bloco de informação do Fornecedor (a sua empresa)."""
-        logger.debug('Adicionar o bloco do Fornecedor (AccountingSupplierParty)...')
+        pdf_base64 = additional_doc_ref.get('pdf_base64')
+
+        if pdf_base64 is None and additional_doc_ref.get('pdf_path'):
+            pdf_path = Path(additional_doc_ref['pdf_path'])
+            pdf_base64 = Conversions.convert_file_to_base64(str(pdf_path.parent), pdf_path.name)
+
+        self._additional_document_reference_block(parent, invoice, additional_doc_ref).text = pdf_base64
+
+    def _get_supplier_data(self, session: Session, company: str) -> SupplierParty:
+        """
+        Retorna os dados do fornecedor (nome, morada por defeito e NIF) de uma sociedade.
+
+        Os dados ficam em cache durante `SUPPLIER_CACHE_TTL_SECONDS`, evitando as queries
+        às tabelas COMPANY e BPADDRESS em cada fatura.
+        """
+        supplier_data = _supplier_cache.get(company)
+
+        if supplier_data is not None:
+            return supplier_data
+
+        logger.debug(f'Carregar os dados do fornecedor para a sociedade {company}.')
 
-        # Carrega os dados do fornecedor
         supplier = self.company_repo.find_with_address(
-            session=session, company_filters={'company': invoice.company}, address_filters={'isDefault': NoYes.YES}
+            session=session, company_filters={'company': company}, address_filters={'isDefault': NoYes.YES}
         )
 
-        # Cria o nó principal do fornecedor
-        supplier_party = etree.SubElement(parent, f'{{{NS_CAC}}}AccountingSupplierParty')
-        party = etree.SubElement(supplier_party, f'{{{NS_CAC}}}Party')
+        if not supplier or not supplier[0].addresses:
+            raise ValueError(f'Dados da sociedade {company} ou da sua morada por defeito em falta.')
 
-        # Nome do Fornecedor
-        party_name = etree.SubElement(party, f'{{{NS_CAC}}}PartyName')
-        etree.SubElement(party_name, f'{{{NS_CBC}}}Name').text = supplier[0].companyName.strip()
+        address = supplier[0].addresses[0]
 
         # Morada Postal do Fornecedor
         full_address = ' '.join(
             filter(
                 None,
                 [
-                    supplier[0].addresses[0].addressLine1.strip(),
-                    supplier[0].addresses[0].addressLine2.strip(),
-                    supplier[0].addresses[0].addressLine3.strip(),
+                    address.addressLine1.strip(),
+                    address.addressLine2.strip(),
+                    address.addressLine3.strip(),
                 ],
             )
         )
 
+        supplier_data: SupplierParty = {
+            'company': company,
+            'name': supplier[0].companyName.strip(),
+            'street': full_address,
+            'city': address.city.strip(),
+            'postal_zone': address.postalCode.strip(),
+            'country': address.country.strip(),
+            'vat_number': supplier[0].intraCommunityVatNumber.strip(),
+        }
+
+        _supplier_cache.set(company, supplier_data)
+
+        return supplier_data
+
+    @staticmethod
+    def _build_supplier_party(supplier: SupplierParty) -> etree._Element:
+        """Constrói o bloco de informação do Fornecedor (<cac:AccountingSupplierParty>) isolado."""
+
+        # Cria o nó principal do fornecedor
+        supplier_party = etree.Element(f'{{{NS_CAC}}}AccountingSupplierParty', nsmap={'cac': NS_CAC, 'cbc': NS_CBC})
+        party = etree.SubElement(supplier_party, f'{{{NS_CAC}}}Party')
+
+        # Nome do Fornecedor
+        party_name = etree.SubElement(party, f'{{{NS_CAC}}}PartyName')
+        etree.SubElement(party_name, f'{{{NS_CBC}}}Name').text = supplier['name']
+
+        # Morada Postal do Fornecedor
         postal_address = etree.SubElement(party, f'{{{NS_CAC}}}PostalAddress')
-        etree.SubElement(postal_address, f'{{{NS_CBC}}}StreetName').text = full_address
-        etree.SubElement(postal_address, f'{{{NS_CBC}}}CityName').text = supplier[0].addresses[0].city.strip()
-        etree.SubElement(postal_address, f'{{{NS_CBC}}}PostalZone').text = supplier[0].addresses[0].postalCode.strip()
+        etree.SubElement(postal_address, f'{{{NS_CBC}}}StreetName').text = supplier['street']
+        etree.SubElement(postal_address, f'{{{NS_CBC}}}CityName').text = supplier['city']
+        etree.SubElement(postal_address, f'{{{NS_CBC}}}PostalZone').text = supplier['postal_zone']
         country = etree.SubElement(postal_address, f'{{{NS_CAC}}}Country')
-        etree.SubElement(country, f'{{{NS_CBC}}}IdentificationCode').text = supplier[0].addresses[0].country.strip()
+        etree.SubElement(country, f'{{{NS_CBC}}}IdentificationCode').text = supplier['country']
 
         # Informação Fiscal do Fornecedor (NIF)
         party_tax_scheme = etree.SubElement(party, f'{{{NS_CAC}}}PartyTaxScheme')
         # NIF precedido do código do país
-        etree.SubElement(party_tax_scheme, f'{{{NS_CBC}}}CompanyID').text = supplier[0].intraCommunityVatNumber.strip()
+        etree.SubElement(party_tax_scheme, f'{{{NS_CBC}}}CompanyID').text = supplier['vat_number']
         tax_scheme = etree.SubElement(party_tax_scheme, f'{{{NS_CAC}}}TaxScheme')
         etree.SubElement(tax_scheme, f'{{{NS_CBC}}}ID').text = 'VAT'
 
         # Informação Legal do Fornecedor
         party_legal_entity = etree.SubElement(party, f'{{{NS_CAC}}}PartyLegalEntity')
         # Nome de registo (firma)
-        etree.SubElement(party_legal_entity, f'{{{NS_CBC}}}RegistrationName').text = supplier[0].companyName.strip()
+        etree.SubElement(party_legal_entity, f'{{{NS_CBC}}}RegistrationName').text = supplier['name']
+
+        return supplier_party
+
+    def _supplier_party(
+        self,
+        parent: etree._Element,
+        session: Session | None,
+        invoice: SalesInvoice,
+        supplier: SupplierParty | None = None,
+    ) -> None:
+        """Adiciona o bloco de informação do Fornecedor (a sua empresa)."""
+        logger.debug('Adicionar o bloco do Fornecedor (AccountingSupplierParty)...')
+
+        # Carrega os dados do fornecedor (da cache, sempre que possível)
+        supplier_data = supplier or self._get_supplier_data(session, invoice.company)
+
+        # A subárvore é construída uma vez por sociedade e clonada para cada documento.
+        # É reconstruída se os dados em cache tiverem sido renovados entretanto.
+        cached = self._supplier_elements.get(invoice.company)
+
+        if cached is None or cached[0] != supplier_data:
+            cached = (supplier_data, self._build_supplier_party(supplier_data))
+            self._supplier_elements[invoice.company] = cached
+
+        parent.append(copy.deepcopy(cached[1]))
 
     def _customer_party(self, parent: etree._Element, invoice: SalesInvoice) -> None:  # noqa: PLR6301
         """Adiciona o bloco de informação do Cliente."""
@@ -379,56 +601,81 @@ class InvoiceProcessorService:
             )
 
     @staticmethod
-    def _aggregate_taxes(invoice_taxes: list[SalesInvoiceTax]) -> dict[tuple[str, Decimal], dict[str, Decimal]]:
+    def _aggregate_taxes(invoice_taxes: list[SalesInvoiceTax]) -> list[TaxSubtotal]:
         """
         Agrega uma lista de registos de imposto por categoria e taxa CIUS-PT.
 
-        Recebe a lista de impostos lida da base de dados e a sumariza para garantir
-        que haja apenas uma entrada por combinação de (código_categoria_cius, taxa_percentual).
+        Usado apenas quando o resumo de impostos não foi lido já agregado da base de dados
+        (ver `SalesInvoiceRepository.fetch_tax_subtotals_for_invoices`). Garante que haja
+        apenas uma entrada por combinação de (código_categoria_cius, taxa_percentual).
 
         Args:
             invoice_taxes: Uma lista de objetos SalesInvoiceTax.
 
         Returns:
-            Um dicionário onde a chave é uma tupla (cius_code, rate) e o valor
-            é um dicionário com os totais {'taxable_amount': ..., 'tax_amount': ...}.
+            A lista de subtotais, pela ordem em que cada taxa aparece nos registos.
         """
 
-        # Dicionário para acumular os subtotais.
-        # O defaultdict cria automaticamente uma nova entrada se a chave não existir.
-        aggregated_subtotals = defaultdict(lambda: {'taxable_amount': Decimal('0'), 'tax_amount': Decimal('0')})
+        # Dicionário para acumular os subtotais, indexado por (cius_code, rate)
+        aggregated_subtotals: dict[tuple[str | None, Decimal], TaxSubtotal] = {}
 
         for tax_record in invoice_taxes:
             # Converte o código interno para o código de categoria CIUS ('NOR', 'RED', 'INT', etc.)
             cius_code = Generics.get_enum_name(TaxLevelCode, int(tax_record.rate))
 
             # A chave de agregação é a combinação do código CIUS e da taxa percentual
-            aggregation_key = (cius_code, tax_record.rate)
+            subtotal = aggregated_subtotals.setdefault(
+                (cius_code, tax_record.rate),
+                {
+                    'category': cius_code,
+                    'rate': tax_record.rate,
+                    'taxable_amount': Decimal('0'),
+                    'tax_amount': Decimal('0'),
+                    'rows': 0,
+                    'update_changes': 0,
+                    'update_datetime': None,
+                },
+            )
 
             # Acumule os valores
-            # Se a chave ('NOR', Decimal('23.00')) já existir, ele soma.
-            # Se não existir, o defaultdict cria-a com os valores iniciais de 0.
-            aggregated_subtotals[aggregation_key]['taxable_amount'] += tax_record.taxBasis
-            aggregated_subtotals[aggregation_key]['tax_amount'] += tax_record.taxAmount
+            subtotal['taxable_amount'] += tax_record.taxBasis
+            subtotal['tax_amount'] += tax_record.taxAmount
+            subtotal['rows'] += 1
+            subtotal['update_changes'] += tax_record.updateChanges or 0
+
+            if tax_record.updateDatetime and (
+                subtotal['update_datetime'] is None or tax_record.updateDatetime > subtotal['update_datetime']
+            ):
+                subtotal['update_datetime'] = tax_record.updateDatetime
 
-        # Converte de volta para um dicionário normal (opcional, mas mais limpo)
-        return dict(aggregated_subtotals)
+        return list(aggregated_subtotals.values())
 
-    def _tax_total(self, parent: etree._Element, session: Session, invoice: CustomerInvoiceHeader) -> None:
+    def _tax_total(
+        self,
+        parent: etree._Element,
+        session: Session,
+        invoice: CustomerInvoiceHeader,
+        tax_subtotals: list[TaxSubtotal] | None = None,
+    ) -> None:
         """
-        Adiciona o bloco de resumo de impostos (TaxTotal) a partir dos dados já
-        agregados da tabela SalesInvoiceTax (SVCRVAT).
+        Adiciona o bloco de resumo de impostos (TaxTotal) a partir dos subtotais por taxa
+        da tabela SalesInvoiceTax (SVCRVAT).
 
         Args:
             parent: O elemento XML pai onde o bloco será adicionado.
-            invoice_taxes: Uma lista de objetos SalesInvoiceTax, cada um representando
-                           um subtotal por taxa de imposto.
+            session: A sessão do banco de dados.
+            invoice: O cabeçalho da fatura.
+            tax_subtotals: Os subtotais por categoria e taxa de imposto. Se None, as linhas
+                           de impostos são lidas da base de dados e agregadas aqui.
         """
 
         # Buscas as taxas de IVA aplicadas na fatura
-        invoice_taxes = self.invoice_repo.fetch_taxes_for_invoice(session=session, invoice_number=invoice.invoiceNumber)
+        if tax_subtotals is None:
+            tax_subtotals = self._aggregate_taxes(
+                self.invoice_repo.fetch_taxes_for_invoice(session=session, invoice_number=invoice.invoiceNumber)
+            )
 
-        if not invoice_taxes:
+        if not tax_subtotals:
             logger.warning('Nenhum dado de imposto encontrado para a fatura. Saltar o bloco TaxTotal.')
             return
 
@@ -438,7 +685,9 @@ class InvoiceProcessorService:
         currency_attr = {'currencyID': invoice.currency}
 
         # Calcula o valor total do imposto
-        total_tax_amount = sum(tax.taxAmount for tax in invoice_taxes if tax.taxAmount is not None)
+        total_tax_amount = sum(
+            (subtotal['tax_amount'] for subtotal in tax_subtotals if subtotal['tax_amount'] is not None), Decimal('0')
+        )
 
         # Bloco Principal <cac:TaxTotal>
         tax_total_block = etree.SubElement(parent, f'{{{NS_CAC}}}TaxTotal')
@@ -450,11 +699,8 @@ class InvoiceProcessorService:
 
         # Subtotal por Taxa de IVA
 
-        # Calcula o subtotal por taxa de IVA
-        tax_subtotals = self._aggregate_taxes(invoice_taxes)
-
         # Este bloco <cac:TaxSubtotal> pode repetir-se para cada taxa de IVA diferente.
-        for (cius_code, rate), totals in tax_subtotals.items():
+        for totals in tax_subtotals:
             tax_subtotal_block = etree.SubElement(tax_total_block, f'{{{NS_CAC}}}TaxSubtotal')
 
             # Base tributável para esta taxa (valor sobre o qual o imposto incide)
@@ -470,100 +716,591 @@ class InvoiceProcessorService:
             # Categoria do Imposto
             tax_category = etree.SubElement(tax_subtotal_block, f'{{{NS_CAC}}}TaxCategory')
 
-            etree.SubElement(tax_category, f'{{{NS_CBC}}}ID').text = cius_code
+            etree.SubElement(tax_category, f'{{{NS_CBC}}}ID').text = totals['category']
 
             # Percentagem da taxa
-            etree.SubElement(tax_category, f'{{{NS_CBC}}}Percent').text = Conversions.format_monetary(rate)
+            etree.SubElement(tax_category, f'{{{NS_CBC}}}Percent').text = Conversions.format_monetary(totals['rate'])
 
             # Esquema do Imposto (geralmente "VAT")
             tax_scheme = etree.SubElement(tax_category, f'{{{NS_CAC}}}TaxScheme')
             etree.SubElement(tax_scheme, f'{{{NS_CBC}}}ID').text = 'VAT'
 
-    def _invoice_lines(self, parent: etree._Element, session: Session, invoice: SalesInvoice) -> None:
+    def _invoice_lines(
+        self,
+        parent: etree._Element,
+        session: Session,
+        invoice: SalesInvoice,
+        invoice_details: list[SalesInvoiceDetail] | None = None,
+    ) -> None:
         """
-        Busca e adiciona todas as linhas da fatura (<cac:InvoiceLine>) ao XML.
+        Busca (se não forem fornecidas) e adiciona todas as linhas da fatura (<cac:InvoiceLine>) ao XML.
         """
         logger.debug(f'Adicionar linhas para a fatura {invoice.invoiceNumber}')
 
-        invoice_details = self.invoice_repo.fetch_details_for_invoice(
-            session=session, invoice_number=invoice.invoiceNumber
-        )
+        if invoice_details is None:
+            invoice_details = self.invoice_repo.fetch_details_for_invoice(
+                session=session, invoice_number=invoice.invoiceNumber
+            )
 
         for detail in invoice_details:
             self.mapper.build_invoice_line(
                 parent=parent, currency=invoice.currency, category=invoice.category, detail=detail
             )
 
+    def _write_cius_pt_xml(  # noqa: PLR0913, PLR0917
+        self,
+        session: Session | None,
+        invoice: SalesInvoice,
+        filename: str,
+        file_path: Path,
+        invoice_details: list[SalesInvoiceDetail] | None = None,
+        tax_subtotals: list[TaxSubtotal] | None = None,
+        supplier: SupplierParty | None = None,
+        output: io.BytesIO | None = None,
+    ) -> Path:
+        """
+        Escreve o XML de uma única fatura diretamente no ficheiro, à medida que é produzido.
+
+        Cada bloco (cabeçalho, partes, totais e cada linha) é construído num elemento
+        temporário, escrito com `lxml.etree.xmlfile` e descartado, e o PDF anexo é lido e
+        codificado em base64 por partes. Assim, a árvore XML e o PDF codificado nunca ficam
+        inteiros em memória; as linhas e os impostos da fatura continuam carregados (são lidos
+        para todo o bloco de faturas em `_process_chunk`), pelo que a memória continua a crescer
+        com o número de linhas. Em troca, a escrita é 2 a 3 vezes mais lenta do que a de
+        `_build_cius_pt_xml` (ver `benchmarks`). O documento produzido é igual ao de
+        `_build_cius_pt_xml`, sem a indentação.
+
+        Com `output` (envio imediato), o documento é escrito nesse buffer e depois gravado no
+        ficheiro, ficando o conteúdo disponível em memória.
+
+        Returns:
+            O caminho do ficheiro escrito.
+        """
+        logger.info(f'Escrever o XML para a fatura {invoice.invoiceNumber} em modo incremental.')
+
+        root_tag, nsmap = self._root_tag(invoice)
+
+        # Elemento temporário onde cada bloco é construído antes de ser escrito
+        scratch = etree.Element(root_tag, nsmap=nsmap)
+
+        def flush(streams: dict[etree._Element, Iterator[str]] | None = None) -> None:
+            for child in scratch:
+                XMLHandler.write_element(xf, child, streams)
+            scratch.clear()
+
+        if invoice_details is None:
+            invoice_details = self.invoice_repo.fetch_details_for_invoice(
+                session=session, invoice_number=invoice.invoiceNumber
+            )
+
+        try:
+            with etree.xmlfile(output if output is not None else str(file_path), encoding='UTF-8') as xf:
+                xf.write_declaration()
+
+                with xf.element(root_tag, nsmap=nsmap):
+                    # Cabeçalho da Fatura
+                    self._header_info(scratch, invoice, filename)
+                    flush()
+
+                    # Referência de Documento Adicional (opcional), com o PDF escrito por partes
+                    additional_doc_ref = self.mapper.get_additional_document_reference(invoice)
+
+                    if additional_doc_ref:
+                        binary = self._additional_document_reference_block(scratch, invoice, additional_doc_ref)
+
+                        if additional_doc_ref.get('pdf_base64') is not None:
+                            binary.text = additional_doc_ref['pdf_base64']
+                            flush()
+                        elif additional_doc_ref.get('pdf_path'):
+                            flush({binary: Conversions.iter_file_base64(additional_doc_ref['pdf_path'])})
+                        else:
+                            flush()
+
+                    # Fornecedor, Cliente, Entrega e Pagamento
+                    self._supplier_party(scratch, session, invoice, supplier)
+                    self._customer_party(scratch, invoice)
+                    self._add_delivery(scratch, invoice)
+
+                    if invoice.category == InvoiceType.CREDIT_NOTE:
+                        self._add_payment_terms(scratch, invoice)
+
+                    # Totais de Impostos e Totais Monetários
+                    self._tax_total(scratch, session, invoice.invoice_header, tax_subtotals)
+                    self._legal_monetary_total(scratch, invoice.invoice_header)
+                    flush()
+
+                    # Linhas da Fatura, uma de cada vez
+                    for detail in invoice_details:
+                        self.mapper.build_invoice_line(
+                            parent=scratch, currency=invoice.currency, category=invoice.category, detail=detail
+                        )
+                        flush()
+
+            if output is not None:
+                file_path.write_bytes(output.getvalue())
+
+        except Exception:
+            # Não deixa ficheiros incompletos na pasta de saída
+            file_path.unlink(missing_ok=True)
+            raise
+
+        logger.info(f'Ficheiro XML para a fatura {invoice.invoiceNumber} gerado com sucesso em: {file_path}')
+        return file_path
+
+    def _generate_invoice_file(  # noqa: PLR0913, PLR0917
+        self,
+        session: Session | None,
+        invoice: SalesInvoice,
+        invoice_details: list[SalesInvoiceDetail],
+        tax_subtotals: list[TaxSubtotal],
+        supplier: SupplierParty | None = None,
+        keep_content: bool = False,
+    ) -> tuple[Path | None, bytes | None]:
+        """
+        Constrói e guarda o XML de uma única fatura.
+
+        Não acede à base de dados quando os dados do fornecedor são fornecidos, podendo
+        ser executado num processo auxiliar sobre cópias simples dos registos. Com
+        `XML_STREAMING_WRITER` ativo (e se o mapper indicar o caminho do ficheiro), o XML
+        é escrito de forma incremental em vez de ser construído em memória.
+
+        Returns:
+            O caminho do ficheiro gerado (ou None se o mapper não o guardou) e, com `keep_content`
+            (envio imediato), o conteúdo do XML tal como foi gravado.
+        """
+        # Define o nome do ficheiro XML
+        filename = ''.join(c for c in invoice.invoiceNumber if c.isalnum())
+
+        context: InvoiceXmlData = {
+            'invoice_number': invoice.invoiceNumber,
+            'company': invoice.company,
+            'site': invoice.salesSite,
+            'invoice_date': invoice.invoiceDate,
+        }
+
+        if XML_STREAMING_WRITER:
+            file_path = self.mapper.get_invoice_xml_path(context)
+
+            if file_path is not None:
+                output = io.BytesIO() if keep_content else None
+                xml_file = self._write_cius_pt_xml(
+                    session=session,
+                    invoice=invoice,
+                    filename=filename,
+                    file_path=file_path,
+                    invoice_details=invoice_details,
+                    tax_subtotals=tax_subtotals,
+                    supplier=supplier,
+                    output=output,
+                )
+                return xml_file, output.getvalue() if output is not None else None
+
+            logger.debug('O mapper não indica o caminho do ficheiro XML. A construir o XML em memória.')
+
+        # Constrói o XML para a fatura atual
+        invoice_xml_tree = self._build_cius_pt_xml(
+            session=session,
+            invoice=invoice,
+            mapper=self.mapper,
+            filename=filename,
+            invoice_details=invoice_details,
+            tax_subtotals=tax_subtotals,
+            supplier=supplier,
+        )
+
+        logger.info(f'Gerar o ficheiro XML para a fatura {invoice.invoiceNumber} como {filename}.xml')
+
+        # Cria o ficheiro XML
+        xml_file = self.mapper.save_invoice_xml(xml_tree=invoice_xml_tree, context=context)
+
+        # O conteúdo entregue ao envio é serializado como o XMLHandler o grava
+        content = XMLHandler.to_bytes(invoice_xml_tree) if keep_content and xml_file else None
+
+        return xml_file, content
+
+    def _register_result(  # noqa: PLR0913, PLR0917
+        self,
+        session: Session,
+        invoice_number: str,
+        xml_file: Path | str | None,
+        error: Exception | str | None = None,
+        fingerprint: str | None = None,
+    ) -> None:
+        """Regista na tabela de controlo o resultado da geração do XML de uma fatura."""
+        if error is not None:
+            # Se algo correu mal com ESTA fatura, registamos o erro
+            # e continuamos para a próxima.
+            logger.error(f'Falha ao processar a fatura {invoice_number}: {error}')
+
+            # É crucial registar o erro na tabela de controlo
+            self.control_service.log_processing_error(session=session, invoice_number=invoice_number, error=error)
+
+        # Atualiza o estado da fatura para "Pendente"
+        elif xml_file:
+            self.control_service.mark_as_generated(
+                session=session, invoice_number=invoice_number, file_path=str(xml_file), fingerprint=fingerprint or ''
+            )
+        else:
+            self.control_service.log_processing_error(
+                session=session,
+                invoice_number=invoice_number,
+                error='Erro ao salvar o ficheiro XML',
+            )
+
+    def _process_invoice(
+        self,
+        session: Session,
+        invoice: SalesInvoice,
+        invoice_details: list[SalesInvoiceDetail],
+        tax_subtotals: list[TaxSubtotal],
+        fingerprint: str | None = None,
+    ) -> tuple[Path | None, bytes | None]:
+        """
+        Gera e guarda o XML de uma única fatura e regista o resultado na tabela de controlo.
+
+        Returns:
+            O caminho do ficheiro gerado e, com o envio imediato, o seu conteúdo (None se falhou).
+        """
+        try:
+            xml_file, content = self._generate_invoice_file(
+                session=session,
+                invoice=invoice,
+                invoice_details=invoice_details,
+                tax_subtotals=tax_subtotals,
+                keep_content=self.send_pipeline is not None,
+            )
+        except Exception as e:
+            self._register_result(session=session, invoice_number=invoice.invoiceNumber, xml_file=None, error=e)
+            return None, None
+
+        self._register_result(
+            session=session, invoice_number=invoice.invoiceNumber, xml_file=xml_file, fingerprint=fingerprint
+        )
+        return xml_file, content
+
+    def _hand_off(
+        self, session: Session, invoice: SalesInvoice, xml_file: Path | str | None, content: bytes | None
+    ) -> None:
+        """Entrega ao envio imediato o XML acabado de gerar, depois do commit do registo na tabela de controlo."""
+        if self.send_pipeline is None or not xml_file or content is None:
+            return
+
+        self.send_pipeline.put(
+            session=session,
+            invoice_number=invoice.invoiceNumber,
+            company=invoice.company,
+            category=invoice.category,
+            filename=str(xml_file),
+            content=content,
+        )
+
+    def _process_chunk_in_workers(  # noqa: PLR0913
+        self,
+        session: Session,
+        executor: ProcessPoolExecutor,
+        chunk: list[SalesInvoice],
+        *,
+        details_by_invoice: dict[str, list[SalesInvoiceDetail]],
+        taxes_by_invoice: dict[str, list[TaxSubtotal]],
+        fingerprints: dict[str, str],
+    ) -> None:
+        """
+        Gera os XML de um bloco de faturas nos processos auxiliares.
+
+        O processo principal converte os dados já carregados em registos simples
+        (serializáveis), submete cada fatura ao pool e regista os resultados na tabela de
+        controlo, pela ordem do bloco. Uma falha de uma fatura (incluindo do próprio pool) é
+        registada como erro dessa fatura e não interrompe as restantes.
+        """
+        futures: list[tuple[SalesInvoice, Future[InvoiceXmlResult]]] = []
+
+        for invoice in chunk:
+            try:
+                job: InvoiceXmlJob = {
+                    'invoice': Conversions.to_record(invoice),
+                    'details': [Conversions.to_record(d) for d in details_by_invoice.get(invoice.invoiceNumber, [])],
+                    'taxes': taxes_by_invoice.get(invoice.invoiceNumber, []),
+                    'supplier': self._get_supplier_data(session, invoice.company),
+                    'keep_content': self.send_pipeline is not None,
+                }
+                futures.append((invoice, executor.submit(_generate_in_worker, job)))
+            except Exception as e:
+                self._register_result(session=session, invoice_number=invoice.invoiceNumber, xml_file=None, error=e)
+                session.commit()
+
+        for invoice, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                self._register_result(session=session, invoice_number=invoice.invoiceNumber, xml_file=None, error=e)
+                session.commit()
+                continue
+
+            self._register_result(
+                session=session,
+                invoice_number=invoice.invoiceNumber,
+                xml_file=result['file_path'],
+                error=result['error'],
+                fingerprint=fingerprints.get(invoice.invoiceNumber),
+            )
+            session.commit()
+
+            self._hand_off(session, invoice, result['file_path'], result['content'])
+
+    @contextmanager
+    def _generation_pool(self, invoice_count: int) -> Iterator[Optional[ProcessPoolExecutor]]:
+        """
+        Cria o pool de processos para a geração dos XML, se estiver configurado mais de um.
+
+        Produz None quando a geração deve ser feita no processo principal. Os processos são
+        criados com `spawn`: o processo principal já tem threads a correr (envio imediato e
+        escrita da tabela de controlo), que um `fork` copiaria a meio (com os seus locks).
+        """
+        workers = min(self.workers, invoice_count)
+
+        if workers <= 1:
+            yield None
+            return
+
+        logger.info(f'Gerar os XML com {workers} processos.')
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_generation_worker,
+            initargs=(self.mapper,),
+        ) as executor:
+            yield executor
+
     def process_pending_invoices(self, invoice_id: str | None = None) -> None:
         """
         O método principal do serviço. Orquestra todo o fluxo de processamento.
+
+        As faturas pendentes são lidas em blocos de `INVOICE_BATCH_SIZE` (paginação pelo número
+        da fatura) numa sessão só de leitura, para que a memória usada não cresça com o número de
+        faturas em atraso; cada bloco é lido por inteiro antes de ser tratado, pelo que a leitura
+        não mantém locks enquanto a tabela de controlo é gravada na outra sessão. Para cada bloco,
+        as linhas (SINVOICED) e o resumo de impostos (SVCRVAT, já agregado por taxa) de todas as
+        faturas são lidos com poucas queries limitadas por `IN`; no fim do bloco, os objetos são
+        retirados das duas sessões antes de ler o seguinte. Com mais de um processo configurado
+        (`workers`), a construção e gravação dos XML é distribuída pelo pool.
         """
         logger.info('Serviço de processamento de faturas iniciado.')
 
-        # Obtém uma sessão da base de dados usando o nosso gestor
-        with db.get_db() as session:
+        ensure_folders()
+
+        chunk_size = max(INVOICE_BATCH_SIZE, 1)
+
+        # Obtém duas sessões da base de dados: uma para a leitura das faturas pendentes
+        # e outra para as restantes queries e para os commits da tabela de controlo
+        with db.get_db() as read_session, db.get_db() as session:
             try:
-                # Busca as faturas pendentes
-                invoices_to_process = self.invoice_repo.fetch_pending_invoices(
-                    session=session,
+                # Percorre as faturas pendentes bloco a bloco
+                chunks = self.invoice_repo.stream_pending_invoices(
+                    session=read_session,
+                    chunk_size=chunk_size,
                     invoice_number=invoice_id,
+                    invoice_cols=self.projection.get('invoice'),
+                    invoice_header_cols=self.projection.get('invoice_header'),
+                    customer_cols=self.projection.get('customer'),
+                    business_partner_cols=self.projection.get('business_partner'),
                 )
 
-                if not invoices_to_process:
+                first_chunk = next(chunks, None)
+
+                if not first_chunk:
                     logger.info('Nenhuma fatura pendente encontrada para processamento.')
                     return
 
-                # Itera e processa cada fatura
-                for invoice in invoices_to_process:
-                    try:
-                        # Define o nome do ficheiro XML
-                        filename = ''.join(c for c in invoice.invoiceNumber if c.isalnum())
-
-                        # Constrói o XML para a fatura atual
-                        invoice_xml_tree = self._build_cius_pt_xml(
-                            session=session, invoice=invoice, mapper=self.mapper, filename=filename
-                        )
-
-                        logger.info(f'Gerar o ficheiro XML para a fatura {invoice.invoiceNumber} como {filename}.xml')
-
-                        # Cria o ficheiro XML
-                        xml_file = self.mapper.save_invoice_xml(
-                            xml_tree=invoice_xml_tree,
-                            context={
-                                'invoice_number': invoice.invoiceNumber,
-                                'company': invoice.company,
-                                'site': invoice.salesSite,
-                                'invoice_date': invoice.invoiceDate,
-                            },
-                        )
-
-                        # Atualiza o estado da fatura para "Pendente"
-                        if xml_file:
-                            self.control_service.mark_as_generated(
-                                session=session, invoice_number=invoice.invoiceNumber, file_path=str(xml_file)
-                            )
-                        else:
-                            self.control_service.log_processing_error(
-                                session=session,
-                                invoice_number=invoice.invoiceNumber,
-                                error='Erro ao salvar o ficheiro XML',
-                            )
-
-                    except Exception as e:
-                        # Se algo correu mal com ESTA fatura, registamos o erro
-                        # e continuamos para a próxima.
-                        logger.error(f'Falha ao processar a fatura {invoice.invoiceNumber}: {e}')
-
-                        # É crucial registar o erro na tabela de controlo
-                        self.control_service.log_processing_error(
-                            session=session, invoice_number=invoice.invoiceNumber, error=e
-                        )
+                with self._generation_pool(len(first_chunk)) as executor:
+                    for chunk in chain([first_chunk], chunks):
+                        self._process_chunk(session, executor, chunk)
 
-                    # Se tudo correu bem, faz commit da transação
-                    session.commit()
-                    logger.info('Processamento concluído com sucesso.')
+                        # Liberta os objetos do bloco já tratado antes de ler o seguinte
+                        session.expunge_all()
+                        read_session.expunge_all()
 
             except Exception:
                 logger.exception('Ocorreu um erro crítico durante o processamento. Fazer rollback...')
                 if 'session' in locals():
                     session.rollback()  # Garante que nenhuma alteração parcial é guardada
+
+    def _process_chunk(
+        self, session: Session, executor: Optional[ProcessPoolExecutor], chunk: list[SalesInvoice]
+    ) -> None:
+        """
+        Gera os XML de um bloco de faturas e regista os resultados, com commit por fatura.
+
+        As faturas cujos dados de origem não mudaram desde a última geração (mesma impressão
+        digital e ficheiro ainda existente) reutilizam o XML já gerado.
+        """
+        invoice_numbers = [invoice.invoiceNumber for invoice in chunk]
+
+        # Carrega as linhas e os subtotais de impostos de todo o bloco de uma só vez
+        details_by_invoice = self.invoice_repo.fetch_details_for_invoices(
+            session=session, invoice_numbers=invoice_numbers, detail_cols=self.projection.get('invoice_detail')
+        )
+        taxes_by_invoice = self.invoice_repo.fetch_tax_subtotals_for_invoices(
+            session=session, invoice_numbers=invoice_numbers
+        )
+
+        fingerprints: dict[str, str] = {}
+
+        if SKIP_UNCHANGED_INVOICES:
+            stored = self.control_service.get_fingerprints(session=session, invoice_numbers=invoice_numbers)
+            to_generate = []
+
+            for invoice in chunk:
+                fingerprint = self._source_fingerprint(
+                    invoice,
+                    details_by_invoice.get(invoice.invoiceNumber, []),
+                    taxes_by_invoice.get(invoice.invoiceNumber, []),
+                )
+
+                if fingerprint is not None:
+                    fingerprints[invoice.invoiceNumber] = fingerprint
+
+                if self._reuse_unchanged_file(session, invoice.invoiceNumber, fingerprint, stored):
+                    session.commit()
+                else:
+                    to_generate.append(invoice)
+
+            chunk = to_generate
+
+        if executor is not None:
+            self._process_chunk_in_workers(
+                session,
+                executor,
+                chunk,
+                details_by_invoice=details_by_invoice,
+                taxes_by_invoice=taxes_by_invoice,
+                fingerprints=fingerprints,
+            )
+            return
+
+        # Itera e processa cada fatura do bloco
+        for invoice in chunk:
+            xml_file, content = self._process_invoice(
+                session=session,
+                invoice=invoice,
+                invoice_details=details_by_invoice.get(invoice.invoiceNumber, []),
+                tax_subtotals=taxes_by_invoice.get(invoice.invoiceNumber, []),
+                fingerprint=fingerprints.get(invoice.invoiceNumber),
+            )
+
+            # Se tudo correu bem, faz commit da transação
+            session.commit()
+            logger.info('Processamento concluído com sucesso.')
+
+            self._hand_off(session, invoice, xml_file, content)
+
+    def _source_fingerprint(
+        self,
+        invoice: SalesInvoice,
+        invoice_details: list[SalesInvoiceDetail],
+        tax_subtotals: list[TaxSubtotal],
+    ) -> str | None:
+        """
+        Calcula a impressão digital dos dados de origem de uma fatura.
+
+        Usa os contadores e as datas de alteração (UPDTICK_0/UPDDATTIM_0) da fatura, do
+        cabeçalho e das linhas, o resumo de impostos (valores, número de linhas e alterações),
+        o mapper ativo e os valores que este indica (`get_fingerprint_parts`). Retorna None se
+        não for possível calculá-la.
+        """
+        header = invoice.invoice_header
+
+        try:
+            parts = [
+                XML_FINGERPRINT_VERSION,
+                type(self.mapper).__name__,
+                invoice.invoiceNumber,
+                invoice.updateChanges,
+                invoice.updateDatetime,
+                header.updateChanges if header else None,
+                header.updateDatetime if header else None,
+                [(detail.id, detail.updateChanges, detail.updateDatetime) for detail in invoice_details],
+                [
+                    (
+                        tax['rate'],
+                        tax['taxable_amount'],
+                        tax['tax_amount'],
+                        tax['rows'],
+                        tax['update_changes'],
+                        tax['update_datetime'],
+                    )
+                    for tax in tax_subtotals
+                ],
+                self.mapper.get_fingerprint_parts(invoice),
+            ]
+        except Exception:
+            logger.warning(
+                f'Não foi possível calcular a impressão digital da fatura {invoice.invoiceNumber}.', exc_info=True
+            )
+            return None
+
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    def _reuse_unchanged_file(
+        self,
+        session: Session,
+        invoice_number: str,
+        fingerprint: str | None,
+        stored: dict[str, tuple[str, str]],
+    ) -> bool:
+        """
+        Marca a fatura como gerada com o XML já existente, se os dados de origem não mudaram.
+
+        Returns:
+            True se o XML foi reutilizado, False se tem de ser gerado de novo.
+        """
+        if fingerprint is None or invoice_number not in stored:
+            return False
+
+        stored_fingerprint, filename = stored[invoice_number]
+
+        if stored_fingerprint != fingerprint or not filename or not Path(filename).is_file():
+            return False
+
+        logger.info(f'Dados da fatura {invoice_number} sem alterações. Reutilizar o ficheiro {filename}.')
+
+        self.control_service.mark_as_generated(
+            session=session, invoice_number=invoice_number, file_path=filename, fingerprint=fingerprint
+        )
+        return True
+
+
+# Serviço usado por cada processo auxiliar do pool de geração (criado pelo initializer)
+_worker_service: Optional[InvoiceProcessorService] = None
+
+
+def _init_generation_worker(customer_mapper: BaseMapper) -> None:
+    """Prepara um processo auxiliar do pool de geração de XML."""
+    global _worker_service  # noqa: PLW0603
+
+    _worker_service = InvoiceProcessorService(customer_mapper=customer_mapper, workers=1)
+
+
+def _generate_in_worker(job: InvoiceXmlJob) -> InvoiceXmlResult:
+    """Gera o XML de uma fatura num processo auxiliar, a partir de registos simples."""
+    invoice = job['invoice']
+
+    try:
+        xml_file, content = _worker_service._generate_invoice_file(
+            session=None,
+            invoice=invoice,
+            invoice_details=job['details'],
+            tax_subtotals=job['taxes'],
+            supplier=job['supplier'],
+            keep_content=job['keep_content'],
+        )
+    except Exception as e:
+        logger.exception(f'Falha ao gerar o XML da fatura {invoice.invoiceNumber} no processo auxiliar.')
+        return {'invoice_number': invoice.invoiceNumber, 'file_path': None, 'error': str(e), 'content': None}
+
+    return {
+        'invoice_number': invoice.invoiceNumber,
+        'file_path': str(xml_file) if xml_file else None,
+        'error': None,
+        'content': content,
+    }
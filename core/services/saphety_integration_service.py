@@ -1,22 +1,32 @@
 import json
 import logging
-
-import requests
-from requests.exceptions import HTTPError
+import time
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from functools import partial
+from itertools import islice
+from typing import Optional
+
+from requests.exceptions import HTTPError, RequestException
 from sqlalchemy.orm import Session
 
-from core.config.settings import API_PASSWORD, API_USER, SERVER_BASE_ADDRESS
+from core.api.circuit_breaker import CircuitOpenError
+from core.api.transport import SaphetyTransport
+from core.auth.token_provider import TokenProvider
+from core.config.settings import SAPHETY_CHECK_WORKERS
 from core.database.database import db
-from core.models.saphety_control import APIControlView
-from core.services.authentication import AuthenticationService
 from core.services.control_service import ControlService
+from core.services.control_update_writer import ControlUpdateWriter
 from core.types.types import (
     ControlArgs,
+    InvoiceCheckRow,
     SaphetyIntegrationData,
     SaphetyIntegrationResponse,
     SaphetyIntegrationResult,
 )
-from core.utils.local_menus import SaphetyIntegrationStatus, SaphetyNotificationStatus
+from core.utils.check_schedule import CheckSchedule
+from core.utils.local_menus import SaphetyIntegrationStatus, SaphetyNotificationStatus, SaphetyStatus
 from core.utils.xml_handler import XMLHandler
 
 logger = logging.getLogger(__name__)
@@ -27,64 +37,162 @@ class SaphetyApiIntegrationService:
     Um serviço para interagir com a API de integração de faturas da Saphety.
     """
 
-    def __init__(self):
-        self.base_url = f'https://{SERVER_BASE_ADDRESS}/api'
+    def __init__(
+        self,
+        transport: SaphetyTransport | None = None,
+        token_provider: TokenProvider | None = None,
+        workers: int | None = None,
+        check_schedule: CheckSchedule | None = None,
+    ):
+        """
+        Args:
+            transport: A ligação HTTP à API. Se None, usa a ligação partilhada pelo processo.
+            token_provider: O fornecedor do token de acesso. Se None, usa o partilhado pelo processo
+                            (ou um próprio, se for indicada uma ligação).
+            workers: Número de faturas verificadas em simultâneo. Se None, usa `SAPHETY_CHECK_WORKERS`.
+            check_schedule: O calendário das verificações. Se None, usa `SAPHETY_CHECK_SCHEDULE`.
+        """
+        self.transport = transport or SaphetyTransport.default()
+        self.workers = max(workers if workers is not None else SAPHETY_CHECK_WORKERS, 1)
+        self.base_url = f'{self.transport.base_url}/api'
         self.xml_handler = XMLHandler()
-        self.auth_service = AuthenticationService()
+        self.token_provider = token_provider or (
+            TokenProvider.default() if transport is None else TokenProvider(self.transport)
+        )
+        self.check_schedule = check_schedule or CheckSchedule.from_settings()
         self.control_service = ControlService()
 
-    def _process_invoices(self, token: str, sent_invoices: list[APIControlView]) -> list[SaphetyIntegrationResult]:
-        """Processa as faturas pendentes e retorna uma lista de resultados."""
-        status_results: list[SaphetyIntegrationResult] = []
+    def _process_invoices(self, sent_invoices: list[InvoiceCheckRow]) -> Iterator[SaphetyIntegrationResult]:
+        """
+        Verifica as faturas enviadas e produz os resultados à medida que ficam disponíveis.
 
-        for invoice in sent_invoices:
-            status = self.integration_status(request_id=invoice.financialId, token=token)
+        Com mais de um worker, as faturas são verificadas em simultâneo (no máximo `workers`
+        pedidos em curso, sujeitos ao limite de pedidos da ligação) e os resultados são
+        produzidos pela ordem em que terminam. As faturas cuja verificação falhou por um erro
+        de ligação não têm resultado e são verificadas no próximo ciclo; se a API ficar
+        indisponível (circuito aberto), as restantes já não são verificadas neste ciclo.
+        """
+        if self.workers == 1:
+            for position, invoice in enumerate(sent_invoices):
+                try:
+                    result = self._check_invoice(invoice)
+                except CircuitOpenError as e:
+                    remaining = len(sent_invoices) - position
+                    logger.warning(f'{e} As {remaining} faturas por verificar ficam para o próximo ciclo.')
+                    return
+
+                if result is not None:
+                    yield result
 
-            if status.get('IsValid'):
-                logger.info(f'Fatura {invoice.invoiceNumber} verificada com sucesso. Status: {status.get("Data")}')
-            else:
-                logger.error(f'Erro ao verificar a fatura {invoice.invoiceNumber}: {status.get("Errors")}')
+            return
 
-            status_results.append({'invoice_number': invoice.invoiceNumber, 'response': status})
+        invoices = iter(sent_invoices)
+        submitted = 0
+        skipped = 0
+        circuit_error: Optional[CircuitOpenError] = None
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='saphety-check') as executor:
+            # Mantém no máximo `workers` verificações em curso, para não carregar todas as faturas na fila
+            pending: set[Future] = {
+                executor.submit(self._check_invoice, invoice) for invoice in islice(invoices, self.workers)
+            }
+            submitted += len(pending)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    try:
+                        result = future.result()
+                    except CircuitOpenError as e:
+                        circuit_error = e
+                        skipped += 1
+                        continue
+
+                    if result is not None:
+                        yield result
+
+                if circuit_error is None:
+                    new = {executor.submit(self._check_invoice, invoice) for invoice in islice(invoices, len(done))}
+                    submitted += len(new)
+                    pending |= new
+
+        if circuit_error is not None:
+            remaining = skipped + len(sent_invoices) - submitted
+            logger.warning(f'{circuit_error} As {remaining} faturas por verificar ficam para o próximo ciclo.')
+
+    def _check_invoice(self, invoice: InvoiceCheckRow) -> SaphetyIntegrationResult | None:
+        """
+        Consulta o estado de integração de uma fatura.
 
-        return status_results
+        Retorna None se a consulta falhou por um erro de ligação (a fatura é verificada no próximo ciclo).
 
-    def _update_invoices(self, status_results: list[SaphetyIntegrationResult]) -> None:
-        """Atualiza o estado das faturas na tabela de controlo."""
+        Raises:
+            CircuitOpenError: Se a API está indisponível (circuito aberto).
+        """
+        try:
+            status = self.integration_status(request_id=invoice.financialId)
+        except CircuitOpenError:
+            raise
+        except RequestException:
+            logger.exception(f'Erro de ligação ao verificar a fatura {invoice.invoiceNumber}.')
+            return None
+
+        if status.get('IsValid'):
+            logger.info(f'Fatura {invoice.invoiceNumber} verificada com sucesso. Status: {status.get("Data")}')
+        else:
+            logger.error(f'Erro ao verificar a fatura {invoice.invoiceNumber}: {status.get("Errors")}')
+
+        return {'invoice_number': invoice.invoiceNumber, 'response': status}
+
+    def _update_invoices(
+        self, status_results: list[SaphetyIntegrationResult], invoices: dict[str, InvoiceCheckRow]
+    ) -> None:
+        """
+        Atualiza o estado das faturas na tabela de controlo e agenda a próxima verificação das que
+        ainda não foram recebidas.
+
+        Args:
+            status_results: Os resultados das verificações.
+            invoices: As faturas verificadas, indexadas pelo número da fatura.
+        """
+        now = CheckSchedule.now()
 
         # Obtém uma sessão da base de dados usando o nosso gestor
         with db.get_db() as session:
             try:
-                for result in status_results:
-                    invoice_number = result.get('invoice_number')
-                    response = result.get('response')
-                    data = response.get('Data', None)
-
-                    if data is not None and isinstance(data, dict):
-                        self._handle_with_dict(
-                            session=session,
-                            invoice_number=invoice_number,
-                            request_id=response.get('CorrelationId', ''),
-                            data=data,
+                # As alterações são acumuladas e gravadas de uma só vez no fim do bloco
+                with self.control_service.batch(session):
+                    for result in status_results:
+                        invoice_number = result.get('invoice_number')
+                        response = result.get('response')
+                        data = response.get('Data', None)
+
+                        received = False
+
+                        if data is not None and isinstance(data, dict):
+                            self._handle_with_dict(session=session, invoice_number=invoice_number, data=data)
+                            received = str(data.get('IntegrationStatus') or '').upper() == 'RECEIVED'
+
+                        self._schedule_next_check(
+                            session=session, invoice=invoices[invoice_number], received=received, now=now
                         )
 
                 session.commit()
             except Exception:
-                logger.exception('Ocorreu um erro crítico durante o processamento. Fazer rollback...')
                 session.rollback()  # Garante que nenhuma alteração parcial é guardada
+                raise  # O lote é contado e registado como não gravado pelo ControlUpdateWriter
 
-    def _handle_with_dict(
-        self, session: Session, invoice_number: str, request_id: str, data: SaphetyIntegrationData
-    ) -> None:
+    def _handle_with_dict(self, session: Session, invoice_number: str, data: SaphetyIntegrationData) -> None:
         """Processa a resposta quando o campo 'Data' é um dicionário."""
 
         notification_status = data.get('NotificationStatus', None)
         integration_status = data.get('IntegrationStatus', None)
         errors = data.get('Errors', None)
 
+        # O ID do pedido assíncrono do envio (requestId) não é alterado pela verificação
         updated_data: ControlArgs = {
             'invoice_number': invoice_number,
-            'requestId': request_id,
             'message': 'Integrado com sucesso' if not errors else '; '.join(errors),
         }
 
@@ -96,6 +204,48 @@ class SaphetyApiIntegrationService:
 
         self.control_service.update_integration_status(session=session, context=updated_data)
 
+    def _schedule_next_check(self, session: Session, invoice: InvoiceCheckRow, received: bool, now: datetime) -> None:
+        """
+        Agenda a próxima verificação de uma fatura que ainda não foi recebida, segundo o calendário.
+
+        Passado o tempo máximo de verificação desde o envio, a fatura deixa de ser verificada e
+        passa a revisão manual.
+        """
+        if received:
+            # Uma fatura em revisão manual verificada explicitamente e entretanto recebida volta ao estado normal
+            if invoice.status == SaphetyStatus.MANUAL_REVIEW:
+                self.control_service.update_integration_status(
+                    session=session,
+                    context={'invoice_number': invoice.invoiceNumber, 'status': SaphetyStatus.SENT_SUCCESSFULLY},
+                )
+            return
+
+        attempts = (invoice.checkAttempts or 0) + 1
+
+        if self.check_schedule.is_expired(invoice.sendDate, now):
+            logger.warning(
+                f'Fatura {invoice.invoiceNumber} não recebida {self.check_schedule.cutoff.days} dias após o envio '
+                f'({attempts} verificações). Passa a revisão manual.'
+            )
+            self.control_service.mark_for_manual_review(
+                session=session,
+                context={
+                    'invoice_number': invoice.invoiceNumber,
+                    'checkAttempts': attempts,
+                    'message': f'Não recebida após {attempts} verificações. Rever manualmente.',
+                },
+            )
+            return
+
+        self.control_service.update_integration_status(
+            session=session,
+            context={
+                'invoice_number': invoice.invoiceNumber,
+                'checkAttempts': attempts,
+                'nextCheckAt': self.check_schedule.next_check_at(attempts, now),
+            },
+        )
+
     def verify_invoice_status(self, invoice_id: str | None = None) -> None:
         """
         Verifica o estado das faturas enviadas para a API da Saphety.
@@ -122,36 +272,46 @@ class SaphetyApiIntegrationService:
             logger.info('Nenhuma fatura enviada encontrada para verificação.')
             return
 
-        # Obtém um token válido antes de verificar qualquer fatura
-        token = self.auth_service.login(API_USER, API_PASSWORD)
-
-        if not token:
+        # Obtém um token válido antes de verificar qualquer fatura (reutilizado enquanto for válido)
+        if not self.token_provider.get_token():
             logger.error('Falha na autenticação. Não foi possível obter o token.')
             return
 
-        # Processa cada fatura pendente
-        status_results = self._process_invoices(token=token, sent_invoices=sent_invoices)
+        started = time.monotonic()
+        checked = 0
+        invoices = {invoice.invoiceNumber: invoice for invoice in sent_invoices}
+        writer: ControlUpdateWriter[SaphetyIntegrationResult] = ControlUpdateWriter(
+            flush=partial(self._update_invoices, invoices=invoices), name='saphety-check-writer'
+        )
+
+        # Verifica as faturas e grava os resultados na tabela de controlo em segundo plano, em pequenos
+        # lotes, à medida que chegam, em vez de esperar pela verificação de todas
+        with writer:
+            for result in self._process_invoices(sent_invoices=sent_invoices):
+                writer.add(result)
+                checked += 1
 
-        # Atualiza o estado das faturas na tabela de controlo
-        self._update_invoices(status_results=status_results)
+        logger.info(
+            f'Verificadas {checked} de {len(sent_invoices)} faturas em {time.monotonic() - started:.1f}s '
+            f'({self.workers} em simultâneo).'
+        )
 
-    def integration_status(self, request_id: str, token: str) -> SaphetyIntegrationResponse:
+        self.transport.circuit_breaker.log_metrics()
+
+    def integration_status(self, request_id: str) -> SaphetyIntegrationResponse:
         """
         Este método consulta o estado da integração de uma fatura enviada.
 
         Args:
             request_id (str): O ID de correlação retornado pela API ao enviar a fatura
-            token (str): O token de autenticação para a API Saphety
         Returns:
             SaphetyIntegrationResponse: A resposta da API com o estado da integração
         """
 
         service_url = f'{self.base_url}/OutboundFinancialDocument/{request_id}'
-        headers = {'Authorization': f'bearer {token}'}
-
         try:
-            # Requisição GET para consultar o estado da fatura
-            response = requests.get(service_url, headers=headers, timeout=15)
+            # Requisição GET para consultar o estado da fatura (com o token de acesso)
+            response = self.transport.authorized_request('GET', service_url, self.token_provider)
 
             # Levanta uma exceção HTTPError se a resposta for um erro.
             response.raise_for_status()
@@ -1,18 +1,25 @@
 import json
 import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import chain, islice
 from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sized
 
-import requests
-from requests.exceptions import HTTPError
+from requests.exceptions import HTTPError, RequestException
 from sqlalchemy.orm import Session
 
-from core.config.settings import API_PASSWORD, API_USER, SERVER_BASE_ADDRESS
+from core.api.circuit_breaker import CircuitOpenError
+from core.api.request_tracker import ASYNC_PENDING_STATUSES, AsyncRequestTracker
+from core.api.transport import SaphetyTransport
+from core.auth.token_provider import TokenProvider
+from core.config.settings import SAPHETY_SEND_WORKERS
 from core.database.database import db
-from core.models.saphety_control import APIControlView
-from core.services.authentication import AuthenticationService
 from core.services.control_service import ControlService
+from core.services.control_update_writer import ControlUpdateWriter
 from core.types.types import (
     ControlArgs,
+    InFlightRequestRow,
+    PendingInvoiceRow,
     SaphetyResponse,
     SaphetyResult,
 )
@@ -27,97 +34,228 @@ class SaphetyApiService:
     Um cliente para interagir com a API de submissão de faturas da Saphety.
     """
 
-    def __init__(self):
-        self.base_url = f'https://{SERVER_BASE_ADDRESS}/api'
+    def __init__(
+        self,
+        transport: SaphetyTransport | None = None,
+        workers: int | None = None,
+        token_provider: TokenProvider | None = None,
+    ):
+        """
+        Args:
+            transport: A ligação HTTP à API. Se None, usa a ligação partilhada pelo processo.
+            workers: Número de faturas enviadas em simultâneo. Se None, usa `SAPHETY_SEND_WORKERS`.
+            token_provider: O fornecedor do token de acesso. Se None, usa o partilhado pelo processo
+                            (ou um próprio, se for indicada uma ligação).
+        """
+        self.transport = transport or SaphetyTransport.default()
+        self.workers = workers if workers is not None else SAPHETY_SEND_WORKERS
+        self.base_url = f'{self.transport.base_url}/api'
         self.xml_handler = XMLHandler()
-        self.auth_service = AuthenticationService()
+        self.token_provider = token_provider or (
+            TokenProvider.default() if transport is None else TokenProvider(self.transport)
+        )
         self.control_service = ControlService()
 
-    def _process_invoices(self, token: str, pending_invoices: list[APIControlView]) -> list[SaphetyResult]:
-        """Processa as faturas pendentes e retorna uma lista de resultados."""
-        send_results: list[SaphetyResult] = []
+    def _process_invoices(
+        self,
+        pending_invoices: Iterable[PendingInvoiceRow],
+        in_flight: list[InFlightRequestRow] | None = None,
+        on_result: Callable[[SaphetyResult], None] | None = None,
+    ) -> list[SaphetyResult]:
+        """
+        Processa as faturas pendentes e retorna uma lista de resultados.
+
+        Todas as faturas são submetidas primeiro e só depois os pedidos assíncronos são
+        consultados, em conjunto, pelo `AsyncRequestTracker` (com espera exponencial e tempo
+        limite por pedido). Os pedidos que não terminarem a tempo ficam registados em fila/em
+        execução e são retomados no ciclo seguinte (`in_flight`).
 
-        for invoice in pending_invoices:
-            send_status = self.send_message(invoice, token)
+        Com mais de um envio simultâneo configurado (`workers`), as submissões e as consultas
+        são feitas por um pool de threads, com no máximo `workers` submissões em curso. O ritmo
+        dos pedidos à API é limitado pela ligação partilhada (`HTTP_RATE_LIMIT_PER_SECOND`).
 
-            # Verifica o resultado do envio
-            if send_status.get('IsValid'):
-                correlation_id = send_status.get('CorrelationId', '')
-                request_id = send_status.get('Data', None)
+        Com `on_result`, cada resultado é também entregue assim que é conhecido: o do envio logo
+        após a submissão (pedido em fila, com o seu ID, ou erro) e o estado final do pedido assim
+        que este termina, para que possa ser gravado sem esperar pelas restantes faturas.
 
-                if isinstance(request_id, dict):
-                    request_id = None
+        As faturas podem chegar por um iterável (ex: a fila do envio imediato ou as páginas das
+        faturas pendentes): tanto com um como com vários envios, a fatura seguinte só é lida quando
+        há um envio livre, e os pedidos são acompanhados quando o iterável termina.
+        """
+        tracker = AsyncRequestTracker(poll=self.request_status, workers=self.workers)
 
-                while True and request_id:
-                    response = self.request_status(request_id=request_id, token=token)
+        # Pedidos de ciclos anteriores ainda por concluir: são consultados sem nova submissão
+        for invoice in in_flight or []:
+            tracker.add(invoice.invoiceNumber, invoice.requestId, wait=False)
 
-                    if response.get('IsValid'):
-                        data = response.get('Data', None)
+        send_results: list[SaphetyResult] = []
 
-                        if isinstance(data, dict):
-                            status = data.get('AsyncStatus')
-                            errors = data.get('Errors', [])
+        # Os resultados chegam à medida que as submissões terminam
+        for result in self._submit_invoices(pending_invoices):
+            if result is None:
+                continue
 
-                        if status in {'Queued', 'Running'}:
-                            logger.info(f'Fatura {invoice.invoiceNumber} ainda em processamento. Aguardar...')
-                            continue
+            send_results.append(result)
 
-                        if status == 'Finished':
-                            logger.info(
-                                f'Fatura {invoice.invoiceNumber} enviada com sucesso. RequestId: {correlation_id}'
-                            )
-                        else:
-                            logger.error(f'Erro ao processar a fatura {invoice.invoiceNumber}: {errors}')
-
-                        send_results.append({'invoice_number': invoice.invoiceNumber, 'response': response})
-                        break
-                    else:
-                        logger.error(f'Erro ao enviar a fatura {invoice.invoiceNumber}: {response.get("Errors")}')
-                        send_results.append({'invoice_number': invoice.invoiceNumber, 'response': response})
-                        break
+            if on_result is not None:
+                on_result(result.copy())
+
+            if result.get('request_id'):
+                tracker.add(result['invoice_number'], result['request_id'])
+
+        submitted_results = {result['invoice_number']: result for result in send_results}
+        in_flight_ids = {invoice.invoiceNumber: invoice.requestId for invoice in in_flight or []}
+
+        def on_status(invoice_number: str, status: SaphetyResponse | None) -> None:
+            """Atualiza o resultado de uma fatura com o estado final (ou o último conhecido) do pedido."""
+            if status is None:
+                return
+
+            result = submitted_results.get(invoice_number)
+
+            if result is not None:
+                result['response'] = status
+            elif not tracker.is_pending(status):
+                # Os pedidos retomados só são atualizados quando terminaram
+                result = {
+                    'invoice_number': invoice_number,
+                    'response': status,
+                    'request_id': in_flight_ids[invoice_number],
+                }
+                send_results.append(result)
             else:
-                logger.error(f'Erro ao enviar a fatura {invoice.invoiceNumber}: {send_status.get("Errors")}')
-                send_results.append({'invoice_number': invoice.invoiceNumber, 'response': send_status})
+                return
+
+            self._log_request_outcome(result)
+
+            if on_result is not None:
+                on_result(result.copy())
+
+        tracker.run(on_result=on_status)
 
         return send_results
 
+    def _submit_invoices(self, pending_invoices: Iterable[PendingInvoiceRow]) -> Iterator[SaphetyResult | None]:
+        """
+        Submete as faturas e entrega o resultado de cada envio assim que termina.
+
+        As faturas são lidas do iterável à medida que há envios livres, com no máximo `workers`
+        envios em curso (um de cada vez com um só envio), pelo que o iterável nunca é lido até
+        ao fim antes de os primeiros resultados serem entregues.
+        """
+        workers = min(self.workers, len(pending_invoices)) if isinstance(pending_invoices, Sized) else self.workers
+
+        if workers <= 1:
+            yield from map(self._submit_invoice, pending_invoices)
+            return
+
+        logger.info(f'Enviar as faturas com {workers} envios em simultâneo.')
+
+        invoices = iter(pending_invoices)
+
+        with ThreadPoolExecutor(workers, thread_name_prefix='saphety-send') as executor:
+            # Mantém no máximo `workers` envios em curso, lendo as faturas seguintes à medida que terminam
+            pending: set[Future] = {
+                executor.submit(self._submit_invoice, invoice) for invoice in islice(invoices, workers)
+            }
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    yield future.result()
+
+                pending |= {executor.submit(self._submit_invoice, invoice) for invoice in islice(invoices, len(done))}
+
+    def _submit_invoice(self, invoice: PendingInvoiceRow) -> SaphetyResult | None:
+        """
+        Submete uma fatura e retorna o resultado do envio, com o ID do pedido assíncrono se foi aceite.
+
+        Retorna None se o envio falhou por um erro de ligação: a fatura fica pendente e é
+        enviada no próximo ciclo, sem interromper o envio das restantes.
+        """
+        try:
+            send_status = self.send_message(invoice)
+        except CircuitOpenError as e:
+            logger.warning(f'Fatura {invoice.invoiceNumber} não enviada: {e} Fica pendente.')
+            return None
+        except RequestException:
+            logger.exception(f'Erro de ligação ao enviar a fatura {invoice.invoiceNumber}. Fica pendente.')
+            return None
+
+        result: SaphetyResult = {'invoice_number': invoice.invoiceNumber, 'response': send_status}
+
+        # Verifica o resultado do envio
+        if send_status.get('IsValid'):
+            request_id = send_status.get('Data', None)
+
+            if isinstance(request_id, str) and request_id:
+                result['request_id'] = request_id
+        else:
+            logger.error(f'Erro ao enviar a fatura {invoice.invoiceNumber}: {send_status.get("Errors")}')
+
+        return result
+
+    @staticmethod
+    def _log_request_outcome(result: SaphetyResult) -> None:
+        """Regista no log o estado do pedido assíncrono de uma fatura."""
+        invoice_number = result['invoice_number']
+        response = result['response']
+        data = response.get('Data', None)
+        status = data.get('AsyncStatus') if isinstance(data, dict) else None
+
+        if not response.get('IsValid'):
+            logger.error(f'Erro ao consultar o envio da fatura {invoice_number}: {response.get("Errors")}')
+        elif status in ASYNC_PENDING_STATUSES:
+            logger.info(f'Fatura {invoice_number} ainda em processamento ({status}). Consultar no próximo ciclo.')
+        elif status == 'Finished':
+            logger.info(f'Fatura {invoice_number} enviada com sucesso. RequestId: {result.get("request_id", "")}')
+        else:
+            errors = data.get('Errors', []) if isinstance(data, dict) else []
+            logger.error(f'Erro ao processar a fatura {invoice_number}: {errors}')
+
     def _update_invoices(self, send_results: list[SaphetyResult]) -> None:
         """Atualiza o estado das faturas na tabela de controlo."""
 
         # Obtém uma sessão da base de dados usando o nosso gestor
         with db.get_db() as session:
             try:
-                for result in send_results:
-                    invoice_number = result.get('invoice_number')
-                    response = result.get('response')
-                    errors = response.get('Errors', [])
-                    data = response.get('Data', None)
-
-                    if errors:
-                        logger.error(f'Erro ao processar a fatura {invoice_number}: {errors}')
-
-                        self._handle_with_list(
-                            session=session,
-                            invoice_number=invoice_number,
-                            request_id=response.get('CorrelationId', ''),
-                            errors=errors,
-                        )
-                    elif isinstance(data, dict):
-                        self._handle_with_dict(
-                            session=session,
-                            invoice_number=invoice_number,
-                            request_id=response.get('CorrelationId', ''),
-                            data=data,
-                        )
-                    elif isinstance(data, str):
-                        self._handle_with_string(
-                            session=session, invoice_number=invoice_number, data=data, response=response
-                        )
+                # As alterações são acumuladas e gravadas de uma só vez no fim do bloco
+                with self.control_service.batch(session):
+                    for result in send_results:
+                        invoice_number = result.get('invoice_number')
+                        response = result.get('response')
+                        errors = response.get('Errors', [])
+                        data = response.get('Data', None)
+
+                        # O ID do pedido assíncrono, para que os pedidos por concluir possam ser retomados
+                        request_id = result.get('request_id') or response.get('CorrelationId', '')
+
+                        if errors:
+                            logger.error(f'Erro ao processar a fatura {invoice_number}: {errors}')
+
+                            self._handle_with_list(
+                                session=session,
+                                invoice_number=invoice_number,
+                                request_id=request_id,
+                                errors=errors,
+                            )
+                        elif isinstance(data, dict):
+                            self._handle_with_dict(
+                                session=session,
+                                invoice_number=invoice_number,
+                                request_id=request_id,
+                                data=data,
+                            )
+                        elif isinstance(data, str):
+                            self._handle_with_string(
+                                session=session, invoice_number=invoice_number, data=data, response=response
+                            )
 
                 session.commit()
             except Exception:
-                logger.exception('Ocorreu um erro crítico durante o processamento. Fazer rollback...')
                 session.rollback()  # Garante que nenhuma alteração parcial é guardada
+                raise  # O lote é contado e registado como não gravado pelo ControlUpdateWriter
 
     def _handle_with_list(self, session: Session, invoice_number: str, request_id: str, errors: list[str]) -> None:
         """Processa a resposta quando existem erros na lista."""
@@ -179,6 +317,10 @@ class SaphetyApiService:
         Faz a leitura da tabela de controlo e verifica as faturas pendentes de envio.
         Faz a verificação dos ficheiros xmls pendentes e envia-os.
 
+        As faturas pendentes são lidas por páginas (`DB_PAGE_SIZE`) à medida que há envios livres,
+        tanto com um como com vários envios em simultâneo: em memória fica no máximo uma página e
+        as `workers` submissões em curso, e nenhuma sessão fica aberta durante os envios.
+
         Args:
             invoice_id (str | None, optional): O ID da fatura a ser enviada. Defaults to None.
         """
@@ -186,38 +328,60 @@ class SaphetyApiService:
         # Obtém uma sessão da base de dados usando o nosso gestor
         with db.get_db() as session:
             try:
-                # Recupera as faturas pendentes da tabela de controlo
-                pending_invoices = self.control_service.get_pending_invoices(session=session, invoice_number=invoice_id)
+                # Recupera as faturas já enviadas cujo pedido assíncrono ficou por concluir no ciclo anterior
+                in_flight = self.control_service.fetch_in_flight_requests(session=session, invoice_number=invoice_id)
             except Exception:
                 logger.exception('Ocorreu um erro crítico durante o processamento. Fazer rollback...')
                 if 'session' in locals():
                     session.rollback()  # Garante que nenhuma alteração parcial é guardada
                 return
 
-        if not pending_invoices:
+        # As faturas pendentes são lidas por páginas à medida que são enviadas
+        pending_invoices = self._iter_pending_invoices(invoice_id)
+        first_invoice = next(pending_invoices, None)
+
+        if first_invoice is None and not in_flight:
             logger.info('Não há faturas pendentes para enviar.')
             return
 
-        # Obtém um token válido antes de enviar qualquer fatura
-        token = self.auth_service.login(API_USER, API_PASSWORD)
-
-        if not token:
+        # Obtém um token válido antes de enviar qualquer fatura (reutilizado enquanto for válido)
+        if not self.token_provider.get_token():
             logger.error('Falha na autenticação. Não foi possível obter o token.')
             return
 
-        # Processa cada fatura pendente
-        send_results = self._process_invoices(token=token, pending_invoices=pending_invoices)
+        # Processa cada fatura pendente e grava os resultados na tabela de controlo em segundo plano,
+        # em pequenos lotes, à medida que chegam (um erro ou interrupção perde no máximo um lote)
+        with ControlUpdateWriter(flush=self._update_invoices, name='saphety-send-writer') as writer:
+            self._process_invoices(
+                pending_invoices=chain([first_invoice], pending_invoices) if first_invoice else [],
+                in_flight=in_flight,
+                on_result=writer.add,
+            )
+
+        self.transport.circuit_breaker.log_metrics()
+
+    def _iter_pending_invoices(self, invoice_id: str | None) -> Iterator[PendingInvoiceRow]:
+        """
+        Percorre as faturas pendentes de envio, lidas página a página, cada uma numa sessão própria.
 
-        # Atualiza o estado das faturas na tabela de controlo
-        self._update_invoices(send_results=send_results)
+        A página seguinte só é lida quando o envio chega ao fim da anterior (ver `_submit_invoices`).
 
-    def send_message(self, invoice: APIControlView, token: str) -> SaphetyResponse:
+        Um erro na leitura de uma página termina o envio das restantes, que ficam pendentes para o próximo ciclo.
+        """
+        try:
+            pages = self.control_service.iter_pending_invoices(session_factory=db.get_db, invoice_number=invoice_id)
+
+            for page in pages:
+                yield from page
+        except Exception:
+            logger.exception('Erro ao ler as faturas pendentes. As restantes ficam para o próximo envio.')
+
+    def send_message(self, invoice: PendingInvoiceRow) -> SaphetyResponse:
         """
         Este método recebe uma fatura a ser enviada.
 
         Args:
-            invoice (APIControlView): A fatura a ser enviada
-            token (str): O token de autenticação para a API Saphety
+            invoice (PendingInvoiceRow): A fatura a ser enviada
         Returns:
             SaphetyResponse: A resposta da API após o envio da fatura
         """
@@ -226,18 +390,24 @@ class SaphetyApiService:
         xml_file_path = Path(invoice.filename)
 
         try:
-            with open(xml_file_path, 'rb') as xml_file:
-                request_data = xml_file.read()
+            # As faturas entregues pelo envio imediato (InlineInvoice) já trazem o XML em memória
+            request_data = getattr(invoice, 'content', None)
+
+            if request_data is None:
+                with open(xml_file_path, 'rb') as xml_file:
+                    request_data = xml_file.read()
 
             # Monta os dados para envio
             document_type = 'Invoice' if invoice.category == InvoiceType.INVOICE else 'Credit_Note'
             service_url = (
                 f'{self.base_url}/CountryFormatAsyncRequest/processDocument/{invoice.sender}/{document_type}/PT'
             )
-            headers = {'Content-Type': 'application/xml', 'Authorization': f'bearer {token}'}
+            headers = {'Content-Type': 'application/xml'}
 
-            # Requisição POST para enviar o ficheiro XML
-            response = requests.post(service_url, data=request_data, headers=headers, timeout=15)
+            # Requisição POST para enviar o ficheiro XML (com o token de acesso)
+            response = self.transport.authorized_request(
+                'POST', service_url, self.token_provider, data=request_data, headers=headers
+            )
 
             # Levanta uma exceção HTTPError se a resposta for um erro.
             response.raise_for_status()
@@ -254,23 +424,20 @@ class SaphetyApiService:
             logger.error(f'Erro HTTP ao enviar a fatura {invoice.invoiceNumber}: {http_err}')
             return {'CorrelationId': '', 'IsValid': False, 'Errors': [str(http_err)], 'Data': ''}
 
-    def request_status(self, request_id: str, token: str) -> SaphetyResponse:
+    def request_status(self, request_id: str) -> SaphetyResponse:
         """
         Este método consulta o estado do processamento de uma fatura enviada.
 
         Args:
             request_id (str): O ID de correlação retornado pela API ao enviar a fatura
-            token (str): O token de autenticação para a API Saphety
         Returns:
             SaphetyResponse: A resposta da API com o estado do processamento
         """
 
         service_url = f'{self.base_url}/CountryFormatAsyncRequest/{request_id}'
-        headers = {'Authorization': f'bearer {token}'}
-
         try:
-            # Requisição GET para consultar o estado da fatura
-            response = requests.get(service_url, headers=headers, timeout=15)
+            # Requisição GET para consultar o estado da fatura (com o token de acesso)
+            response = self.transport.authorized_request('GET', service_url, self.token_provider)
 
             # Levanta uma exceção HTTPError se a resposta for um erro.
             response.raise_for_status()
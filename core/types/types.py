@@ -1,5 +1,6 @@
 import datetime
-from typing import Any, TypedDict
+from decimal import Decimal
+from typing import Any, NamedTuple, NotRequired, TypedDict
 
 
 class OrderReference(TypedDict):
@@ -14,6 +15,49 @@ class InvoiceXmlData(TypedDict):
     invoice_date: datetime.date
 
 
+class SupplierParty(TypedDict):
+    company: str
+    name: str
+    street: str
+    city: str
+    postal_zone: str
+    country: str
+    vat_number: str
+
+
+class ProjectionProfile(TypedDict, total=False):
+    invoice: list[str]
+    invoice_header: list[str]
+    customer: list[str]
+    business_partner: list[str]
+    invoice_detail: list[str]
+
+
+class TaxSubtotal(TypedDict):
+    category: str | None
+    rate: Decimal
+    taxable_amount: Decimal
+    tax_amount: Decimal
+    rows: int
+    update_changes: int
+    update_datetime: datetime.datetime | None
+
+
+class InvoiceXmlJob(TypedDict):
+    invoice: Any
+    details: list[Any]
+    taxes: list[TaxSubtotal]
+    supplier: SupplierParty
+    keep_content: bool
+
+
+class InvoiceXmlResult(TypedDict):
+    invoice_number: str
+    file_path: str | None
+    error: str | None
+    content: bytes | None
+
+
 class ControlArgs(TypedDict, total=False):
     invoice_number: str
     status: int
@@ -25,6 +69,39 @@ class ControlArgs(TypedDict, total=False):
     notificationStatus: int
     requestId: str
     financialId: str
+    sourceFingerprint: str
+    nextCheckAt: datetime.datetime
+    checkAttempts: int
+
+
+class PendingInvoiceRow(NamedTuple):
+    invoiceNumber: str
+    filename: str
+    category: int
+    sender: str
+
+
+class InFlightRequestRow(NamedTuple):
+    invoiceNumber: str
+    requestId: str
+
+
+class InvoiceCheckRow(NamedTuple):
+    invoiceNumber: str
+    financialId: str
+    status: int
+    sendDate: datetime.date
+    checkAttempts: int
+
+
+class InvoiceStatusRow(NamedTuple):
+    invoiceNumber: str
+    status: int
+    requestStatus: int
+    integrationStatus: int
+    requestId: str
+    financialId: str
+    message: str
 
 
 class SaphetyResponse(TypedDict):
@@ -37,6 +114,28 @@ class SaphetyResponse(TypedDict):
 class SaphetyResult(TypedDict):
     invoice_number: str
     response: SaphetyResponse
+    request_id: NotRequired[str]
+
+
+class CircuitBreakerMetrics(TypedDict):
+    state: str
+    calls: int
+    failures: int
+    slow_calls: int
+    rejected: int
+    opened: int
+    failure_rate: float
+    slow_call_rate: float
+
+
+class SqlRunSummary(TypedDict):
+    name: str
+    elapsed_seconds: float
+    queries: int
+    db_seconds: float
+    slow_queries: int
+    distinct_statements: int
+    top_statements: list[tuple[str, int, float]]
 
 
 class SaphetyIntegrationData(TypedDict, total=False):
@@ -0,0 +1,62 @@
+import threading
+import time
+from typing import Generic, Hashable, Optional, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Cache em memória com tempo de vida (TTL) por entrada.
+
+    As entradas expiram `ttl_seconds` segundos depois de serem guardadas. Um TTL
+    igual ou inferior a zero desativa a cache (nada é guardado). O acesso é protegido
+    por um lock para poder ser partilhada entre threads.
+
+    Args:
+        ttl_seconds: O tempo de vida de cada entrada, em segundos.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[K, tuple[float, V]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def get(self, key: K) -> Optional[V]:
+        """Retorna o valor guardado para a chave, ou None se não existir ou tiver expirado."""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        """Guarda um valor para a chave, substituindo o anterior."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def invalidate(self, key: K) -> None:
+        """Remove a entrada da chave, se existir."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove todas as entradas."""
+        with self._lock:
+            self._entries.clear()
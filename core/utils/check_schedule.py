@@ -0,0 +1,68 @@
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from core.config.settings import DEFAULT_LEGACY_DATE, SAPHETY_CHECK_CUTOFF_DAYS, SAPHETY_CHECK_SCHEDULE
+
+_DURATION = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([smhd])\s*$', re.IGNORECASE)
+_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+class CheckSchedule:
+    """
+    Calendário das verificações do estado de integração de cada documento.
+
+    Depois de cada verificação em que o documento ainda não foi recebido, a seguinte é agendada
+    com a espera correspondente ao número de verificações já feitas (a última espera repete-se),
+    para que os documentos recentes sejam verificados com frequência e os antigos raramente.
+    Passado `cutoff` desde o envio, o documento deixa de ser verificado e passa a revisão manual.
+
+    Args:
+        delays: As esperas depois da 1.ª, 2.ª, ... verificação.
+        cutoff: O tempo máximo de verificação desde o envio. Se None, os documentos são verificados sem limite.
+    """
+
+    def __init__(self, delays: list[timedelta], cutoff: timedelta | None = None):
+        if not delays:
+            raise ValueError('O calendário das verificações precisa de pelo menos uma espera.')
+
+        self.delays = delays
+        self.cutoff = cutoff
+
+    @classmethod
+    def from_settings(cls) -> 'CheckSchedule':
+        """Cria o calendário a partir de `SAPHETY_CHECK_SCHEDULE` e `SAPHETY_CHECK_CUTOFF_DAYS`."""
+        cutoff = timedelta(days=SAPHETY_CHECK_CUTOFF_DAYS) if SAPHETY_CHECK_CUTOFF_DAYS > 0 else None
+        return cls(delays=[cls.parse_duration(value) for value in SAPHETY_CHECK_SCHEDULE], cutoff=cutoff)
+
+    @staticmethod
+    def now() -> datetime:
+        """A data e hora atual (UTC, sem fuso horário), usada para gravar e comparar as datas de verificação."""
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+
+    @staticmethod
+    def parse_duration(value: str) -> timedelta:
+        """Converte uma duração como '90s', '10m', '6h' ou '1d' num timedelta."""
+        match = _DURATION.match(value)
+
+        if match is None:
+            raise ValueError(f"Duração '{value}' inválida. Use um número seguido de s, m, h ou d (ex: '10m').")
+
+        return timedelta(**{_UNITS[match[2].lower()]: float(match[1])})
+
+    def next_check_at(self, attempts: int, now: datetime) -> datetime:
+        """Retorna a data da próxima verificação, depois de `attempts` verificações feitas."""
+        return now + self.delays[min(max(attempts, 1), len(self.delays)) - 1]
+
+    def is_expired(self, sent_at: date | datetime | None, now: datetime) -> bool:
+        """Indica se o documento já ultrapassou o tempo máximo de verificação desde o envio."""
+        if self.cutoff is None or sent_at is None:
+            return False
+
+        if not isinstance(sent_at, datetime):
+            # Documentos sem data de envio registada não expiram
+            if sent_at <= DEFAULT_LEGACY_DATE:
+                return False
+
+            sent_at = datetime.combine(sent_at, datetime.min.time())
+
+        return now - sent_at >= self.cutoff
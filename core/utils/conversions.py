@@ -4,9 +4,12 @@ import hmac
 from datetime import date, datetime
 from decimal import ROUND_HALF_UP, Decimal
 from pathlib import Path
-from typing import Any, Dict, Optional
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, Optional
 
+import sqlalchemy as sa
 from dateutil import parser
+from sqlalchemy.ext.hybrid import HybridExtensionType
 
 from core.config.settings import DEFAULT_LEGACY_DATETIME
 
@@ -181,6 +184,20 @@ class Conversions:
 
         return base_string
 
+    @staticmethod
+    def iter_file_base64(file_path: str | Path, chunk_size: int = 3 * 64 * 1024) -> Iterator[str]:
+        """
+        Lê um ficheiro por partes e devolve o seu conteúdo codificado em base64.
+
+        O tamanho de cada parte é arredondado a um múltiplo de 3 bytes, para que a
+        concatenação das partes seja igual à codificação do ficheiro completo.
+        """
+        chunk_size = max(chunk_size - chunk_size % 3, 3)
+
+        with Path(file_path).open('rb') as file:
+            while chunk := file.read(chunk_size):
+                yield base64.b64encode(chunk).decode('utf-8')
+
     @staticmethod
     def is_number(value):
         try:
@@ -261,3 +278,57 @@ class Conversions:
 
         # .to_eng_string() ensures that the output does not use scientific notation
         return formatted_value.to_eng_string()
+
+    @staticmethod
+    def to_record(instance: Any, _seen: Optional[dict[int, SimpleNamespace]] = None) -> Any:
+        """
+        Copia os atributos já carregados de uma instância ORM para um objeto simples.
+
+        O objeto resultante expõe os mesmos nomes de atributos (colunas, propriedades
+        híbridas como `addressLine` e relacionamentos já carregados), não depende da
+        sessão e pode ser serializado com pickle (ex: para ser enviado a outro processo).
+        Atributos não carregados (ex: excluídos por `load_only`) não são copiados e
+        nenhum relacionamento é carregado durante a cópia.
+
+        Args:
+            instance: A instância ORM a copiar (ou None).
+
+        Returns:
+            Um SimpleNamespace com os valores da instância, ou None.
+        """
+        if instance is None:
+            return None
+
+        seen = _seen if _seen is not None else {}
+
+        if id(instance) in seen:
+            return seen[id(instance)]
+
+        state = sa.inspect(instance)
+        mapper = state.mapper
+        unloaded = state.unloaded
+
+        record = SimpleNamespace()
+        seen[id(instance)] = record
+
+        for column_attr in mapper.column_attrs:
+            if column_attr.key not in unloaded:
+                setattr(record, column_attr.key, getattr(instance, column_attr.key))
+
+        # As propriedades híbridas (listas de colunas X3) são calculadas sobre a cópia
+        for name, descriptor in mapper.all_orm_descriptors.items():
+            if getattr(descriptor, 'extension_type', None) is HybridExtensionType.HYBRID_PROPERTY:
+                setattr(record, name, descriptor.fget(record))
+
+        for relationship in mapper.relationships:
+            if relationship.key in unloaded:
+                continue
+
+            related = getattr(instance, relationship.key)
+
+            if isinstance(related, list):
+                setattr(record, relationship.key, [Conversions.to_record(item, seen) for item in related])
+            else:
+                setattr(record, relationship.key, Conversions.to_record(related, seen))
+
+        return record
@@ -95,6 +95,7 @@ class SaphetyStatus(IntEnum):
     SENT_SUCCESSFULLY = 2
     GENERATION_ERROR = 3
     SENT_ERROR = 4
+    MANUAL_REVIEW = 5
 
 
 class SaphetyIntegrationType(IntEnum):
@@ -0,0 +1,53 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Limitador de ritmo (token bucket) partilhável entre threads.
+
+    São repostos `rate` tokens por segundo, até ao máximo de `capacity`; cada operação
+    consome um token e espera quando não há nenhum disponível. Permite rajadas até
+    `capacity` operações e um ritmo médio de `rate` operações por segundo. Um ritmo
+    igual ou inferior a zero desativa o limite.
+
+    Args:
+        rate: O número de operações permitidas por segundo.
+        capacity: O número máximo de operações seguidas (rajada). Se None, usa o ritmo (mínimo 1).
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = max(capacity if capacity is not None else rate, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self) -> float:
+        """
+        Consome um token, esperando até que haja um disponível.
+
+        Returns:
+            O tempo de espera, em segundos.
+        """
+        if not self.enabled:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            # O token é reservado já (o saldo pode ficar negativo), para que as threads
+            # em espera sejam servidas por ordem de chegada
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
@@ -1,9 +1,10 @@
 import logging
 from pathlib import Path
+from typing import Iterable, Optional
 
 import lxml.etree as etree  # noqa: PLR0402
 
-from core.config.settings import OUTPUT_FOLDER
+from core.config.settings import OUTPUT_FOLDER, ensure_folders
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -34,6 +35,7 @@ class XMLHandler:
         if file_path:
             output_path = file_path
         else:
+            ensure_folders()
             output_path = OUTPUT_FOLDER
 
         output_path /= filename
@@ -42,7 +44,7 @@ class XMLHandler:
 
         try:
             # Converte a árvore para bytes com a formatação desejada
-            xml_bytes = etree.tostring(xml_tree, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+            xml_bytes = XMLHandler.to_bytes(xml_tree)
 
             # Escreve os bytes no ficheiro
             with open(output_path, 'wb') as f:
@@ -56,6 +58,37 @@ class XMLHandler:
             # Relança a exceção para que o processo principal possa fazer rollback
             raise IOError(f'Não foi possível escrever o ficheiro {output_path}: {e}') from e
 
+    @staticmethod
+    def to_bytes(xml_tree: etree._Element) -> bytes:
+        """Serializa uma árvore XML tal como é guardada no ficheiro (UTF-8, com declaração e indentação)."""
+        return etree.tostring(xml_tree, pretty_print=True, xml_declaration=True, encoding='UTF-8')
+
+    @staticmethod
+    def write_element(
+        xf: etree.xmlfile, element: etree._Element, streams: Optional[dict[etree._Element, Iterable[str]]] = None
+    ) -> None:
+        """
+        Escreve um elemento (e os seus filhos) num ficheiro aberto com `etree.xmlfile`.
+
+        Os elementos são escritos um a um, para que os namespaces já declarados nos elementos
+        abertos no ficheiro não sejam repetidos em cada bloco.
+
+        Args:
+            xf: O escritor incremental, dentro do elemento pai.
+            element: O elemento a escrever.
+            streams: Elementos cujo texto é escrito a partir de um iterável de partes
+                (ex: um anexo em base64), em vez do seu atributo `text`.
+        """
+        with xf.element(element.tag, dict(element.attrib)):
+            if streams and element in streams:
+                for chunk in streams[element]:
+                    xf.write(chunk)
+            elif element.text:
+                xf.write(element.text)
+
+            for child in element:
+                XMLHandler.write_element(xf, child, streams)
+
     @staticmethod
     def check_for_xml_files(file_path: Path | None = None, filename: str | None = None) -> list[Path]:
         """
@@ -8,7 +8,7 @@ from core.database.database import db
 from core.database.database_core import DatabaseCoreManager
 from core.mappers.base_mapper import BaseMapper
 from core.models.sales_invoice import SalesInvoice
-from core.types.types import InvoiceXmlData
+from core.types.types import InvoiceXmlData, ProjectionProfile
 from core.utils.conversions import Conversions
 from core.utils.generics import Generics
 from core.utils.local_menus import InvoiceType, NoYes, TaxLevelCode
@@ -23,6 +23,16 @@ class MopMapper(BaseMapper):
     adaptar o mapeamento às necessidades específicas do cliente MOP.
     """
 
+    projection_columns: ProjectionProfile = {
+        'invoice': ['customerReference'],
+        'customer': ['generatePDF'],
+        'invoice_detail': ['itemDescription'],
+    }
+
+    # Pasta de entrada dos PDF, obtida uma única vez por execução (o mapper é criado em cada execução)
+    _pdf_root: Path | None = None
+    _pdf_root_resolved: bool = False
+
     def get_buyer_reference(self, invoice: SalesInvoice) -> str | None:  # noqa: PLR6301
         """
         Retorna a Referência do Cliente (BT-10) a ser usada no XML.
@@ -42,84 +52,126 @@ class MopMapper(BaseMapper):
 
         return None
 
-    def get_additional_document_reference(self, invoice: SalesInvoice) -> dict[str, Any] | None:  # noqa: PLR6301
+    def get_invoice_pdf_path(self, invoice: SalesInvoice) -> Path | None:
         """
-        Retorna a Referência de Documento Adicional (BT-23) a ser usada no XML.
-
-        Para o cliente MOP, este campo deve ser preenchido com o valor
-        do campo "Order Number" da fatura, se disponível.
+        Retorna o caminho do PDF da fatura na pasta de entrada, se o cliente o pedir e o ficheiro existir.
 
         Args:
             invoice: O objeto SalesInvoice principal.
         Returns:
-            Um dicionário com 'schemeID' e 'value', ou None se não aplicável.
+            O caminho (Path object) do PDF, ou None se não aplicável.
         """
 
-        if invoice.customer.generatePDF == NoYes.YES:
-            # match invoice.invoiceType:
-            #     case InvoiceType.INVOICE:
-            #         scheme_id = 'IV'
-            #     case InvoiceType.CREDIT_NOTE:
-            #         scheme_id = 'CD'
-            #     case _:
-            #         scheme_id = 'AIM'
+        if invoice.customer.generatePDF != NoYes.YES:
+            return None
+
+        filename = ''.join(c for c in invoice.invoiceNumber if c.isalnum())
+        filename = f'{invoice.billToCustomer}_{filename}'
+
+        folder = self._get_pdf_root()
+
+        if folder is None:
+            return None
 
-            filename = ''.join(c for c in invoice.invoiceNumber if c.isalnum())
-            filename = f'{invoice.billToCustomer}_{filename}'
+        pdf_folder = Path(
+            f'{folder}/{invoice.company}/{invoice.salesSite}/{invoice.invoiceDate.year}/'
+            f'{invoice.invoiceDate.month}/{invoice.invoiceDate.day}'
+        )
+
+        # Verifica se o ficheiro existe
+        if not pdf_folder.joinpath(f'{filename}.pdf').is_file():
+            return None
 
-            if not PRODUCTION:
-                # Cria uma instância do DatabaseCoreManager
-                db_core = DatabaseCoreManager(db_manager=db)
+        return pdf_folder.joinpath(f'{filename}.pdf')
 
-                # Buscar localização do ficheiro pdf da fatura
-                filters = {'PARAM_0': ('=', 'PDFFLD')}
+    def _get_pdf_root(self) -> Path | None:
+        """
+        Retorna a pasta de entrada dos PDF: `INPUT_PDF_FOLDER` em produção ou, fora de produção, o
+        parâmetro PDFFLD (ADOVAL). O parâmetro é lido só na primeira fatura da execução, e não em cada
+        fatura (o PDF é procurado tanto na impressão digital como na geração do XML).
+        """
+        if self._pdf_root_resolved:
+            return self._pdf_root
+
+        if not PRODUCTION:
+            # Cria uma instância do DatabaseCoreManager
+            db_core = DatabaseCoreManager(db_manager=db)
 
-                result = db_core.execute_query(table='ADOVAL', columns=['VALEUR_0'], where_clauses=filters)
+            # Buscar localização do ficheiro pdf da fatura
+            filters = {'PARAM_0': ('=', 'PDFFLD')}
 
-                if not result and result.get('status') != 'success' and result.get('records', 0) == 0:
-                    return None
+            result = db_core.execute_query(table='ADOVAL', columns=['VALEUR_0'], where_clauses=filters)
 
+            if not result and result.get('status') != 'success' and result.get('records', 0) == 0:
+                folder = None
+            else:
                 data_row = result['data'][0]
                 folder = Path(data_row.get('VALEUR_0').strip().replace('$1$', DATABASE.get('SCHEMA')))
-            else:
-                folder = Path(INPUT_PDF_FOLDER)
+        else:
+            folder = Path(INPUT_PDF_FOLDER)
 
-            pdf_folder = Path(
-                f'{folder}/{invoice.company}/{invoice.salesSite}/{invoice.invoiceDate.year}/'
-                f'{invoice.invoiceDate.month}/{invoice.invoiceDate.day}'
-            )
+        self._pdf_root = folder
+        self._pdf_root_resolved = True
+        return folder
 
-            # Verifica se o ficheiro existe
-            if not pdf_folder.joinpath(f'{filename}.pdf').is_file():
-                return None
+    def get_additional_document_reference(self, invoice: SalesInvoice) -> dict[str, Any] | None:
+        """
+        Retorna a Referência de Documento Adicional (BT-23) a ser usada no XML.
 
-            # Converte o ficheiro para base64
-            pdf_base64 = Conversions.convert_file_to_base64(str(pdf_folder), f'{filename}.pdf')
+        Para o cliente MOP, este campo é preenchido com o PDF da fatura, se existir.
 
-            description = (
-                'INVOICE_REPRESENTATION' if invoice.category == InvoiceType.INVOICE else 'CREDITNOTE_REPRESENTATION'
-            )
+        Args:
+            invoice: O objeto SalesInvoice principal.
+        Returns:
+            Um dicionário com 'schemeID', 'type_code', 'description', 'file_name' e 'pdf_path',
+            ou None se não aplicável.
+        """
 
-            return {
-                'schemeID': 'AIM',
-                'type_code': '130',
-                'description': description,
-                'file_name': f'{filename}.pdf',
-                'pdf_base64': pdf_base64,
-            }
+        # match invoice.invoiceType:
+        #     case InvoiceType.INVOICE:
+        #         scheme_id = 'IV'
+        #     case InvoiceType.CREDIT_NOTE:
+        #         scheme_id = 'CD'
+        #     case _:
+        #         scheme_id = 'AIM'
 
-        return None
+        pdf_path = self.get_invoice_pdf_path(invoice)
+
+        if pdf_path is None:
+            return None
+
+        description = (
+            'INVOICE_REPRESENTATION' if invoice.category == InvoiceType.INVOICE else 'CREDITNOTE_REPRESENTATION'
+        )
+
+        return {
+            'schemeID': 'AIM',
+            'type_code': '130',
+            'description': description,
+            'file_name': pdf_path.name,
+            'pdf_path': str(pdf_path),
+        }
+
+    def get_fingerprint_parts(self, invoice: SalesInvoice) -> list[str]:
+        """Inclui o PDF anexo (caminho, tamanho e data de modificação) na impressão digital da fatura."""
+
+        pdf_path = self.get_invoice_pdf_path(invoice)
 
-    def save_invoice_xml(self, xml_tree: etree._Element, context: InvoiceXmlData) -> Path | None:  # noqa: PLR6301
+        if pdf_path is None:
+            return ['']
+
+        pdf_stat = pdf_path.stat()
+        return [f'{pdf_path}:{pdf_stat.st_size}:{pdf_stat.st_mtime_ns}']
+
+    def get_invoice_xml_path(self, context: InvoiceXmlData) -> Path | None:  # noqa: PLR6301
         """
-        Salva o XML da fatura na pasta de saída usando o XMLHandler.
+        Retorna o caminho do ficheiro XML da fatura na pasta de saída, criando a pasta se necessário.
 
         Args:
-            xml_tree: A árvore de elementos lxml a ser guardada.
             context: Dados adicionais da fatura para determinar o caminho de salvamento.
 
         Returns:
-            O caminho (Path object) para o ficheiro que foi criado.
+            O caminho (Path object) do ficheiro, ou None se a pasta de saída não estiver configurada.
         """
 
         invoice_number = context.get('invoice_number')
@@ -152,10 +204,27 @@ class MopMapper(BaseMapper):
         # Define o nome do ficheiro XML
         filename = ''.join(c for c in invoice_number if c.isalnum()) + '.xml'
 
-        # Salva o XML usando o XMLHandler
-        xml_file = XMLHandler.save_xml_to_file(xml_tree, file_path=xml_folder, filename=filename)
+        return xml_folder / filename
 
-        return xml_file
+    def save_invoice_xml(self, xml_tree: etree._Element, context: InvoiceXmlData) -> Path | None:
+        """
+        Salva o XML da fatura na pasta de saída usando o XMLHandler.
+
+        Args:
+            xml_tree: A árvore de elementos lxml a ser guardada.
+            context: Dados adicionais da fatura para determinar o caminho de salvamento.
+
+        Returns:
+            O caminho (Path object) para o ficheiro que foi criado.
+        """
+
+        xml_file = self.get_invoice_xml_path(context)
+
+        if xml_file is None:
+            return None
+
+        # Salva o XML usando o XMLHandler
+        return XMLHandler.save_xml_to_file(xml_tree, file_path=xml_file.parent, filename=xml_file.name)
 
     def build_invoice_line(self, parent: etree._Element, currency: str, category: int, detail: Any) -> None:  # noqa: PLR6301
         """
@@ -1,26 +1,18 @@
 import argparse
 import logging
 import sys
+from contextlib import nullcontext
 
 from core.config.logging import setup_logging
-from core.services.invoice_processor import InvoiceProcessorService
-from core.services.saphety_integration_service import SaphetyApiIntegrationService
-from core.services.saphety_service import SaphetyApiService
-from core.utils.generics import Generics
+from core.config.settings import SAPHETY_INLINE_SEND
 
+# Os serviços (SQLAlchemy, modelos, lxml, requests) são importados só na ação escolhida,
+# para que a ajuda e os erros de argumentos respondam de imediato e cada ação carregue
+# apenas o que usa (o X3 chama a CLI por fatura).
 
-def main():
-    """
-    Ponto de entrada principal para a execução via linha de comando (CLI).
-    Configura logging, interpreta argumentos e executa a lógica de negócio.
-    """
-
-    # Configura o sistema de logging, tal como no serviço
-    setup_logging()
 
-    main_logger = logging.getLogger(__name__)
-
-    # Configura o parser de argumentos da linha de comando
+def _build_parser() -> argparse.ArgumentParser:
+    """Constrói o parser de argumentos da linha de comando."""
     parser = argparse.ArgumentParser(
         description='Ferramenta de execução sob demanda para o envio de faturas para Saphety.',
         formatter_class=argparse.RawTextHelpFormatter,
@@ -53,6 +45,119 @@ def main():
         '--check INVOICE_ID: Verifica o status de uma fatura específica.',
     )
 
+    # Argumento opcional '--workers'
+    # Número de processos usados na geração dos XML (por omissão, o valor de XML_WORKERS).
+    parser.add_argument(
+        '--workers',
+        type=int,
+        metavar='N',
+        default=None,
+        help='Opcional. Número de processos para gerar os XML (por omissão usa XML_WORKERS).',
+    )
+
+    # Argumento opcional '--send-workers'
+    # Número de faturas enviadas em simultâneo para a API (por omissão, o valor de SAPHETY_SEND_WORKERS).
+    parser.add_argument(
+        '--send-workers',
+        type=int,
+        metavar='N',
+        default=None,
+        help='Opcional. Número de faturas enviadas em simultâneo (por omissão usa SAPHETY_SEND_WORKERS).',
+    )
+
+    # Argumento opcional '--check-workers'
+    # Número de faturas verificadas em simultâneo na API (por omissão, o valor de SAPHETY_CHECK_WORKERS).
+    parser.add_argument(
+        '--check-workers',
+        type=int,
+        metavar='N',
+        default=None,
+        help='Opcional. Número de faturas verificadas em simultâneo (por omissão usa SAPHETY_CHECK_WORKERS).',
+    )
+
+    # Argumento opcional '--inline-send' / '--no-inline-send'
+    # Envia cada XML logo após ser gerado (por omissão, o valor de SAPHETY_INLINE_SEND).
+    parser.add_argument(
+        '--inline-send',
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help='Opcional. Envia cada XML logo após ser gerado (por omissão usa SAPHETY_INLINE_SEND).',
+    )
+
+    return parser
+
+
+def _run_check(args: argparse.Namespace) -> None:
+    """Cenário 1: verifica na Saphety o estado de todas as faturas ou da fatura indicada (--check)."""
+    logger = logging.getLogger(__name__)
+
+    if args.check == 'CHECK_ALL':
+        logger.info('Modo de verificação de status ativado para TODAS as faturas.')
+    else:
+        logger.info(f'Modo de verificação de status ativado para a fatura: {args.check}')
+
+    from core.services.saphety_integration_service import SaphetyApiIntegrationService  # noqa: PLC0415
+
+    integration_service = SaphetyApiIntegrationService(workers=args.check_workers)
+
+    # Supondo que seu método `verify_invoice_status` aceite um ID opcional
+    integration_service.verify_invoice_status(invoice_id=args.check)
+
+
+def _run_process_and_send(args: argparse.Namespace) -> None:
+    """Cenários 2 e 3: gera os XML e envia as faturas pendentes, todas ou só a indicada (--invoice)."""
+    logger = logging.getLogger(__name__)
+
+    if args.invoice:
+        logger.info(f'Modo de processamento e envio para a fatura específica: {args.invoice}')
+    else:
+        logger.info('Modo padrão: processar e enviar todas as faturas pendentes.')
+
+    from core.services.inline_send_pipeline import InlineSendPipeline  # noqa: PLC0415
+    from core.services.invoice_processor import InvoiceProcessorService  # noqa: PLC0415
+    from core.services.saphety_service import SaphetyApiService  # noqa: PLC0415
+    from core.utils.generics import Generics  # noqa: PLC0415
+
+    saphety_service = SaphetyApiService(workers=args.send_workers)
+
+    # Envio imediato dos XML gerados: o argumento prevalece sobre a configuração
+    inline_send = SAPHETY_INLINE_SEND if args.inline_send is None else args.inline_send
+    send_pipeline = InlineSendPipeline(saphety_service) if inline_send else None
+
+    customer_mapper = Generics.get_customer_mapper()
+    processor = InvoiceProcessorService(
+        customer_mapper=customer_mapper, workers=args.workers, send_pipeline=send_pipeline
+    )
+
+    with send_pipeline or nullcontext():
+        processor.process_pending_invoices(invoice_id=args.invoice)
+
+    if args.invoice:
+        logger.info(f'Processamento concluído para a fatura {args.invoice}.')
+    else:
+        logger.info('Processamento de faturas pendentes concluído.')
+
+    saphety_service.send_pending_invoices(invoice_id=args.invoice)
+
+    if args.invoice:
+        logger.info(f'Tentativa de envio concluída para a fatura {args.invoice}.')
+    else:
+        logger.info('Envio de faturas pendentes concluído.')
+
+
+def main():
+    """
+    Ponto de entrada principal para a execução via linha de comando (CLI).
+    Configura logging, interpreta argumentos e executa a lógica de negócio.
+    """
+
+    # Configura o sistema de logging, tal como no serviço
+    setup_logging()
+
+    main_logger = logging.getLogger(__name__)
+
+    # Configura o parser de argumentos da linha de comando
+    parser = _build_parser()
     try:
         args = parser.parse_args()
     except SystemExit as e:
@@ -67,45 +172,12 @@ def main():
         sys.exit(e.code)
 
     try:
-        # Lógica de execução baseada no grupo de ações
-
-        # Cenário 1: Modo de Verificação foi ativado (--check ou --check <ID>)
+        # Lógica de execução baseada no grupo de ações: verificação (--check) ou
+        # processamento e envio (de uma fatura com --invoice, ou de todas as pendentes)
         if args.check is not None:
-            if args.check == 'CHECK_ALL':
-                main_logger.info('Modo de verificação de status ativado para TODAS as faturas.')
-            else:
-                main_logger.info(f'Modo de verificação de status ativado para a fatura: {args.check}')
-
-            integration_service = SaphetyApiIntegrationService()
-
-            # Supondo que seu método `verify_invoice_status` aceite um ID opcional
-            integration_service.verify_invoice_status(invoice_id=args.check)
-
-        # Cenário 2: Modo de Processamento/Envio de fatura única foi ativado
-        elif args.invoice:
-            main_logger.info(f'Modo de processamento e envio para a fatura específica: {args.invoice}')
-
-            customer_mapper = Generics.get_customer_mapper()
-            processor = InvoiceProcessorService(customer_mapper=customer_mapper)
-            processor.process_pending_invoices(invoice_id=args.invoice)
-            main_logger.info(f'Processamento concluído para a fatura {args.invoice}.')
-
-            saphety_service = SaphetyApiService()
-            saphety_service.send_pending_invoices(invoice_id=args.invoice)
-            main_logger.info(f'Tentativa de envio concluída para a fatura {args.invoice}.')
-
-        # Cenário 3: Nenhum argumento foi passado, comportamento padrão
+            _run_check(args)
         else:
-            main_logger.info('Modo padrão: processar e enviar todas as faturas pendentes.')
-
-            customer_mapper = Generics.get_customer_mapper()
-            processor = InvoiceProcessorService(customer_mapper=customer_mapper)
-            processor.process_pending_invoices()
-            main_logger.info('Processamento de faturas pendentes concluído.')
-
-            saphety_service = SaphetyApiService()
-            saphety_service.send_pending_invoices()
-            main_logger.info('Envio de faturas pendentes concluído.')
+            _run_process_and_send(args)
 
         main_logger.info('Execução concluída com sucesso.')
 
@@ -1,18 +1,23 @@
 import logging
+from contextlib import nullcontext
 
 from core.config.logging import setup_logging
-from core.config.settings import SCHEDULING_CHECK_STATUS, SCHEDULING_PROCESS
+from core.config.settings import SAPHETY_INLINE_SEND, SCHEDULING_CHECK_STATUS, SCHEDULING_PROCESS
+from core.database.instrumentation import sql_monitor
 from core.scheduler.scheduler import Scheduler
+from core.services.inline_send_pipeline import InlineSendPipeline
 from core.services.invoice_processor import InvoiceProcessorService
 from core.services.saphety_integration_service import SaphetyApiIntegrationService
 from core.services.saphety_service import SaphetyApiService
 from core.utils.generics import Generics
 
 
+@sql_monitor.run('ProcessSend')
 def job_process():
     """
     Job 1: Define um ciclo de trabalho completo: primeiro processa, depois envia.
     Esta função será chamada pelo scheduler a cada intervalo.
+    No fim, regista o resumo das queries SQL do ciclo.
     """
 
     logger = logging.getLogger(__name__)
@@ -23,11 +28,15 @@ def job_process():
         # Chama o mapper específico para o cliente se for o caso
         customer_mapper = Generics.get_customer_mapper()
 
+        # Com o envio imediato, cada XML gerado é enviado logo, sem esperar pela fase de envio
+        send_pipeline = InlineSendPipeline() if SAPHETY_INLINE_SEND else None
+
         # Cria uma instância do serviço de processamento de faturas
-        processor = InvoiceProcessorService(customer_mapper=customer_mapper)
+        processor = InvoiceProcessorService(customer_mapper=customer_mapper, send_pipeline=send_pipeline)
 
         # Processa as faturas pendentes
-        processor.process_pending_invoices()
+        with send_pipeline or nullcontext():
+            processor.process_pending_invoices()
 
         logger.info('[JOB: ProcessSend] Processamento de faturas pendentes concluído.')
     except Exception:
@@ -39,7 +48,7 @@ def job_process():
         # Cria o serviço de envio de faturas
         saphety_client = SaphetyApiService()
 
-        # Envia as faturas pendentes
+        # Envia as faturas pendentes (com o envio imediato, só as que não foram enviadas na fase anterior)
         saphety_client.send_pending_invoices()
 
         logger.info('[JOB: ProcessSend] Envio de faturas pendentes concluído.')
@@ -47,9 +56,11 @@ def job_process():
         logger.exception('[JOB: ProcessSend] Ocorreu um erro na fase de envio.')
 
 
+@sql_monitor.run('CheckStatus')
 def job_check_status():
     """
     Job 2: Ciclo de verificação de status das faturas já enviadas.
+    No fim, regista o resumo das queries SQL do ciclo.
     """
     logger = logging.getLogger(__name__)
     logger.info('[JOB: CheckStatus] Iniciando ciclo de verificação de status...')
@@ -0,0 +1,21 @@
+-- Coluna SRCHASH_0 da tabela de controlo YSAPHCTL (impressão digital dos dados de origem da fatura).
+--
+-- Obrigatória a partir desta versão: o modelo SaphetyApiControl lê e grava a coluna em todas as
+-- operações da tabela de controlo, mesmo com SKIP_UNCHANGED_INVOICES=False.
+--
+-- No Sage X3, a coluna deve ser criada no dicionário da tabela YSAPHCTL (campo SRCHASH, alfanumérico
+-- de 64) e a tabela revalidada; este script aplica a mesma alteração diretamente na base de dados.
+-- É idempotente. Execução (sqlcmd), com o schema da pasta X3 (DB_SCHEMA):
+--
+--     sqlcmd -S <servidor> -d <base de dados> -v SCHEMA=<schema> -i sql/001_ysaphctl_source_fingerprint.sql
+--
+-- As faturas já existentes ficam com a impressão digital vazia: o XML é gerado de novo na primeira
+-- vez que forem processadas, e a impressão digital passa a ser registada a partir daí.
+
+IF COL_LENGTH(N'$(SCHEMA).YSAPHCTL', N'SRCHASH_0') IS NULL
+BEGIN
+    ALTER TABLE [$(SCHEMA)].[YSAPHCTL]
+        ADD [SRCHASH_0] NVARCHAR(64) COLLATE Latin1_General_BIN2 NOT NULL
+            CONSTRAINT [YSAPHCTL_SRCHASH_0_DF] DEFAULT N'' WITH VALUES;
+END
+GO
@@ -0,0 +1,63 @@
+-- Colunas NXTCHKDAT_0 (próxima verificação) e CHKATT_0 (verificações feitas) do calendário das
+-- verificações do estado de integração, na tabela YSAPHCTL e na vista YVWSAPHCTL.
+--
+-- Obrigatórias a partir desta versão: o envio e a verificação leem e gravam as duas colunas
+-- (SaphetyApiControl e APIControlView). Aplicar depois de 001_ysaphctl_source_fingerprint.sql.
+--
+-- No Sage X3, as colunas devem ser criadas no dicionário da tabela YSAPHCTL (NXTCHKDAT: data e hora;
+-- CHKATT: inteiro longo) e da vista YVWSAPHCTL, e ambas revalidadas; este script aplica a mesma
+-- alteração diretamente na base de dados. É idempotente. Execução (sqlcmd):
+--
+--     sqlcmd -S <servidor> -d <base de dados> -v SCHEMA=<schema> -i sql/002_ysaphctl_check_schedule.sql
+--
+-- Faturas já enviadas: as colunas são criadas com os valores por omissão (WITH VALUES), ou seja
+-- NXTCHKDAT_0 = 1753-01-01 (a data vazia do X3) e CHKATT_0 = 0. Como 1753-01-01 é sempre anterior
+-- à data atual, todas as faturas por confirmar são verificadas no primeiro ciclo de verificação e,
+-- a partir daí, seguem o calendário SAPHETY_CHECK_SCHEDULE. O passo 2 corrige as linhas que a
+-- coluna tenha recebido com outro valor (ex: criada antes pelo dicionário do X3 com NULL).
+
+-- 1. Tabela de controlo
+IF COL_LENGTH(N'$(SCHEMA).YSAPHCTL', N'NXTCHKDAT_0') IS NULL
+BEGIN
+    ALTER TABLE [$(SCHEMA)].[YSAPHCTL]
+        ADD [NXTCHKDAT_0] DATETIME NOT NULL
+            CONSTRAINT [YSAPHCTL_NXTCHKDAT_0_DF] DEFAULT '17530101' WITH VALUES;
+END
+GO
+
+IF COL_LENGTH(N'$(SCHEMA).YSAPHCTL', N'CHKATT_0') IS NULL
+BEGIN
+    ALTER TABLE [$(SCHEMA)].[YSAPHCTL]
+        ADD [CHKATT_0] INT NOT NULL
+            CONSTRAINT [YSAPHCTL_CHKATT_0_DF] DEFAULT 0 WITH VALUES;
+END
+GO
+
+-- 2. Faturas enviadas por confirmar: ficam para verificar no próximo ciclo
+UPDATE [$(SCHEMA)].[YSAPHCTL]
+SET [NXTCHKDAT_0] = '17530101', [CHKATT_0] = 0
+WHERE [NXTCHKDAT_0] IS NULL OR [CHKATT_0] IS NULL;
+GO
+
+-- 3. Vista YVWSAPHCTL: acrescentar as duas colunas da tabela de controlo à lista do SELECT.
+--
+-- A definição da vista é própria de cada instalação (junções com as faturas do X3) e não faz parte
+-- desta aplicação, pelo que não pode ser recriada aqui. Obtenha a definição atual com
+--
+--     EXEC sp_helptext N'$(SCHEMA).YVWSAPHCTL';
+--
+-- e volte a criá-la com ALTER VIEW, acrescentando ao SELECT, a seguir a OUTFINID_0, as colunas da
+-- tabela YSAPHCTL (com o alias usado na vista para YSAPHCTL, aqui <ctl>):
+--
+--     <ctl>.NXTCHKDAT_0,
+--     <ctl>.CHKATT_0,
+--
+-- Nas faturas ainda sem linha na tabela de controlo (junção externa), use os valores por omissão:
+--
+--     ISNULL(<ctl>.NXTCHKDAT_0, '17530101') AS NXTCHKDAT_0,
+--     ISNULL(<ctl>.CHKATT_0, 0) AS CHKATT_0,
+
+-- 4. Verificação: falha se a vista ainda não expõe as novas colunas
+IF COL_LENGTH(N'$(SCHEMA).YVWSAPHCTL', N'NXTCHKDAT_0') IS NULL OR COL_LENGTH(N'$(SCHEMA).YVWSAPHCTL', N'CHKATT_0') IS NULL
+    RAISERROR(N'A vista %s.YVWSAPHCTL ainda não tem as colunas NXTCHKDAT_0 e CHKATT_0 (ver o passo 3).', 16, 1, N'$(SCHEMA)');
+GO